@@ -1,4 +1,4 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context, url_for
 import pandas as pd
 import math
 import calendar
@@ -8,9 +8,16 @@ from pathlib import Path
 from openai import OpenAI
 import json, re
 import numpy as np
-from typing import Set
+from typing import Optional, Set
 import io
 import requests
+import time
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 
 app = Flask(__name__)
 
@@ -19,6 +26,70 @@ facilities_data = None
 provider_info_data = None
 deficiencies_data = None
 
+# How the current frames were loaded ('csv' or 'snapshot') and how long it took
+data_load_stats = {}
+
+# Typed binary snapshot of the three finished frames (Arrow IPC / Feather), written after a
+# successful CSV load and reused on later boots while the source files are unchanged.
+# Set ATHENA_DATA_SNAPSHOT=0 to always parse the CSVs.
+SNAPSHOT_DIR = os.getenv('ATHENA_SNAPSHOT_DIR', '.data_snapshot')
+SNAPSHOT_FORMAT_VERSION = 4
+SNAPSHOT_FRAMES = ('facilities', 'provider_info', 'deficiencies')
+# Size, mtime and sha256 of each source file as last hashed (from the snapshot manifest or current_source_fingerprint)
+source_fingerprint = {}
+
+# Canonical 6-digit CCN (leading zeros stripped then re-padded) materialized on all three frames at load
+CCN_KEY = 'CCN_NORM'
+CCN_COLUMN_CANDIDATES = ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']
+
+# Survey dates parsed once at load (datetime64) plus a precomputed mask for the 2016-2027 timeline window
+SURVEY_DATE_COLUMNS = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
+SURVEY_DATE_KEY = 'SURVEY_DATE'
+IN_TIMELINE_KEY = 'IN_TIMELINE'
+TIMELINE_START = pd.Timestamp('2016-01-01')
+TIMELINE_END = pd.Timestamp('2027-12-31')
+
+# First five digits of the ZIP code ('' when missing), materialized on every frame that has a ZIP column
+ZIP_KEY = 'ZIP5'
+ZIP_COLUMN_CANDIDATES = ['ZIP Code', 'Zip', 'ZIP', 'zip_code', 'zip']
+
+# Columns added at load time; kept out of responses that echo the source columns
+DERIVED_COLUMNS = (CCN_KEY, SURVEY_DATE_KEY, IN_TIMELINE_KEY, ZIP_KEY)
+
+# CCN_KEY -> row positions in each frame, rebuilt after every load (see build_ccn_index)
+ccn_index = {}
+
+# Two-letter state code -> ready-to-serve /api/facilities rows (see build_facility_directory)
+facility_directory = {}
+# Two-letter state code -> {CCN_KEY: unique_id of the first directory row with that CCN}
+facility_directory_ccns = {}
+
+# Year x month counts of deduplicated (CCN, survey date) events per state, county and ZIP (see build_survey_histogram_cube)
+HISTOGRAM_FIRST_YEAR = TIMELINE_START.year
+HISTOGRAM_YEARS = TIMELINE_END.year - TIMELINE_START.year + 1
+COUNTY_COLUMN_CANDIDATES = ['County/Parish', 'County', 'County Name', 'county_name']
+histogram_cube = {}
+
+# Deficiency rows counted per category and survey year, cumulative over years, per state, county and ZIP
+# (see build_deficiency_category_cube)
+CATEGORY_COLUMN_CANDIDATES = ['Deficiency Category', 'Category', 'category']
+category_cube = {}
+
+# Two-letter state code -> row positions of that state's facilities and of the provider/deficiency
+# rows joined to them by CCN, plus the state's CCN set (see build_state_partitions)
+state_partitions = {}
+FACILITY_STATE_COLUMNS = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
+
+# LRU cache of finished JSON responses for endpoints whose output only changes when the data is reloaded
+# (see cached_response); bounded by ATHENA_RESPONSE_CACHE_MB of response bodies
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('ATHENA_RESPONSE_CACHE_MB', '64')) * 1024 * 1024
+response_cache = OrderedDict()
+response_cache_stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0, 'bytes': 0}
+response_cache_lock = threading.Lock()
+
+# Threads /api/facility-bundle uses to compute its sections concurrently (1 = one after another)
+BUNDLE_WORKERS = int(os.getenv('ATHENA_BUNDLE_WORKERS', '4'))
+
 def download_data_file_if_missing():
     """Download required data files if they don't exist (for deployment)"""
     PROVIDER_DATASET_ID = "4pq5-n9py"
@@ -70,13 +141,203 @@ def download_data_file_if_missing():
             except Exception as e:
                 print(f"⚠ Warning: Failed to download health_deficiencies.csv: {e}")
 
-def load_facilities_data():
+
+# --- Data snapshot ---
+def snapshot_enabled() -> bool:
+    return os.getenv('ATHENA_DATA_SNAPSHOT', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def get_data_source_files():
+    """Source files that feed load_facilities_data, in the same order of preference as the loader."""
+    sources = []
+    if os.path.exists('SurveySummaryAll.csv'):
+        sources.append('SurveySummaryAll.csv')
+    elif os.path.exists('SurveySummaryAll.xlsx'):
+        sources.append('SurveySummaryAll.xlsx')
+    if os.path.exists('provider_info.csv'):
+        sources.append('provider_info.csv')
+    part_files = sorted(glob.glob('health_deficiencies_part*.csv'))
+    if part_files:
+        sources.extend(part_files)
+    elif os.path.exists('health_deficiencies.csv'):
+        sources.append('health_deficiencies.csv')
+    elif os.path.exists('health_deficiencies.xlsx'):
+        sources.append('health_deficiencies.xlsx')
+    return sources
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compute_source_fingerprint(paths, with_hash=True):
+    """Map each source file to its size, mtime and (optionally) sha256."""
+    fingerprint = {}
+    for path in paths:
+        st = os.stat(path)
+        entry = {'size': st.st_size, 'mtime': st.st_mtime}
+        if with_hash:
+            entry['sha256'] = _file_sha256(path)
+        fingerprint[path] = entry
+    return fingerprint
+
+
+def current_source_fingerprint() -> dict:
+    """compute_source_fingerprint with hashes, re-hashing only files whose size or mtime moved since last recorded."""
+    global source_fingerprint
+    fingerprint = compute_source_fingerprint(get_data_source_files(), with_hash=False)
+    for path, entry in fingerprint.items():
+        known = source_fingerprint.get(path) or {}
+        same_file = known.get('size') == entry['size'] and known.get('mtime') == entry['mtime']
+        entry['sha256'] = known['sha256'] if same_file and known.get('sha256') else _file_sha256(path)
+    source_fingerprint = fingerprint
+    return fingerprint
+
+
+def snapshot_matches_sources(manifest) -> bool:
+    """A snapshot is valid when the same source files exist with the same size, and either the
+    same mtime or (when the mtime moved, e.g. after a fresh checkout) the same content hash.
+
+    A hash match records the new mtime in the manifest's entry, so the caller can persist it and
+    later boots are back to a stat-only check.
+    """
+    recorded = manifest.get('sources') or {}
+    current = get_data_source_files()
+    if not current or sorted(current) != sorted(recorded):
+        return False
+    for path in current:
+        st = os.stat(path)
+        entry = recorded[path]
+        if st.st_size != entry.get('size'):
+            return False
+        if st.st_mtime != entry.get('mtime'):
+            if _file_sha256(path) != entry.get('sha256'):
+                return False
+            entry['mtime'] = st.st_mtime
+    return True
+
+
+def write_snapshot_manifest(manifest):
+    """Atomically replace the snapshot's manifest.json."""
+    tmp_manifest = os.path.join(SNAPSHOT_DIR, f'manifest.json.{os.getpid()}.tmp')
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, os.path.join(SNAPSHOT_DIR, 'manifest.json'))
+
+
+def _restore_snapshot_frame(df):
+    # Arrow stores missing strings as null, which pandas reads back as None; the CSV loader
+    # produces NaN (and pd.NA for the CCN key), so restore those to keep downstream checks identical.
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    ccn_col = 'CMS Certification Number (CCN)'
+    if ccn_col in df.columns and df[ccn_col].dtype == object:
+        df[ccn_col] = df[ccn_col].where(df[ccn_col].notna(), pd.NA)
+    return df
+
+
+def load_data_snapshot():
+    """Return (facilities, provider_info, deficiencies) from the snapshot, or None if it is missing or stale."""
+    global source_fingerprint
+    manifest_path = os.path.join(SNAPSHOT_DIR, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            print("Data snapshot format changed - rebuilding from CSV")
+            return None
+        recorded_mtimes = {path: entry.get('mtime') for path, entry in (manifest.get('sources') or {}).items()}
+        if not snapshot_matches_sources(manifest):
+            print("Data snapshot is stale (source files changed) - rebuilding from CSV")
+            return None
+        if any(entry.get('mtime') != recorded_mtimes[path] for path, entry in manifest['sources'].items()):
+            # Content unchanged but touched (fresh checkout/deploy): record the new mtimes so later boots skip hashing
+            try:
+                write_snapshot_manifest(manifest)
+            except OSError as e:
+                print(f"Warning: Failed to refresh data snapshot manifest: {e}")
+        source_fingerprint = {path: dict(entry) for path, entry in manifest['sources'].items()}
+        frames = []
+        for name in SNAPSHOT_FRAMES:
+            if name not in manifest.get('frames', []):
+                frames.append(None)
+                continue
+            frames.append(_restore_snapshot_frame(pd.read_feather(os.path.join(SNAPSHOT_DIR, f'{name}.feather'))))
+        data_load_stats['csv_load_seconds'] = manifest.get('csv_load_seconds')
+        return tuple(frames)
+    except Exception as e:
+        print(f"Warning: Failed to read data snapshot, falling back to CSV: {e}")
+        return None
+
+
+def write_data_snapshot(csv_load_seconds: float):
+    """Persist the loaded frames as Feather files plus a manifest of the source fingerprints."""
+    frames = {'facilities': facilities_data, 'provider_info': provider_info_data, 'deficiencies': deficiencies_data}
+    # Only snapshot a complete load; otherwise a transient read failure would be cached across boots
+    sources = get_data_source_files()
+    if facilities_data is None:
+        return
+    if provider_info_data is None and 'provider_info.csv' in sources:
+        return
+    if deficiencies_data is None and any(s.startswith('health_deficiencies') for s in sources):
+        return
+    try:
+        import pyarrow  # noqa: F401  (required by DataFrame.to_feather)
+    except ImportError:
+        print("pyarrow not installed - skipping data snapshot")
+        return
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        written = []
+        for name, df in frames.items():
+            if df is None:
+                continue
+            # Write to a per-process temp name and rename, so concurrent workers never read a partial file
+            tmp_path = os.path.join(SNAPSHOT_DIR, f'{name}.feather.{os.getpid()}.tmp')
+            df.reset_index(drop=True).to_feather(tmp_path)
+            os.replace(tmp_path, os.path.join(SNAPSHOT_DIR, f'{name}.feather'))
+            written.append(name)
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'frames': written,
+            'sources': current_source_fingerprint(),
+            'csv_load_seconds': round(csv_load_seconds, 3),
+            'written_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+        }
+        write_snapshot_manifest(manifest)
+        print(f"✓ Wrote data snapshot ({', '.join(written)}) to {SNAPSHOT_DIR}/")
+    except Exception as e:
+        print(f"Warning: Failed to write data snapshot: {e}")
+
+
+def load_facilities_data(use_snapshot=True):
     """Load facilities data from Excel file and convert to CSV if needed"""
     global facilities_data, provider_info_data, deficiencies_data
-    
+
     # Download data files if missing (for deployment)
     download_data_file_if_missing()
-    
+
+    load_started = time.perf_counter()
+    if use_snapshot and snapshot_enabled():
+        snapshot = load_data_snapshot()
+        if snapshot is not None:
+            facilities_data, provider_info_data, deficiencies_data = snapshot
+            build_lookup_indexes()
+            elapsed = time.perf_counter() - load_started
+            data_load_stats.update({'source': 'snapshot', 'load_seconds': round(elapsed, 3)})
+            csv_seconds = data_load_stats.get('csv_load_seconds')
+            if csv_seconds:
+                print(f"✓ Loaded data snapshot in {elapsed:.2f}s (CSV load took {csv_seconds:.2f}s, {csv_seconds / max(elapsed, 1e-6):.1f}x faster)")
+            else:
+                print(f"✓ Loaded data snapshot in {elapsed:.2f}s")
+            return facilities_data
+
     excel_file = "SurveySummaryAll.xlsx"
     csv_file = "SurveySummaryAll.csv"
     
@@ -440,6 +701,17 @@ def load_facilities_data():
             else:
                 print(f"Warning: No health_deficiencies CSV or Excel files found. Histograms and deficiency features will not be available.")
                 deficiencies_data = None
+
+            add_canonical_ccn_columns()
+            add_parsed_survey_dates()
+            add_zip5_columns()
+            build_lookup_indexes()
+
+            elapsed = time.perf_counter() - load_started
+            data_load_stats.update({'source': 'csv', 'load_seconds': round(elapsed, 3), 'csv_load_seconds': round(elapsed, 3)})
+            print(f"Loaded data from CSV in {elapsed:.2f}s")
+            if use_snapshot and snapshot_enabled():
+                write_data_snapshot(elapsed)
             return facilities_data
         except Exception as e:
             print(f"Error loading CSV: {e}")
@@ -467,6 +739,633 @@ def find_column_flexible(df, possible_names, case_sensitive=False):
                 return df_cols_lower[name.lower()]
     return None
 
+def column_values(df, possible_names, default):
+    """Values of the first of possible_names present in df, else default repeated (the vectorized row.get(a, row.get(b, default)))."""
+    col = next((c for c in possible_names if c in df.columns), None)
+    return df[col].tolist() if col is not None else [default] * len(df)
+
+_MISSING_CCN_STRINGS = ('', 'nan', 'none', 'n/a', '<na>')
+
+def normalize_ccn_value(value):
+    """Canonical 6-digit CCN string for a single value, or None if missing."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    s = str(value).strip()
+    if s.lower() in _MISSING_CCN_STRINGS:
+        return None
+    return s.lstrip('0').zfill(6)
+
+def normalize_ccn_series(series):
+    """Vectorized normalize_ccn_value; missing CCNs become NaN."""
+    s = series.astype(str).str.strip()
+    valid = series.notna() & ~s.str.lower().isin(_MISSING_CCN_STRINGS)
+    return s.str.lstrip('0').str.zfill(6).where(valid)
+
+def add_canonical_ccn_columns():
+    """Materialize CCN_KEY on facilities, provider_info and deficiencies so endpoints never re-normalize per request."""
+    for name, df in (('facilities', facilities_data), ('provider_info', provider_info_data), ('deficiencies', deficiencies_data)):
+        if df is None:
+            continue
+        ccn_col = next((c for c in CCN_COLUMN_CANDIDATES if c in df.columns), None)
+        if ccn_col is None:
+            df[CCN_KEY] = pd.Series(np.nan, index=df.index, dtype=object)
+            print(f"Warning: No CCN column in {name} data; {CCN_KEY} left empty")
+            continue
+        df[CCN_KEY] = normalize_ccn_series(df[ccn_col])
+        print(f"Added {CCN_KEY} to {name} data ({df[CCN_KEY].notna().sum()} of {len(df)} rows have a CCN)")
+
+_NO_ROWS = np.empty(0, dtype=np.intp)
+
+_SURVEY_DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%Y/%m/%d', '%m-%d-%Y']
+
+def parse_survey_date_series(series):
+    """Parse a survey-date column in one pass: each known format vectorized, then pandas inference for the rest."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    text = series.astype(str).str.strip().to_numpy()
+    parsed = np.full(len(series), np.datetime64('NaT'), dtype='datetime64[ns]')
+    remaining = (series.notna() & ~series.astype(str).str.strip().str.lower().isin(['', 'nan', 'none', 'nat'])).to_numpy()
+    for fmt in _SURVEY_DATE_FORMATS + ['mixed']:
+        if not remaining.any():
+            break
+        attempt = pd.to_datetime(pd.Series(text[remaining]), format=fmt, errors='coerce').to_numpy(dtype='datetime64[ns]')
+        hit = ~np.isnat(attempt)
+        positions = np.flatnonzero(remaining)[hit]
+        parsed[positions] = attempt[hit]
+        remaining[positions] = False
+    return pd.Series(parsed, index=series.index)
+
+def add_parsed_survey_dates():
+    """Materialize SURVEY_DATE_KEY / IN_TIMELINE_KEY on the facilities and deficiencies frames."""
+    for name, df in (('facilities', facilities_data), ('deficiencies', deficiencies_data)):
+        if df is None:
+            continue
+        date_col = next((c for c in SURVEY_DATE_COLUMNS if c in df.columns), None)
+        if date_col is None:
+            df[SURVEY_DATE_KEY] = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+            df[IN_TIMELINE_KEY] = False
+            print(f"Warning: No survey date column in {name} data; {SURVEY_DATE_KEY} left empty")
+            continue
+        df[SURVEY_DATE_KEY] = parse_survey_date_series(df[date_col])
+        df[IN_TIMELINE_KEY] = (df[SURVEY_DATE_KEY] >= TIMELINE_START) & (df[SURVEY_DATE_KEY] <= TIMELINE_END)
+        print(f"Parsed '{date_col}' in {name} data ({df[SURVEY_DATE_KEY].notna().sum()} dates, {int(df[IN_TIMELINE_KEY].sum())} in timeline window)")
+
+def add_zip5_columns():
+    """Materialize ZIP_KEY on each frame with a ZIP column, so ZIP filters compare strings instead of re-parsing per request."""
+    for name, df in _loaded_frames().items():
+        if df is None:
+            continue
+        zip_col = next((c for c in ZIP_COLUMN_CANDIDATES if c in df.columns), None)
+        if zip_col is None:
+            continue
+        df[ZIP_KEY] = df[zip_col].astype(str).str.replace(r'\D', '', regex=True).str.slice(0, 5)
+        print(f"Derived {ZIP_KEY} from '{zip_col}' in {name} data")
+
+def _loaded_frames():
+    return {'facilities': facilities_data, 'provider_info': provider_info_data, 'deficiencies': deficiencies_data}
+
+def build_ccn_index():
+    """Hash each frame's CCN_KEY to its integer row positions so per-facility lookups skip the full-column scan."""
+    global ccn_index
+    started = time.perf_counter()
+    index = {}
+    for name, df in _loaded_frames().items():
+        if df is None or CCN_KEY not in df.columns:
+            index[name] = {}
+            continue
+        index[name] = df.groupby(CCN_KEY, sort=False).indices
+    ccn_index = index
+    sizes = ', '.join(f"{name}: {len(positions)}" for name, positions in index.items())
+    print(f"Built CCN index in {time.perf_counter() - started:.2f}s ({sizes} CCNs)")
+
+def build_state_partitions():
+    """Split every frame by facility state once so state-scoped requests only ever slice their own rows."""
+    global state_partitions
+    started = time.perf_counter()
+    partitions = {}
+    state_col = next((c for c in FACILITY_STATE_COLUMNS if c in facilities_data.columns), None) if facilities_data is not None else None
+    if state_col is None:
+        state_partitions = partitions
+        print("Warning: No state column in facilities data; state partitions not built")
+        return
+    # Same key the endpoints compare normalize_state_input() against
+    state_keys = facilities_data[state_col].astype(str).str.strip().str.upper()
+    for code, positions in state_keys.groupby(state_keys, sort=False).indices.items():
+        ccns = frozenset(facilities_data[CCN_KEY].iloc[positions].dropna())
+        part = {'facilities': positions, 'ccns': ccns}
+        for name in ('provider_info', 'deficiencies'):
+            df = _loaded_frames()[name]
+            if df is None:
+                part[name] = _NO_ROWS
+            else:
+                part[name] = np.flatnonzero(df[CCN_KEY].isin(ccns).to_numpy())
+        partitions[code] = part
+    state_partitions = partitions
+    print(f"Built state partitions for {len(partitions)} states in {time.perf_counter() - started:.2f}s")
+
+FACILITY_NAME_COLUMNS = ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']
+
+# Facility fields filled from provider_info when the survey row lacks them: response key -> provider columns to try
+PROVIDER_ENRICHMENT_FIELDS = {
+    'County/Parish': ['County/Parish', 'County', 'county', 'COUNTY', 'County Name', 'county_name'],
+    'Overall Rating': ['Overall Rating', 'Overall_Rating', 'overall_rating', 'Rating'],
+    'Number of Certified Beds': ['Number of Certified Beds'],
+    'Average Number of Residents per Day': ['Average Number of Residents per Day'],
+    'Health Inspection Rating': ['Health Inspection Rating'],
+    'Staffing Rating': ['Staffing Rating'],
+}
+
+def _first_non_null(df, columns):
+    """Row-wise first non-null value across the given columns (None where all are null)."""
+    present = [c for c in columns if c in df.columns]
+    if not present:
+        return pd.Series(None, index=df.index, dtype=object)
+    return df[present].bfill(axis=1).iloc[:, 0]
+
+def _facility_response_columns(df):
+    """Stringify facility columns the way /api/facilities returns them: CCNs stripped, 'nan'/'None'/'' -> None."""
+    out = {}
+    for col in df.columns:
+        if col in DERIVED_COLUMNS:
+            continue
+        values = df[col]
+        text = values.astype(str)
+        if 'ccn' in col.lower() or 'certification' in col.lower():
+            out[col] = text.str.strip().where(values.notna(), None)
+        else:
+            out[col] = text.where(values.notna() & ~text.str.lower().isin(['nan', 'none', '']), None)
+    return pd.DataFrame(out, index=df.index)
+
+def _match_missing_ccns_by_name(served, names, states):
+    """Fill CCNs still missing after load from provider_info by name + state: exact, then contains, then fuzzy reverse contains."""
+    if provider_info_data is None or not {'Provider Name', 'State', 'CMS Certification Number (CCN)'} <= set(provider_info_data.columns):
+        return
+    missing = served[CCN_KEY].isna() & (names != '') & (states != '')
+    if not missing.any():
+        return
+    prov_names = provider_info_data['Provider Name'].astype(str).str.strip().str.upper()
+    prov_states = provider_info_data['State'].astype(str).str.strip().str.upper()
+    matched = 0
+    for idx in served.index[missing]:
+        name_upper, state_upper = names[idx].upper(), states[idx]
+        in_state = prov_states == state_upper
+        candidates = provider_info_data[in_state & (prov_names == name_upper)]
+        if candidates.empty:
+            candidates = provider_info_data[in_state & prov_names.str.contains(name_upper, na=False, regex=False)]
+        if candidates.empty:
+            for pos in np.flatnonzero(in_state.to_numpy()):
+                prov_name_upper = prov_names.iat[pos]
+                if (prov_name_upper in name_upper or name_upper in prov_name_upper) and abs(len(prov_name_upper) - len(name_upper)) <= 10:
+                    candidates = provider_info_data.iloc[[pos]]
+                    break
+        if not candidates.empty:
+            ccn = str(candidates.iloc[0]['CMS Certification Number (CCN)']).strip()
+            served.at[idx, 'CMS Certification Number (CCN)'] = ccn
+            served.at[idx, CCN_KEY] = normalize_ccn_value(ccn)
+            matched += 1
+    print(f"Matched {matched} of {int(missing.sum())} facilities without a CCN to provider_info by name")
+
+def build_facility_directory():
+    """Precompute the /api/facilities payload per state: one row per facility name, enriched from provider_info by a left join."""
+    global facility_directory, facility_directory_ccns
+    started = time.perf_counter()
+    directory = {}
+    directory_ccns = {}
+    if facilities_data is None or not state_partitions:
+        facility_directory, facility_directory_ccns = directory, directory_ccns
+        return
+    state_col = next(c for c in FACILITY_STATE_COLUMNS if c in facilities_data.columns)
+
+    # First row per (state, facility name), in the same order the state partition returns them
+    all_names = _first_non_null(facilities_data, FACILITY_NAME_COLUMNS)
+    all_names = all_names.where(all_names.isna(), all_names.astype(str).str.strip()).fillna('')
+    kept = []
+    for code, part in state_partitions.items():
+        names = all_names.iloc[part['facilities']]
+        keep = (names != '') & ~names.duplicated()
+        kept.append((code, part['facilities'][keep.to_numpy()]))
+    positions = np.concatenate([p for _, p in kept]) if kept else _NO_ROWS
+    rows = facilities_data.iloc[positions].reset_index(drop=True)
+    served = _facility_response_columns(rows)
+    served[CCN_KEY] = rows[CCN_KEY]
+    _match_missing_ccns_by_name(served, all_names.iloc[positions].reset_index(drop=True),
+                                rows[state_col].astype(str).str.strip().str.upper())
+
+    # lat/lng and the rating/size fields come from provider_info (first row per CCN), only where missing
+    for key in ['lat', 'lng'] + list(PROVIDER_ENRICHMENT_FIELDS):
+        if key not in served.columns:
+            served[key] = None
+    if provider_info_data is not None and ccn_index.get('provider_info'):
+        first_rows = {ccn: pos[0] for ccn, pos in ccn_index['provider_info'].items()}
+        prov_pos = served[CCN_KEY].map(first_rows)
+        has_prov = prov_pos.notna().to_numpy()
+        prov = provider_info_data.iloc[prov_pos[has_prov].astype(int).to_numpy()]
+        prov.index = served.index[has_prov]
+        lat_col = next((c for c in ['lat', 'latitude', 'Latitude', 'LAT', 'LATITUDE'] if c in prov.columns), None)
+        lng_col = next((c for c in ['lng', 'longitude', 'Longitude', 'LNG', 'LONGITUDE', 'lon', 'LON'] if c in prov.columns), None)
+        if lat_col and lng_col:
+            lat = pd.to_numeric(prov[lat_col], errors='coerce')
+            lng = pd.to_numeric(prov[lng_col], errors='coerce')
+            fill = (served.loc[prov.index, 'lat'].isna() | served.loc[prov.index, 'lng'].isna()) & lat.notna() & lng.notna()
+            served.loc[fill[fill].index, 'lat'] = lat[fill].astype(object)
+            served.loc[fill[fill].index, 'lng'] = lng[fill].astype(object)
+        for key, candidates in PROVIDER_ENRICHMENT_FIELDS.items():
+            src = next((c for c in candidates if c in prov.columns), None)
+            if src is None:
+                continue
+            fill = served.loc[prov.index, key].isna() & prov[src].notna()
+            served.loc[fill[fill].index, key] = prov.loc[fill, src].astype(str)
+    served_ccns = served[CCN_KEY].tolist()
+    served = served.drop(columns=[CCN_KEY]).astype(object)
+    served = served.where(served.notna(), None)
+
+    start = 0
+    for code, part_positions in kept:
+        stop = start + len(part_positions)
+        state_rows_served = served.iloc[start:stop].reset_index(drop=True)
+        state_rows_served['unique_id'] = np.arange(len(state_rows_served))
+        directory[code] = state_rows_served
+        first_ids = {}
+        for unique_id, ccn in enumerate(served_ccns[start:stop]):
+            if isinstance(ccn, str):
+                first_ids.setdefault(ccn, unique_id)
+        directory_ccns[code] = first_ids
+        start = stop
+    facility_directory, facility_directory_ccns = directory, directory_ccns
+    print(f"Built facility directory ({len(served)} facilities) in {time.perf_counter() - started:.2f}s")
+
+def normalize_county_name(s: str) -> str:
+    """Lowercase, trimmed county name without a trailing 'County'/'Parish'."""
+    s = str(s).strip().lower()
+    for suf in [' county', ' parish']:
+        if s.endswith(suf):
+            s = s[: -len(suf)].strip()
+    return s
+
+def normalize_county_series(values: pd.Series) -> pd.Series:
+    """Vectorized normalize_county_name; missing values become ''."""
+    out = values[values.notna()].astype(str).str.strip().str.lower()
+    for suf in [' county', ' parish']:
+        out = out.str.replace(f'{suf}$', '', regex=True).str.strip()
+    return out.reindex(values.index, fill_value='')
+
+def build_survey_histogram_cube():
+    """Pre-aggregate the Section 4 histograms.
+
+    Unique (CCN, survey date) deficiency events inside the timeline window are counted into a year x month array per
+    CCN, then summed per state (the state partition's CCNs), per (state, normalized county) and per (state, ZIP5).
+    County and ZIP groups are built from provider_info and from facilities separately, in the order the histogram
+    endpoints consult them, so a lookup takes the first source that knows the group.
+    """
+    global histogram_cube
+    started = time.perf_counter()
+    cube = {'state': {}, 'county': [], 'zip': [], 'ccn': {}}
+    if deficiencies_data is None or not state_partitions:
+        histogram_cube = cube
+        return
+    events = deficiencies_data.loc[deficiencies_data[IN_TIMELINE_KEY], [CCN_KEY, SURVEY_DATE_KEY]].dropna()
+    events = events.drop_duplicates()
+    ccn_codes, ccns = pd.factorize(events[CCN_KEY])
+    per_ccn = np.zeros((len(ccns), HISTOGRAM_YEARS, 12), dtype=np.int32)
+    np.add.at(per_ccn, (ccn_codes, events[SURVEY_DATE_KEY].dt.year.to_numpy() - HISTOGRAM_FIRST_YEAR,
+                        events[SURVEY_DATE_KEY].dt.month.to_numpy() - 1), 1)
+    ccn_position = {ccn: i for i, ccn in enumerate(ccns)}
+    cube['ccn'] = {ccn: per_ccn[i] for ccn, i in ccn_position.items()}
+
+    def group_counts(members):
+        positions = [ccn_position[c] for c in members if c in ccn_position]
+        return per_ccn[positions].sum(axis=0) if positions else np.zeros((HISTOGRAM_YEARS, 12), dtype=np.int32)
+
+    for code, part in state_partitions.items():
+        cube['state'][code] = group_counts(part['ccns'])
+
+    for frame_name in ('provider_info', 'facilities'):
+        df = _loaded_frames()[frame_name]
+        if df is None:
+            continue
+        group_columns = [('county', c) for c in COUNTY_COLUMN_CANDIDATES if c in df.columns]
+        if ZIP_KEY in df.columns:
+            group_columns.append(('zip', ZIP_KEY))
+        for level, col in group_columns:
+            groups, members_by_group = {}, {}
+            for code, part in state_partitions.items():
+                rows = df.iloc[part[frame_name]]
+                rows = rows[rows[CCN_KEY].notna()]
+                keys = normalize_county_series(rows[col]) if level == 'county' else rows[col]
+                for key, members in rows[CCN_KEY].groupby(keys.to_numpy(), sort=False):
+                    members = frozenset(members)
+                    groups[(code, key)] = group_counts(members)
+                    members_by_group[(code, key)] = members
+            cube[level].append({'source': frame_name, 'counts': groups, 'members': members_by_group})
+    histogram_cube = cube
+    print(f"Built survey histogram cube ({len(events)} survey events, {len(cube['state'])} states, "
+          f"{sum(len(g['counts']) for g in cube['county'])} county and {sum(len(g['counts']) for g in cube['zip'])} ZIP groups) "
+          f"in {time.perf_counter() - started:.2f}s")
+
+def histogram_group(level, state, key):
+    """(counts, members) of the first county/ZIP source in histogram_cube that has this group, else (None, None)."""
+    group_key = (normalize_state_input(state), key)
+    for source in histogram_cube.get(level, []):
+        if group_key in source['counts']:
+            return source['counts'][group_key], source['members'][group_key]
+    return None, None
+
+def requested_year_range():
+    """(start_year, end_year) from the optional query params, None where absent (ValueError if malformed)."""
+    start_year, end_year = request.args.get('start_year'), request.args.get('end_year')
+    return (int(start_year) if start_year else None), (int(end_year) if end_year else None)
+
+def histogram_year_slice(start_year=None, end_year=None):
+    """Year rows of the cube from start_year through end_year (the whole cube where None)."""
+    start_year = HISTOGRAM_FIRST_YEAR if start_year is None else start_year
+    end_year = HISTOGRAM_FIRST_YEAR + HISTOGRAM_YEARS - 1 if end_year is None else end_year
+    return slice(max(0, start_year - HISTOGRAM_FIRST_YEAR), max(0, end_year - HISTOGRAM_FIRST_YEAR + 1))
+
+def histogram_section(counts, years):
+    """Section 4 body and status (12 month buckets and total) from a year x month count array."""
+    month_counts = counts[years].sum(axis=0) if counts is not None else np.zeros(12, dtype=np.int64)
+    total = int(month_counts.sum())
+    if total == 0:
+        return {'buckets': [], 'count': 0}, 200
+    buckets = [{'month': m, 'label': calendar.month_abbr[m], 'count': int(month_counts[m - 1])} for m in range(1, 13)]
+    return {'buckets': buckets, 'count': total}, 200
+
+def build_deficiency_category_cube():
+    """Pre-aggregate the deficiency-category trends.
+
+    Every deficiency row is counted by (survey year, category) per state partition, per (state, provider_info
+    'County/Parish') over the county's CCNs, and per (state, ZIP5 of the deficiency row). Counts are stored cumulative
+    over a year axis whose slot 0 holds undated rows, so all-time totals are the last slot and a year range is a
+    difference of two slots. The last category column counts rows with no category (they only mark a group non-empty).
+    """
+    global category_cube
+    started = time.perf_counter()
+    cube = {'categories': [], 'years': np.empty(0, dtype=int), 'state': {}, 'county': {}, 'zip': {}}
+    cat_col = next((c for c in CATEGORY_COLUMN_CANDIDATES if deficiencies_data is not None and c in deficiencies_data.columns), None)
+    if cat_col is None or not state_partitions:
+        category_cube = cube
+        return
+    cat_codes, categories = pd.factorize(deficiencies_data[cat_col], sort=True)
+    cat_codes = np.where(cat_codes < 0, len(categories), cat_codes)
+    year_values = deficiencies_data[SURVEY_DATE_KEY].dt.year
+    years = np.sort(year_values.dropna().unique().astype(int))
+    year_slots = np.where(year_values.notna(), np.searchsorted(years, year_values.fillna(0).astype(int)) + 1, 0)
+    shape = (len(years) + 1, len(categories) + 1)
+
+    def cumulative(group_codes, n_groups, rows):
+        counts = np.zeros((n_groups,) + shape, dtype=np.int32)
+        np.add.at(counts, (group_codes, year_slots[rows], cat_codes[rows]), 1)
+        return counts.cumsum(axis=1)
+
+    county_col = 'County/Parish' if provider_info_data is not None and 'County/Parish' in provider_info_data.columns else None
+    for code, part in state_partitions.items():
+        rows = part['deficiencies']
+        cube['state'][code] = cumulative(np.zeros(len(rows), dtype=np.intp), 1, rows)[0]
+
+        # ZIP of the deficiency row itself
+        if ZIP_KEY in deficiencies_data.columns:
+            zip_codes, zips = pd.factorize(deficiencies_data[ZIP_KEY].to_numpy()[rows])
+            for i, counts in enumerate(cumulative(zip_codes, len(zips), rows)):
+                cube['zip'][(code, zips[i])] = counts
+
+        # County via the state's provider_info rows; a CCN listed under two counties counts in both
+        if county_col:
+            ccn_codes, ccns = pd.factorize(deficiencies_data[CCN_KEY].to_numpy()[rows])
+            keep = ccn_codes >= 0
+            per_ccn = cumulative(ccn_codes[keep], len(ccns), rows[keep])
+            ccn_position = {ccn: i for i, ccn in enumerate(ccns)}
+            providers = provider_info_data.iloc[part['provider_info']]
+            providers = providers[providers[CCN_KEY].notna() & providers[county_col].notna()]
+            for county, members in providers[CCN_KEY].groupby(providers[county_col].to_numpy(), sort=False):
+                positions = [ccn_position[c] for c in set(members) if c in ccn_position]
+                cube['county'][(code, county)] = per_ccn[positions].sum(axis=0) if positions else np.zeros(shape, dtype=np.int32)
+    cube['categories'] = list(categories)
+    cube['years'] = years
+    category_cube = cube
+    print(f"Built deficiency category cube ({len(categories)} categories, {len(years)} years, {len(cube['state'])} states, "
+          f"{len(cube['county'])} counties, {len(cube['zip'])} ZIPs) in {time.perf_counter() - started:.2f}s")
+
+def category_group_counts(level, state, key=None, start_year=None, end_year=None):
+    """Per-category deficiency counts (last entry: rows without a category) for a cube group, over all rows or the
+    dated rows in [start_year, end_year]; None when the group is unknown."""
+    group = category_cube.get(level, {}).get(normalize_state_input(state) if level == 'state' else (normalize_state_input(state), key))
+    if group is None:
+        return None
+    if start_year is None and end_year is None:
+        return group[-1]
+    years = category_cube['years']
+    lo = np.searchsorted(years, start_year, side='left') if start_year is not None else 0
+    hi = np.searchsorted(years, end_year, side='right') if end_year is not None else len(years)
+    return group[hi] - group[lo] if hi > lo else np.zeros_like(group[-1])
+
+def ranked_category_trends(counts):
+    """[{category, count}] by descending count, ranked exactly like groupby(category).size().sort_values(...)."""
+    present = counts[:-1] > 0
+    by_category = pd.Series(counts[:-1][present], index=pd.Index(np.asarray(category_cube['categories'], dtype=object)[present], name='category'))
+    trends = by_category.reset_index(name='count').sort_values('count', ascending=False)
+    return [{'category': category, 'count': int(count)} for category, count in zip(trends['category'], trends['count'])]
+
+# Every CCN's sorted, unique survey dates across facilities and deficiencies, stored flat: CCN i owns
+# [offsets[i], offsets[i + 1]) of the per-survey arrays (see build_survey_history)
+survey_history = {}
+
+def build_survey_history():
+    """Merge (CCN, survey date) events from both frames into survey_history.
+
+    Where both frames have a date the facilities row wins, so its provider name and 'State' are kept; dates only the
+    deficiencies know carry the deficiency row's name and state code -1. Names and states are stored as codes into
+    small lookup tables next to the flat datetime64 array.
+    """
+    global survey_history
+    started = time.perf_counter()
+    parts = []
+    if facilities_data is not None:
+        parts.append(pd.DataFrame({
+            'ccn': facilities_data[CCN_KEY],
+            'date': facilities_data[SURVEY_DATE_KEY],
+            'in_timeline': facilities_data[IN_TIMELINE_KEY],
+            'name': column_values(facilities_data, ['Provider Name', 'provider_name'], 'N/A'),
+            'state': column_values(facilities_data, ['State', 'state'], 'N/A'),
+            'source': 0,
+        }))
+    if deficiencies_data is not None:
+        name_col = next((c for c in ['Provider Name', 'Facility Name', 'provider_name', 'facility_name'] if c in deficiencies_data.columns), None)
+        parts.append(pd.DataFrame({
+            'ccn': deficiencies_data[CCN_KEY],
+            'date': deficiencies_data[SURVEY_DATE_KEY],
+            'in_timeline': deficiencies_data[IN_TIMELINE_KEY],
+            'name': deficiencies_data[name_col].astype(str) if name_col else 'N/A',
+            'state': None,
+            'source': 1,
+        }))
+    events = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame({'ccn': [], 'date': pd.Series(dtype='datetime64[ns]'), 'in_timeline': [], 'name': [], 'state': [], 'source': []})
+    events = events[events['ccn'].notna() & events['date'].notna()]
+    events = events.assign(date=events['date'].dt.normalize()).sort_values(['ccn', 'date', 'source'], kind='stable')
+    events = events.drop_duplicates(subset=['ccn', 'date'], keep='first')
+    ccn_codes, ccns = pd.factorize(events['ccn'])
+    name_codes, names = pd.factorize(events['name'], use_na_sentinel=False)
+    state_codes, states = pd.factorize(events['state'])
+    survey_history = {
+        'positions': {ccn: i for i, ccn in enumerate(ccns)},
+        'offsets': np.concatenate([[0], np.cumsum(np.bincount(ccn_codes, minlength=len(ccns)))]).astype(np.int64),
+        'dates': events['date'].to_numpy(dtype='datetime64[ns]'),
+        'in_timeline': events['in_timeline'].to_numpy(dtype=bool),
+        'name_codes': name_codes.astype(np.int32),
+        'names': np.asarray(names, dtype=object),
+        'state_codes': state_codes.astype(np.int32),
+        'states': np.asarray(states, dtype=object),
+        # 'State' on the CCN's latest facilities row ('' if it only appears in the deficiencies)
+        'home_states': pd.Series(ccns).map(events.dropna(subset=['state']).groupby('ccn')['state'].last()).fillna('').astype(str).to_numpy(dtype=object),
+    }
+    print(f"Built survey history ({len(ccns)} facilities, {len(events)} surveys) in {time.perf_counter() - started:.2f}s")
+
+def concatenated_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """np.concatenate([np.arange(s, s + n) for s, n in zip(starts, lengths)]) without the Python loop."""
+    return np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths) + np.arange(lengths.sum())
+
+def survey_history_span(ccn_norm) -> slice:
+    """Where ccn_norm's surveys sit in the flat survey_history arrays (an empty slice if it has none)."""
+    position = survey_history['positions'].get(ccn_norm) if survey_history and ccn_norm else None
+    if position is None:
+        return slice(0, 0)
+    return slice(survey_history['offsets'][position], survey_history['offsets'][position + 1])
+
+def survey_history_dates(ccns) -> np.ndarray:
+    """Sorted unique survey dates (datetime64) across one or more CCNs."""
+    if not survey_history:
+        return np.empty(0, dtype='datetime64[ns]')
+    spans = [survey_history['dates'][survey_history_span(c)] for c in ([ccns] if isinstance(ccns, str) else ccns)]
+    spans = [d for d in spans if len(d)]
+    if not spans:
+        return np.empty(0, dtype='datetime64[ns]')
+    return spans[0] if len(spans) == 1 else np.unique(np.concatenate(spans))
+
+def build_lookup_indexes():
+    """Derived lookup structures over the loaded frames; rebuilt after every CSV or snapshot load."""
+    build_ccn_index()
+    build_state_partitions()
+    build_survey_history()
+    build_facility_directory()
+    build_geo_index()
+    build_survey_event_index()
+    build_survey_wave_table()
+    build_survey_histogram_cube()
+    build_deficiency_category_cube()
+    build_survey_gap_table()
+    build_gap_ecdf_table()
+    build_overdue_table()
+    build_similarity_index()
+    build_deficiency_profile_index()
+    build_combined_peer_table()
+    reset_response_cache()
+    load_or_build_forecast_table()
+
+def reset_response_cache():
+    """Drop cached responses and stamp a new dataset version, derived from the source files' content hashes so that
+    re-downloading or touching identical files keeps the version (and the forecast table and ETags) valid."""
+    hashes = {path: entry['sha256'] for path, entry in current_source_fingerprint().items()}
+    version_source = json.dumps([SNAPSHOT_FORMAT_VERSION, hashes], sort_keys=True)
+    with response_cache_lock:
+        response_cache.clear()
+        response_cache_stats['bytes'] = 0
+        data_load_stats['dataset_version'] = hashlib.sha256(version_source.encode()).hexdigest()[:16]
+
+def cached_response(view):
+    """Serve a view's 200 responses from response_cache, keyed on (view, URL args, query, dataset version).
+
+    Responses carry a strong ETag (hash of the body), so a browser revalidating with If-None-Match gets 304.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (view.__name__, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))),
+               data_load_stats.get('dataset_version'))
+        with response_cache_lock:
+            entry = response_cache.get(key)
+            if entry is not None:
+                response_cache.move_to_end(key)
+                response_cache_stats['hits'] += 1
+            else:
+                response_cache_stats['misses'] += 1
+        if entry is None:
+            fresh = app.make_response(view(*args, **kwargs))
+            if fresh.status_code != 200:
+                return fresh
+            body = fresh.get_data()
+            entry = (hashlib.sha256(body).hexdigest()[:32], body, fresh.mimetype)
+            if len(body) <= RESPONSE_CACHE_MAX_BYTES:
+                with response_cache_lock:
+                    if key not in response_cache:
+                        response_cache[key] = entry
+                        response_cache_stats['bytes'] += len(body)
+                    while response_cache_stats['bytes'] > RESPONSE_CACHE_MAX_BYTES:
+                        _, (_, evicted, _) = response_cache.popitem(last=False)
+                        response_cache_stats['bytes'] -= len(evicted)
+                        response_cache_stats['evictions'] += 1
+        etag, body, mimetype = entry
+        response = app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+        if response.status_code == 304:
+            with response_cache_lock:
+                response_cache_stats['not_modified'] += 1
+        return response
+    return wrapper
+
+def state_rows(frame_name, state):
+    """Rows of facilities/provider_info/deficiencies belonging to a state (name or code); empty frame for unknown states."""
+    df = _loaded_frames()[frame_name]
+    if df is None:
+        return None
+    part = state_partitions.get(normalize_state_input(state))
+    return df.iloc[part[frame_name] if part else _NO_ROWS]
+
+def state_ccn_set(state):
+    """Canonical CCNs of the facilities in a state."""
+    part = state_partitions.get(normalize_state_input(state))
+    return part['ccns'] if part else frozenset()
+
+def rows_for_ccn(frame_name, ccn_norm):
+    """Rows of facilities/provider_info/deficiencies whose CCN_KEY equals ccn_norm (empty frame if none, None if not loaded)."""
+    df = _loaded_frames()[frame_name]
+    if df is None:
+        return None
+    positions = ccn_index.get(frame_name, {}).get(ccn_norm, _NO_ROWS) if ccn_norm else _NO_ROWS
+    return df.iloc[positions]
+
+def select_state_facility(state, facility_id, ccn=None, id_columns=CCN_COLUMN_CANDIDATES):
+    """The facilities row a per-facility endpoint refers to: the state's first row with the given CCN, else the state's
+    row at position facility_id, else the first whose id_columns value equals facility_id. None if nothing matches."""
+    part = state_partitions.get(normalize_state_input(state))
+    in_state = part['facilities'] if part else _NO_ROWS
+    ccn_norm = normalize_ccn_value(ccn) if ccn else None
+    if ccn_norm:
+        positions = np.intersect1d(ccn_index.get('facilities', {}).get(ccn_norm, _NO_ROWS), in_state)
+        if len(positions):
+            return facilities_data.iloc[positions[0]]
+    try:
+        idx = int(facility_id)
+        if 0 <= idx < len(in_state):
+            return facilities_data.iloc[in_state[idx]]
+    except ValueError:
+        pass
+    state_filtered = facilities_data.iloc[in_state]
+    for idcol in id_columns:
+        if idcol in state_filtered.columns:
+            tmp = state_filtered[state_filtered[idcol].astype(str) == str(facility_id)]
+            if len(tmp) > 0:
+                return tmp.iloc[0]
+    return None
+
+def rows_for_ccns(frame_name, ccns):
+    """Rows (in frame order) whose CCN_KEY is any of ccns, gathered from ccn_index rather than a full-frame isin mask."""
+    df = _loaded_frames()[frame_name]
+    if df is None:
+        return None
+    index = ccn_index.get(frame_name, {})
+    groups = [index[c] for c in ccns if c in index]
+    return df.iloc[np.sort(np.concatenate(groups)) if groups else _NO_ROWS]
+
 STATE_ABBR = {
     'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California',
     'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware', 'FL': 'Florida', 'GA': 'Georgia',
@@ -509,7 +1408,17 @@ def dashboard():
 @app.route('/test')
 def test():
     """Test endpoint to verify server is working"""
-    return jsonify({'message': 'Server is working!', 'data_loaded': facilities_data is not None})
+    return jsonify({'message': 'Server is working!', 'data_loaded': facilities_data is not None, 'data_load': data_load_stats})
+
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    """Hit/miss/304/eviction counters and current size of this worker's response cache."""
+    with response_cache_lock:
+        stats = dict(response_cache_stats, entries=len(response_cache), max_bytes=RESPONSE_CACHE_MAX_BYTES)
+    requests_seen = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / requests_seen, 3) if requests_seen else None
+    stats['dataset_version'] = data_load_stats.get('dataset_version')
+    return jsonify(stats)
 
 def normalize_state_input(state_input):
     """Convert state name to state code if needed, or return uppercase state code"""
@@ -533,6 +1442,7 @@ def normalize_state_input(state_input):
     return state_name_to_code.get(state_lower, state_input.upper())
 
 @app.route('/api/facilities/<state>')
+@cached_response
 def get_facilities_by_state(state):
     """API endpoint to get facilities for a specific state with coordinates for map display"""
     global facilities_data, provider_info_data
@@ -544,288 +1454,22 @@ def get_facilities_by_state(state):
         return jsonify({'error': 'Data not loaded'}), 500
     
     try:
-        # Filter facilities by state
         # Try different possible column names for state
         state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = None
-        
-        print(f"Available columns: {list(facilities_data.columns)}")
-        
-        # Debug: Check for CCN-related columns
-        ccn_columns = [col for col in facilities_data.columns if 'ccn' in col.lower() or 'certification' in col.lower() or 'number' in col.lower()]
-        print(f"CCN-related columns: {ccn_columns}")
-        
-        for col in state_columns:
-            if col in facilities_data.columns:
-                state_col = col
-                print(f"Found state column: {col}")
-                break
-        
+        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
         if state_col is None:
             print(f"State column not found. Available columns: {list(facilities_data.columns)}")
             return jsonify({'error': 'State column not found'}), 500
         
-        # Filter by state
-        print(f"Filtering for state: {state}")
-        print(f"State column values: {facilities_data[state_col].unique()[:10]}")  # Show first 10 unique values
-        
-        # Normalize state input and match case-insensitively
+        # Normalize state input and take that state's precomputed rows
         state_normalized = normalize_state_input(state)
-        state_facilities = facilities_data[facilities_data[state_col].astype(str).str.strip().str.upper() == state_normalized]
-        print(f"Found {len(state_facilities)} facilities for state '{state}' (normalized: '{state_normalized}')")
-        
-        if len(state_facilities) == 0:
+        if state_normalized not in facility_directory:
+            print(f"No facilities for state '{state}' (normalized: '{state_normalized}')")
             return jsonify({'facilities': [], 'message': f'No facilities found for state {state}'})
         
-        # Convert to list of dictionaries and ensure unique facility names
-        facilities_list = []
-        seen_names = set()
-        
-        for _, row in state_facilities.iterrows():
-            # Try to get facility name from different possible columns
-            name_columns = ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']
-            facility_name = None
-            
-            for col in name_columns:
-                if col in row.index and not pd.isna(row[col]):
-                    facility_name = str(row[col]).strip()
-                    break
-            
-            # Skip if no name found or duplicate name
-            if not facility_name or facility_name in seen_names:
-                continue
-                
-            seen_names.add(facility_name)
-            
-            facility = {}
-            for col in row.index:
-                # Handle NaN values
-                if pd.isna(row[col]):
-                    facility[col] = None
-                else:
-                    # For CCN columns, preserve the value as-is (could be number or string)
-                    if 'ccn' in col.lower() or 'certification' in col.lower():
-                        val = row[col]
-                        # Convert to string but preserve numeric values
-                        if pd.notna(val):
-                            facility[col] = str(val).strip()
-                        else:
-                            facility[col] = None
-                    else:
-                        val = str(row[col])
-                        # Don't store 'nan' or 'None' as strings
-                        if val.lower() in ['nan', 'none', '']:
-                            facility[col] = None
-                        else:
-                            facility[col] = val
-            
-            # Extract CCN - it should be in the facility dict if the join worked
-            ccn_in_facility = None
-            for ccn_field in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-                if ccn_field in facility:
-                    ccn_val = facility[ccn_field]
-                    if ccn_val is not None:
-                        ccn_str = str(ccn_val).strip()
-                        # Check if it's a valid CCN (not 'nan', 'none', 'n/a', or empty)
-                        if ccn_str and ccn_str.lower() not in ['nan', 'none', 'n/a', '']:
-                            ccn_in_facility = ccn_str
-                            break
-                # Also check row directly as fallback
-                elif ccn_field in row.index and not pd.isna(row[ccn_field]):
-                    ccn_val = row[ccn_field]
-                    ccn_str = str(ccn_val).strip()
-                    if ccn_str and ccn_str.lower() not in ['nan', 'none', 'n/a', '']:
-                        ccn_in_facility = ccn_str
-                        facility[ccn_field] = ccn_str  # Ensure it's in facility dict
-                        break
-            
-            # Initialize lat/lng if not present (these come from provider_info, not the join)
-            if 'lat' not in facility or not facility.get('lat'):
-                facility['lat'] = None
-            if 'lng' not in facility or not facility.get('lng'):
-                facility['lng'] = None
-            
-            # Preserve existing values from join, only set to None if truly missing
-            # These fields should already be in facility from the row if the join worked
-            if 'County/Parish' not in facility or facility.get('County/Parish') in [None, 'None', 'nan', '']:
-                facility['County/Parish'] = None
-            if 'Overall Rating' not in facility or facility.get('Overall Rating') in [None, 'None', 'nan', '']:
-                facility['Overall Rating'] = None
-            if 'Number of Certified Beds' not in facility or facility.get('Number of Certified Beds') in [None, 'None', 'nan', '']:
-                facility['Number of Certified Beds'] = None
-            if 'Average Number of Residents per Day' not in facility or facility.get('Average Number of Residents per Day') in [None, 'None', 'nan', '']:
-                facility['Average Number of Residents per Day'] = None
-            if 'Health Inspection Rating' not in facility or facility.get('Health Inspection Rating') in [None, 'None', 'nan', '']:
-                facility['Health Inspection Rating'] = None
-            if 'Staffing Rating' not in facility or facility.get('Staffing Rating') in [None, 'None', 'nan', '']:
-                facility['Staffing Rating'] = None
-            
-            # Only look up from provider_info_data if fields are missing and provider_info_data is available
-            if provider_info_data is not None:
-                ccn_cols = ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']
-                ccn_col = next((c for c in ccn_cols if c in provider_info_data.columns), None)
-                if ccn_col:
-                    # Try to get CCN - first from facility dict (from join), then from row
-                    ccn = ccn_in_facility
-                    
-                    if not ccn:
-                        # Fallback: try to get CCN from the facility row directly
-                        for ccn_field in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-                            if ccn_field in row.index and not pd.isna(row[ccn_field]):
-                                ccn_val = row[ccn_field]
-                                # Convert to string and check if it's valid
-                                ccn_str = str(ccn_val).strip()
-                                if ccn_str and ccn_str.lower() not in ['nan', 'none', 'n/a', '']:
-                                    ccn = ccn_str
-                                    # Also update facility dict
-                                    facility[ccn_field] = ccn_str
-                                    break
-                    
-                    # If still no CCN, try direct lookup from provider_info by name + state
-                    if not ccn or str(ccn).lower() in ['nan', 'none', 'n/a', '']:
-                        # Try to find in provider_info by matching name and state
-                        facility_name_upper = str(facility_name).strip().upper()
-                        facility_state_upper = str(facility.get('State') or row.get(state_col) or '').strip().upper()
-                        
-                        if facility_name_upper and facility_state_upper:
-                            # Try exact match first
-                            provider_match = provider_info_data[
-                                (provider_info_data['Provider Name'].astype(str).str.strip().str.upper() == facility_name_upper) &
-                                (provider_info_data['State'].astype(str).str.strip().str.upper() == facility_state_upper)
-                            ]
-                            
-                            # If exact match fails, try partial match (contains)
-                            if provider_match.empty:
-                                provider_match = provider_info_data[
-                                    (provider_info_data['Provider Name'].astype(str).str.strip().str.upper().str.contains(facility_name_upper, na=False, regex=False)) &
-                                    (provider_info_data['State'].astype(str).str.strip().str.upper() == facility_state_upper)
-                                ]
-                            
-                            # If still no match, try reverse (facility name contains provider name)
-                            if provider_match.empty:
-                                for _, prov_row in provider_info_data[provider_info_data['State'].astype(str).str.strip().str.upper() == facility_state_upper].iterrows():
-                                    prov_name_upper = str(prov_row['Provider Name']).strip().upper()
-                                    if prov_name_upper in facility_name_upper or facility_name_upper in prov_name_upper:
-                                        # Check if names are similar (fuzzy match)
-                                        if abs(len(prov_name_upper) - len(facility_name_upper)) <= 10:  # Length difference not too large
-                                            provider_match = pd.DataFrame([prov_row])
-                                            break
-                            
-                            if not provider_match.empty:
-                                ccn = str(provider_match.iloc[0]['CMS Certification Number (CCN)']).strip()
-                                facility['CMS Certification Number (CCN)'] = ccn
-                                # Also update other fields if missing
-                                if not facility.get('County/Parish') or facility['County/Parish'] in [None, 'None', 'nan']:
-                                    if 'County/Parish' in provider_match.columns and pd.notna(provider_match.iloc[0]['County/Parish']):
-                                        facility['County/Parish'] = str(provider_match.iloc[0]['County/Parish']).strip()
-                                if not facility.get('Overall Rating') or facility['Overall Rating'] in [None, 'None', 'nan']:
-                                    if 'Overall Rating' in provider_match.columns and pd.notna(provider_match.iloc[0]['Overall Rating']):
-                                        facility['Overall Rating'] = str(provider_match.iloc[0]['Overall Rating']).strip()
-                                if len(facilities_list) < 3:
-                                    print(f"Found CCN via direct lookup for {facility_name}: {ccn}")
-                    
-                    # Debug: Log CCN extraction attempt (only for first few facilities to avoid spam)
-                    if (not ccn or str(ccn).lower() in ['nan', 'none', 'n/a', '']) and len(facilities_list) < 5:
-                        ccn_debug = {}
-                        for ccn_field in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-                            if ccn_field in row.index:
-                                ccn_debug[ccn_field] = str(row[ccn_field]) if not pd.isna(row[ccn_field]) else 'NaN'
-                            if ccn_field in facility:
-                                ccn_debug[f'{ccn_field}_in_facility'] = facility[ccn_field]
-                        print(f"CCN extraction debug for {facility_name}: {ccn_debug}")
-                    
-                    if ccn and str(ccn).lower() not in ['nan', 'none', 'n/a', '']:
-                        # Normalize CCN - remove leading zeros and pad to 6 digits for matching
-                        ccn_clean = str(ccn).strip().lstrip('0')  # Remove leading zeros
-                        ccn_normalized = ccn_clean.zfill(6) if ccn_clean else ''  # Pad to 6 digits
-                        
-                        # Match against provider_info CCNs - normalize both sides for comparison
-                        provider_info_ccn_normalized = provider_info_data[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-                        provider_match = provider_info_data[provider_info_ccn_normalized == ccn_normalized]
-                        if len(facilities_list) < 3:
-                            print(f"CCN matching: looking for '{ccn_normalized}', found {len(provider_match)} matches")
-                        if not provider_match.empty:
-                            provider_row = provider_match.iloc[0]
-                            
-                            # Look for lat/lng columns (only if not already in facility)
-                            if not facility.get('lat') or not facility.get('lng'):
-                                lat_cols = ['lat', 'latitude', 'Latitude', 'LAT', 'LATITUDE']
-                                lng_cols = ['lng', 'longitude', 'Longitude', 'LNG', 'LONGITUDE', 'lon', 'LON']
-                                
-                                lat_col = next((c for c in lat_cols if c in provider_row.index), None)
-                                lng_col = next((c for c in lng_cols if c in provider_row.index), None)
-                                
-                                if lat_col and lng_col:
-                                    try:
-                                        facility['lat'] = float(provider_row[lat_col])
-                                        facility['lng'] = float(provider_row[lng_col])
-                                    except (ValueError, TypeError) as e:
-                                        pass
-                            
-                            # Look for County/Parish column (only if not already set)
-                            if not facility.get('County/Parish') or facility['County/Parish'] == 'None' or facility['County/Parish'] == 'nan':
-                                county_cols = ['County/Parish', 'County', 'county', 'COUNTY', 'County Name', 'county_name']
-                                county_col = next((c for c in county_cols if c in provider_row.index), None)
-                                if county_col and not pd.isna(provider_row[county_col]):
-                                    facility['County/Parish'] = str(provider_row[county_col])
-                            
-                            # Look for Overall Rating column (only if not already set)
-                            if not facility.get('Overall Rating') or facility['Overall Rating'] == 'None' or facility['Overall Rating'] == 'nan':
-                                rating_cols = ['Overall Rating', 'Overall_Rating', 'overall_rating', 'Rating']
-                                rating_col = next((c for c in rating_cols if c in provider_row.index), None)
-                                if rating_col and not pd.isna(provider_row[rating_col]):
-                                    facility['Overall Rating'] = str(provider_row[rating_col])
-                            
-                            # Look for Number of Certified Beds (only if not already set)
-                            if not facility.get('Number of Certified Beds') or facility['Number of Certified Beds'] == 'None' or facility['Number of Certified Beds'] == 'nan':
-                                beds_col = 'Number of Certified Beds'
-                                if beds_col in provider_row.index and not pd.isna(provider_row[beds_col]):
-                                    facility['Number of Certified Beds'] = str(provider_row[beds_col])
-                            
-                            # Look for Average Number of Residents per Day (only if not already set)
-                            if not facility.get('Average Number of Residents per Day') or facility['Average Number of Residents per Day'] == 'None' or facility['Average Number of Residents per Day'] == 'nan':
-                                residents_col = 'Average Number of Residents per Day'
-                                if residents_col in provider_row.index and not pd.isna(provider_row[residents_col]):
-                                    facility['Average Number of Residents per Day'] = str(provider_row[residents_col])
-                            
-                            # Look for Health Inspection Rating (only if not already set)
-                            if not facility.get('Health Inspection Rating') or facility['Health Inspection Rating'] == 'None' or facility['Health Inspection Rating'] == 'nan':
-                                health_rating_col = 'Health Inspection Rating'
-                                if health_rating_col in provider_row.index and not pd.isna(provider_row[health_rating_col]):
-                                    facility['Health Inspection Rating'] = str(provider_row[health_rating_col])
-                            
-                            # Look for Staffing Rating (only if not already set)
-                            if not facility.get('Staffing Rating') or facility['Staffing Rating'] == 'None' or facility['Staffing Rating'] == 'nan':
-                                staffing_rating_col = 'Staffing Rating'
-                                if staffing_rating_col in provider_row.index and not pd.isna(provider_row[staffing_rating_col]):
-                                    facility['Staffing Rating'] = str(provider_row[staffing_rating_col])
-                        else:
-                            if len(facilities_list) < 5:  # Only log first few
-                                print(f"No provider match found for CCN: {ccn} for facility: {facility_name}")
-                    else:
-                        # Only log if we're debugging (first few facilities)
-                        if len(facilities_list) < 5:
-                            print(f"No valid CCN found for facility: {facility_name}")
-            
-            # Add a unique identifier for the facility
-            facility['unique_id'] = len(facilities_list)
-            facilities_list.append(facility)
-        
-        print(f"Returning {len(facilities_list)} unique facilities")
-        
-        # Debug: Show sample facility structure
-        if facilities_list:
-            print(f"Sample facility structure: {list(facilities_list[0].keys())}")
-            print(f"Sample facility CCN fields: {[(k, v) for k, v in facilities_list[0].items() if 'ccn' in k.lower() or 'certification' in k.lower() or 'number' in k.lower()]}")
-            print(f"Sample facility County/Parish: {facilities_list[0].get('County/Parish', 'NOT FOUND')}")
-            print(f"Sample facility Overall Rating: {facilities_list[0].get('Overall Rating', 'NOT FOUND')}")
-            
-            # Count how many facilities have CCN
-            facilities_with_ccn = sum(1 for f in facilities_list if any(
-                f.get(k) and str(f.get(k)).lower() not in ['nan', 'none', 'n/a', ''] 
-                for k in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']
-            ))
-            print(f"Facilities with valid CCN: {facilities_with_ccn} out of {len(facilities_list)} ({facilities_with_ccn/len(facilities_list)*100:.1f}%)")
+        # Rows were deduplicated by name, stringified and enriched from provider_info at load
+        facilities_list = facility_directory[state_normalized].to_dict('records')
+        print(f"Returning {len(facilities_list)} unique facilities for state '{state}' (normalized: '{state_normalized}')")
         
         return jsonify({
             'facilities': facilities_list,
@@ -837,12 +1481,27 @@ def get_facilities_by_state(state):
         print(f"Error filtering facilities by state: {e}")
         return jsonify({'error': str(e)}), 500
 
+def ml_forecast_section(state, ccn_raw, mode=''):
+    """/api/ml-forecast body and status for a state and (raw) CCN; mode 'quantiles' adds the survey window."""
+    # Normalize CCN to 6-digit string if provided
+    ccn_norm = normalize_ccn_value(ccn_raw) if ccn_raw else None
+
+    result = precomputed_forecast(ccn_norm, state)
+    if result is None:
+        forecast_date = forecast_next_surveys([ccn_norm], [state])['forecast_date'][0]
+        result = {'forecast_date': forecast_date.strftime('%Y-%m-%d'), 'precomputed': False}
+    if mode == 'quantiles':
+        result['window'] = survey_window_forecast(ccn_norm, state)
+    return result, 200
+
 @app.route('/api/ml-forecast', methods=['POST'])
 def ml_forecast():
     """Predict next survey date using a simple ML-style regression on historical intervals with fallbacks.
 
-    Request JSON expects: { state: str, ccn: str }
-    Returns: { forecast_date: 'YYYY-MM-DD' }
+    Request JSON expects: { state: str, ccn: str, mode?: 'quantiles' }
+    Returns: { forecast_date: 'YYYY-MM-DD', precomputed: bool } plus predicted_days, method, dataset_version and
+    stale (the table predates the loaded data) when served from forecast_table. mode 'quantiles' adds window:
+    P10/P50/P90 dates and a weekly probability curve (see survey_window_forecast).
     """
     global facilities_data, provider_info_data, deficiencies_data
 
@@ -853,116 +1512,64 @@ def ml_forecast():
         body = request.get_json(silent=True) or {}
         state = (body.get('state') or '').strip()
         ccn_raw = (body.get('ccn') or '').strip() if body.get('ccn') is not None else ''
+        result, status = ml_forecast_section(state, ccn_raw, str(body.get('mode') or '').lower())
+        return jsonify(result), status
 
-        # Normalize CCN to 6-digit string if provided
-        ccn_norm = None
-        if ccn_raw:
-            ccn_clean = str(ccn_raw).strip().lstrip('0')
-            ccn_norm = ccn_clean.zfill(6)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Collect survey dates for the CCN from deficiencies_data and facilities_data (if CCN provided)
-        date_values = []
 
-        def try_collect_dates(df, ccn_cols, date_cols):
-            if df is None:
-                return
-            ccn_col = next((c for c in ccn_cols if c in df.columns), None)
-            if not ccn_col:
-                return
-            subset = df[df[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6) == ccn_norm]
-            if subset.empty:
-                return
-            for dc in date_cols:
-                if dc in subset.columns:
-                    for v in subset[dc].dropna().tolist():
-                        try:
-                            date_values.append(pd.to_datetime(v))
-                        except Exception:
-                            pass
-
-        if ccn_norm:
-            try_collect_dates(deficiencies_data, ['CCN', 'CMS Certification Number (CCN)', 'CMS Certification Number', 'ccn'], ['Health Survey Date', 'Survey Date', 'Date'])
-            try_collect_dates(facilities_data, ['CCN', 'CMS Certification Number (CCN)', 'CMS Certification Number', 'ccn'], ['Health Survey Date', 'Survey Date', 'Date'])
-
-        # Unique sorted dates
-        unique_dates = sorted({pd.Timestamp(d).normalize() for d in date_values}) if date_values else []
-        if len(unique_dates) < 2:
-            # Fallback to county/state averages if insufficient history
-            predicted_days = compute_fallback_interval_days(ccn_norm, state)
-        else:
-            # Compute intervals in days
-            intervals = np.diff([d.to_pydatetime() for d in unique_dates])
-            intervals_days = np.array([max(1, delta.days) for delta in intervals], dtype=float)
-
-            # AR(1)-style linear regression: interval_t = a + b * interval_{t-1}
-            if len(intervals_days) >= 2:
-                x = intervals_days[:-1]
-                y = intervals_days[1:]
-                X = np.vstack([np.ones_like(x), x]).T
-                try:
-                    coef, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
-                    a, b = float(coef[0]), float(coef[1])
-                    last_interval = float(intervals_days[-1])
-                    predicted = a + b * last_interval
-                except Exception:
-                    predicted = float(np.median(intervals_days))
-            else:
-                predicted = float(np.median(intervals_days))
+# Forecasts per streamed chunk of the /api/ml-forecast/batch response
+FORECAST_BATCH_CHUNK = 500
 
-            # Clamp to reasonable bounds (1 to ~2 years)
-            predicted_days = int(max(30, min(730, round(predicted))))
+@app.route('/api/ml-forecast/batch', methods=['POST'])
+def ml_forecast_batch():
+    """ml_forecast for many facilities in one vectorized pass.
 
-            # Seasonality adjustment: if most recent survey month has long gap, bias towards 12-month multiples
-            try:
-                last_month = unique_dates[-1].month
-                if 320 <= predicted_days <= 410:
-                    predicted_days = 365
-                elif 500 <= predicted_days <= 590:
-                    predicted_days = 548  # ~18 months
-                elif 680 <= predicted_days <= 770:
-                    predicted_days = 730   # ~24 months
-            except Exception:
-                pass
+    Request JSON: { ccns: [str, ...], state?: str } or { state: str } alone for every CCN in that state. Without a
+    state, each CCN's fallback uses the state on its own survey rows.
+    Streams back: { count, forecasts: [{ ccn, forecast_date, predicted_days, method } or { ccn, error }] }; a CCN in
+    none of the loaded data (no survey history and no row in any frame) is { ccn, error: 'Unknown CCN' }.
+    """
+    global facilities_data
+    if facilities_data is None:
+        return jsonify({'error': 'Data not loaded'}), 500
 
-        # Choose reference last date
-        last_date: pd.Timestamp
-        if unique_dates:
-            last_date = unique_dates[-1]
+    try:
+        body = request.get_json(silent=True) or {}
+        state = (body.get('state') or '').strip()
+        requested = body.get('ccns')
+        if requested is None:
+            if not state:
+                return jsonify({'error': 'Provide ccns or a state'}), 400
+            requested = sorted(state_ccn_set(state))
+        if not isinstance(requested, list):
+            return jsonify({'error': 'ccns must be a list'}), 400
+
+        normalized = normalize_ccn_series(pd.Series([c if isinstance(c, (str, int)) else None for c in requested], dtype=object))
+        ccns = normalized.where(normalized.notna(), None).tolist()
+        known = [i for i, c in enumerate(ccns) if c]
+        valid = [i for i in known if ccns[i] in survey_history['positions'] or any(ccns[i] in rows for rows in ccn_index.values())]
+        if state:
+            states = [state] * len(valid)
         else:
-            # Use the most recent survey date across state as a better anchor; otherwise today
-            last_date = None
-            if deficiencies_data is not None:
-                date_col_def = next((c for c in ['Health Survey Date', 'Survey Date', 'Date'] if c in deficiencies_data.columns), None)
-                if date_col_def:
-                    try:
-                        if state and facilities_data is not None:
-                            state_col = next((c for c in ['State', 'STATE', 'Provider State'] if c in facilities_data.columns), None)
-                            ccn_cols = [c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in facilities_data.columns]
-                            if state_col and ccn_cols:
-                                fac_state = facilities_data[facilities_data[state_col] == state]
-                                ccn_set = set()
-                                for c in ccn_cols:
-                                    ccn_set.update(fac_state[c].astype(str).str.strip().str.lstrip('0').str.zfill(6).tolist())
-                                ccn_col_def = next((c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in deficiencies_data.columns), None)
-                                if ccn_col_def and ccn_set:
-                                    def_rows = deficiencies_data[deficiencies_data[ccn_col_def].astype(str).str.strip().str.lstrip('0').str.zfill(6).isin(ccn_set)]
-                                    if not def_rows.empty:
-                                        last_dt = pd.to_datetime(def_rows[date_col_def], errors='coerce').dropna()
-                                        if not last_dt.empty:
-                                            last_date = last_dt.max().normalize()
-                        if last_date is None:
-                            last_dt = pd.to_datetime(deficiencies_data[date_col_def], errors='coerce').dropna()
-                            if not last_dt.empty:
-                                last_date = last_dt.max().normalize()
-                    except Exception:
-                        pass
-            if last_date is None:
-                last_date = pd.Timestamp.today().normalize()
-        tentative = last_date + pd.Timedelta(days=int(predicted_days))
-
-        # Round to nearest Monday (consistency with UI)
-        forecast_date = round_to_nearest_monday(tentative)
-        return jsonify({'forecast_date': forecast_date.strftime('%Y-%m-%d')})
+            home = survey_history['home_states']
+            states = [home[survey_history['positions'][ccns[i]]] if ccns[i] in survey_history['positions'] else '' for i in valid]
+        forecasts = forecast_next_surveys([ccns[i] for i in valid], states)
+        results = [{'ccn': c, 'error': 'Invalid CCN'} for c in requested]
+        for i in sorted(set(known) - set(valid)):
+            results[i] = {'ccn': requested[i], 'error': 'Unknown CCN'}
+        for i, forecast_date, days, method in zip(valid, forecasts['forecast_date'].strftime('%Y-%m-%d').tolist(),
+                                                  forecasts['predicted_days'].tolist(), forecasts['method'].tolist()):
+            results[i] = {'ccn': ccns[i], 'forecast_date': forecast_date, 'predicted_days': days, 'method': method}
+
+        def generate():
+            yield f'{{"count": {len(results)}, "forecasts": ['
+            for start in range(0, len(results), FORECAST_BATCH_CHUNK):
+                yield (', ' if start else '') + json.dumps(results[start:start + FORECAST_BATCH_CHUNK])[1:-1]
+            yield ']}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -971,59 +1578,48 @@ def ml_forecast():
 def compute_fallback_interval_days(ccn_norm: str, state: str) -> int:
     """Fallback interval using county peers if available then state average; default 365.
     """
-    global provider_info_data, deficiencies_data, facilities_data
+    return area_fallback_interval_days(ccn_county_name(ccn_norm), state)
 
-    # Find county for this CCN
-    county_name = None
-    if provider_info_data is not None:
-        ccn_col = next((c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in provider_info_data.columns), None)
-        if ccn_col:
-            row = provider_info_data[provider_info_data[ccn_col].astype(str).str.strip().str.zfill(6) == ccn_norm]
-            if not row.empty:
-                county_col = next((c for c in ['County/Parish', 'County', 'County Name', 'county_name'] if c in provider_info_data.columns), None)
-                if county_col and not pd.isna(row.iloc[0][county_col]):
-                    county_name = str(row.iloc[0][county_col])
-
-    def compute_avg_interval(filter_df):
-        all_dates = sorted({pd.Timestamp(d).normalize() for d in filter_df.dropna().tolist()})
+
+def ccn_county_name(ccn_norm: Optional[str]) -> Optional[str]:
+    """County of the CCN's first provider_info row, if any."""
+    if provider_info_data is None or not ccn_norm:
+        return None
+    row = rows_for_ccn('provider_info', ccn_norm)
+    if row.empty:
+        return None
+    county_col = next((c for c in ['County/Parish', 'County', 'County Name', 'county_name'] if c in provider_info_data.columns), None)
+    if county_col and not pd.isna(row.iloc[0][county_col]):
+        return str(row.iloc[0][county_col])
+    return None
+
+
+def area_fallback_interval_days(county_name: Optional[str], state: str) -> int:
+    """compute_fallback_interval_days once the CCN's county is known (county peers, then state, then 365)."""
+    global provider_info_data, facilities_data
+
+    def compute_avg_interval(ccns):
+        # Median gap between the pooled unique survey dates of the given CCNs
+        all_dates = survey_history_dates(ccns)
         if len(all_dates) < 2:
             return None
-        gaps = np.diff([d.to_pydatetime() for d in all_dates])
-        days = np.array([max(1, g.days) for g in gaps], dtype=float)
+        days = np.maximum(1, np.diff(all_dates).astype('timedelta64[D]').astype(int))
         return int(round(float(np.median(days))))
 
     # County peers
-    if county_name and provider_info_data is not None and deficiencies_data is not None:
+    if county_name and provider_info_data is not None:
         county_col = next((c for c in ['County/Parish', 'County', 'County Name', 'county_name'] if c in provider_info_data.columns), None)
-        ccn_col_pi = next((c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in provider_info_data.columns), None)
-        ccn_col_def = next((c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in deficiencies_data.columns), None)
-        date_col_def = next((c for c in ['Health Survey Date', 'Survey Date', 'Date'] if c in deficiencies_data.columns), None)
-        if county_col and ccn_col_pi and ccn_col_def and date_col_def:
-            county_ccns = provider_info_data[provider_info_data[county_col] == county_name][ccn_col_pi].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-            def_rows = deficiencies_data[deficiencies_data[ccn_col_def].astype(str).str.strip().str.lstrip('0').str.zfill(6).isin(set(county_ccns))]
-            avg_days = compute_avg_interval(def_rows[date_col_def]) if not def_rows.empty else None
+        if county_col:
+            county_ccns = set(provider_info_data.loc[provider_info_data[county_col] == county_name, CCN_KEY].dropna())
+            avg_days = compute_avg_interval(county_ccns)
             if avg_days:
                 return int(max(30, min(730, avg_days)))
 
     # State average fallback
-    if facilities_data is not None and deficiencies_data is not None and state:
-        state_col = next((c for c in ['State', 'STATE', 'Provider State'] if c in facilities_data.columns), None)
-        if state_col:
-            state_ccn_cols = [c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in facilities_data.columns]
-            if state_ccn_cols:
-                state_fac = facilities_data[facilities_data[state_col] == state]
-                if not state_fac.empty:
-                    # Map CCNs to normalized set
-                    ccns = set()
-                    for c in state_ccn_cols:
-                        ccns.update(state_fac[c].astype(str).str.strip().str.lstrip('0').str.zfill(6).tolist())
-                    ccn_col_def = next((c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in deficiencies_data.columns), None)
-                    date_col_def = next((c for c in ['Health Survey Date', 'Survey Date', 'Date'] if c in deficiencies_data.columns), None)
-                    if ccn_col_def and date_col_def:
-                        def_rows = deficiencies_data[deficiencies_data[ccn_col_def].astype(str).str.strip().str.lstrip('0').str.zfill(6).isin(ccns)]
-                        avg_days = compute_avg_interval(def_rows[date_col_def]) if not def_rows.empty else None
-                        if avg_days:
-                            return int(max(30, min(730, avg_days)))
+    if facilities_data is not None and state:
+        avg_days = compute_avg_interval(state_ccn_set(state))
+        if avg_days:
+            return int(max(30, min(730, avg_days)))
 
     return 365
 
@@ -1039,6 +1635,252 @@ def round_to_nearest_monday(date_like: pd.Timestamp) -> pd.Timestamp:
         return prev_monday.normalize()
     return next_monday.normalize()
 
+def forecast_anchor_date(state: str) -> pd.Timestamp:
+    """Date to count from for a CCN with no survey history: the state's latest deficiency survey, else the latest anywhere, else today."""
+    last_date = None
+    if deficiencies_data is not None:
+        date_col_def = next((c for c in ['Health Survey Date', 'Survey Date', 'Date'] if c in deficiencies_data.columns), None)
+        if date_col_def:
+            try:
+                if state and facilities_data is not None:
+                    def_rows = state_rows('deficiencies', state)
+                    if not def_rows.empty:
+                        last_dt = def_rows[SURVEY_DATE_KEY].dropna()
+                        if not last_dt.empty:
+                            last_date = last_dt.max().normalize()
+                if last_date is None:
+                    latest = deficiencies_data[SURVEY_DATE_KEY].max()
+                    if pd.notna(latest):
+                        last_date = latest.normalize()
+            except Exception:
+                pass
+    if last_date is None:
+        last_date = pd.Timestamp.today().normalize()
+    return last_date
+
+
+def seasonal_interval_days(predicted: np.ndarray) -> np.ndarray:
+    """Round and clamp predicted intervals to 30..730 days, then snap near-12/18/24-month ones to 365/548/730."""
+    days = np.clip(np.round(predicted), 30, 730).astype(np.int64)
+    days = np.where((days >= 320) & (days <= 410), 365, days)
+    days = np.where((days >= 500) & (days <= 590), 548, days)
+    return np.where((days >= 680) & (days <= 770), 730, days)
+
+
+def ar1_next_interval(n, sx, sy, sxx, sxy, last) -> np.ndarray:
+    """a + b * last from the least-squares AR(1) fit over each series' (previous, next) interval pair sums.
+
+    n, sx, sy, sxx, sxy are per-series pair count and sums of x, y, x*x, x*y; where the x are all equal the
+    minimum-norm solution is used, as np.linalg.lstsq gives. NaN where n is 0.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        det = n * sxx - sx * sx
+        slope = (n * sxy - sx * sy) / det
+        fitted = (sy - slope * sx) / n + slope * last
+        mean_x, mean_y = sx / n, sy / n
+        min_norm = mean_y / (1 + mean_x * mean_x) * (1 + mean_x * last)
+    return np.where(det != 0, fitted, min_norm)
+
+
+def nearest_mondays(dates: np.ndarray) -> np.ndarray:
+    """round_to_nearest_monday over a datetime64[D] array (ties, on Thursdays, go back)."""
+    # 1970-01-01 was a Thursday, so Monday is weekday 0 below
+    weekday = (dates.astype(np.int64) + 3) % 7
+    back, forward = weekday, (7 - weekday) % 7
+    return np.where(back <= forward, dates - back.astype('timedelta64[D]'), dates + forward.astype('timedelta64[D]'))
+
+
+def forecast_next_surveys(ccns: list, states: list) -> dict:
+    """ml_forecast for many CCNs at once, vectorized over their survey_history segments.
+
+    Each CCN with at least three unique survey dates gets the AR(1) least-squares fit interval_t = a + b * interval_{t-1}
+    (minimum-norm solution when its intervals are all equal, as np.linalg.lstsq gives); two dates give that one
+    interval; fewer use compute_fallback_interval_days for its county/state (computed once per area). The next date
+    is the last survey plus the interval, rounded to the nearest Monday.
+    Returns arrays keyed 'forecast_date', 'predicted_days', 'method' ('ar1', 'median' or 'fallback'), in input order.
+    """
+    count = len(ccns)
+    positions = np.array([survey_history['positions'].get(c, -1) if survey_history and c else -1 for c in ccns], dtype=np.int64)
+    known = positions >= 0
+    starts = np.zeros(count, dtype=np.int64)
+    lengths = np.zeros(count, dtype=np.int64)
+    if known.any():
+        starts[known] = survey_history['offsets'][positions[known]]
+        lengths[known] = survey_history['offsets'][positions[known] + 1] - starts[known]
+    segment = np.repeat(np.arange(count), lengths)
+    days = survey_history['dates'][concatenated_ranges(starts, lengths)].astype('datetime64[D]').astype(np.int64) if len(segment) else np.empty(0, dtype=np.int64)
+
+    # Intervals within each CCN, then consecutive (previous, next) interval pairs
+    same = segment[1:] == segment[:-1]
+    intervals = np.maximum(1, np.diff(days))[same].astype(float)
+    interval_segment = segment[1:][same]
+    n_intervals = np.bincount(interval_segment, minlength=count)
+    last = np.zeros(count)
+    is_last = np.append(interval_segment[1:] != interval_segment[:-1], True) if len(intervals) else np.empty(0, dtype=bool)
+    last[interval_segment[is_last]] = intervals[is_last]
+    paired = interval_segment[1:] == interval_segment[:-1]
+    x, y, pair_segment = intervals[:-1][paired], intervals[1:][paired], interval_segment[1:][paired]
+    n = np.bincount(pair_segment, minlength=count).astype(float)
+    sx = np.bincount(pair_segment, weights=x, minlength=count)
+    sy = np.bincount(pair_segment, weights=y, minlength=count)
+    sxx = np.bincount(pair_segment, weights=x * x, minlength=count)
+    sxy = np.bincount(pair_segment, weights=x * y, minlength=count)
+
+    predicted = last.copy()
+    ar1 = n_intervals >= 2
+    predicted[ar1] = ar1_next_interval(n, sx, sy, sxx, sxy, last)[ar1]
+    predicted_days = seasonal_interval_days(predicted)
+    method = np.where(ar1, 'ar1', np.where(n_intervals == 1, 'median', 'fallback')).astype(object)
+
+    fallback_cache, anchor_cache = {}, {}
+    for i in np.flatnonzero(n_intervals == 0):
+        key = (ccn_county_name(ccns[i]), states[i])
+        if key not in fallback_cache:
+            fallback_cache[key] = area_fallback_interval_days(*key)
+        predicted_days[i] = fallback_cache[key]
+
+    # Count from the last survey, or the state's anchor date for CCNs with no survey at all
+    anchors = np.empty(count, dtype='datetime64[D]')
+    has_dates = lengths > 0
+    if has_dates.any():
+        anchors[has_dates] = survey_history['dates'][starts[has_dates] + lengths[has_dates] - 1].astype('datetime64[D]')
+    for i in np.flatnonzero(~has_dates):
+        if states[i] not in anchor_cache:
+            anchor_cache[states[i]] = np.datetime64(forecast_anchor_date(states[i]).date(), 'D')
+        anchors[i] = anchor_cache[states[i]]
+    forecast = nearest_mondays(anchors + predicted_days.astype('timedelta64[D]'))
+    return {'forecast_date': pd.DatetimeIndex(forecast), 'predicted_days': predicted_days, 'method': method}
+
+# Every CCN's ml_forecast, precomputed per dataset version (see build_forecast_table / precompute_forecasts.py).
+# ATHENA_FORECASTS: 'build' (default) loads the saved table when it matches the data and rebuilds it otherwise,
+# 'file' only loads the saved table (served with stale=true if the data has changed since), 'off' skips it.
+FORECAST_TABLE_MODE = os.getenv('ATHENA_FORECASTS', 'build').strip().lower()
+FORECAST_TABLE_PATH = os.path.join(SNAPSHOT_DIR, 'forecasts.feather')
+FORECAST_WORKERS = int(os.getenv('ATHENA_FORECAST_WORKERS', '1'))
+FORECAST_CHUNK_CCNS = 2000
+FORECAST_METHODS = ('ar1', 'median', 'fallback')
+forecast_table = {}
+
+def _forecast_chunk(chunk):
+    """Process-pool task: forecast_next_surveys for one (ccns, states) chunk, as plain arrays."""
+    ccns, states = chunk
+    result = forecast_next_surveys(ccns, states)
+    return (result['forecast_date'].to_numpy(dtype='datetime64[D]'), result['predicted_days'].astype(np.int16),
+            np.array([FORECAST_METHODS.index(m) for m in result['method']], dtype=np.int8))
+
+def build_forecast_table(workers: int = 1):
+    """Forecast every CCN with a survey history or a provider_info row, each with its own state for the fallback.
+
+    With workers > 1 the chunks run in a fork-based process pool (children inherit the loaded data);
+    where fork is unavailable they run in this process.
+    """
+    global forecast_table
+    started = time.perf_counter()
+    home = dict(zip(survey_history['positions'], survey_history['home_states'])) if survey_history else {}
+    if provider_info_data is not None and 'State' in provider_info_data.columns:
+        providers = provider_info_data.dropna(subset=[CCN_KEY]).drop_duplicates(subset=[CCN_KEY])
+        for ccn, state in zip(providers[CCN_KEY], providers['State'].astype(str).str.strip()):
+            if not home.get(ccn):
+                home[ccn] = state
+    ccns = sorted(home)
+    states = [home[c] for c in ccns]
+    chunks = [(ccns[i:i + FORECAST_CHUNK_CCNS], states[i:i + FORECAST_CHUNK_CCNS]) for i in range(0, len(ccns), FORECAST_CHUNK_CCNS)]
+    if workers > 1 and len(chunks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            parts = list(pool.map(_forecast_chunk, chunks))
+    else:
+        parts = [_forecast_chunk(chunk) for chunk in chunks]
+    forecast_table = {
+        'dataset_version': data_load_stats.get('dataset_version'),
+        'built_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'positions': {ccn: i for i, ccn in enumerate(ccns)},
+        'states': np.array([normalize_state_input(s) if s else '' for s in states], dtype=object),
+        'forecast_date': np.concatenate([p[0] for p in parts]) if parts else np.empty(0, dtype='datetime64[D]'),
+        'predicted_days': np.concatenate([p[1] for p in parts]) if parts else np.empty(0, dtype=np.int16),
+        'method': np.concatenate([p[2] for p in parts]) if parts else np.empty(0, dtype=np.int8),
+    }
+    print(f"Built forecast table ({len(ccns)} facilities, {max(1, workers)} worker(s)) in {time.perf_counter() - started:.2f}s")
+
+def write_forecast_table():
+    """Save forecast_table next to the data snapshot: a Feather table plus a JSON note of its dataset version."""
+    if not forecast_table:
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    frame = pd.DataFrame({
+        'ccn': list(forecast_table['positions']),
+        'state': forecast_table['states'],
+        'forecast_date': forecast_table['forecast_date'].astype('datetime64[ns]'),
+        'predicted_days': forecast_table['predicted_days'],
+        'method': forecast_table['method'],
+    })
+    tmp_path = f'{FORECAST_TABLE_PATH}.{os.getpid()}.tmp'
+    frame.to_feather(tmp_path)
+    os.replace(tmp_path, FORECAST_TABLE_PATH)
+    with open(f'{FORECAST_TABLE_PATH}.{os.getpid()}.json.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'dataset_version': forecast_table['dataset_version'], 'built_at': forecast_table['built_at'], 'rows': len(frame)}, f, indent=2)
+    os.replace(f'{FORECAST_TABLE_PATH}.{os.getpid()}.json.tmp', f'{FORECAST_TABLE_PATH}.json')
+    print(f"✓ Wrote forecast table ({len(frame)} facilities) to {FORECAST_TABLE_PATH}")
+
+def load_forecast_table() -> bool:
+    """Read the saved forecast table into forecast_table (whatever dataset version it was built for)."""
+    global forecast_table
+    try:
+        with open(f'{FORECAST_TABLE_PATH}.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        frame = pd.read_feather(FORECAST_TABLE_PATH)
+    except Exception:
+        return False
+    forecast_table = {
+        'dataset_version': meta.get('dataset_version'),
+        'built_at': meta.get('built_at'),
+        'positions': {ccn: i for i, ccn in enumerate(frame['ccn'])},
+        'states': frame['state'].to_numpy(dtype=object),
+        'forecast_date': frame['forecast_date'].to_numpy(dtype='datetime64[D]'),
+        'predicted_days': frame['predicted_days'].to_numpy(dtype=np.int16),
+        'method': frame['method'].to_numpy(dtype=np.int8),
+    }
+    return True
+
+def load_or_build_forecast_table():
+    """Apply FORECAST_TABLE_MODE after a data load (needs the dataset version stamped by reset_response_cache)."""
+    global forecast_table
+    forecast_table = {}
+    if FORECAST_TABLE_MODE == 'off':
+        return
+    if load_forecast_table():
+        current = forecast_table['dataset_version'] == data_load_stats.get('dataset_version')
+        if current or FORECAST_TABLE_MODE == 'file':
+            print(f"Loaded forecast table built {forecast_table['built_at']}" + ("" if current else " (stale: data has changed since)"))
+            return
+    if FORECAST_TABLE_MODE == 'file':
+        forecast_table = {}
+        print(f"Warning: no forecast table at {FORECAST_TABLE_PATH}; run precompute_forecasts.py")
+        return
+    build_forecast_table(FORECAST_WORKERS)
+    if snapshot_enabled():
+        try:
+            write_forecast_table()
+        except Exception as e:
+            print(f"Warning: Failed to write forecast table: {e}")
+
+def precomputed_forecast(ccn_norm: Optional[str], state: str) -> Optional[dict]:
+    """The ml_forecast response from forecast_table, or None when the CCN is not in it or its fallback was for another state."""
+    position = forecast_table['positions'].get(ccn_norm) if forecast_table and ccn_norm else None
+    if position is None:
+        return None
+    method = FORECAST_METHODS[forecast_table['method'][position]]
+    # Only the fallback interval (and the anchor of a CCN with no survey) depends on the requested state
+    if method == 'fallback' and forecast_table['states'][position] != (normalize_state_input(state) if state else ''):
+        return None
+    return {
+        'forecast_date': str(forecast_table['forecast_date'][position]),
+        'predicted_days': int(forecast_table['predicted_days'][position]),
+        'method': method,
+        'precomputed': True,
+        'dataset_version': forecast_table['dataset_version'],
+        'stale': forecast_table['dataset_version'] != data_load_stats.get('dataset_version'),
+    }
+
 @app.route('/api/facility/<facility_id>')
 def get_facility_details(facility_id):
     """API endpoint to get detailed information for a specific facility"""
@@ -1048,20 +1890,12 @@ def get_facility_details(facility_id):
         return jsonify({'error': 'Data not loaded'}), 500
     
     try:
-        # Try to find facility by different possible ID columns
-        id_columns = ['CCN', 'ccn', 'CMS Certification Number', 'Provider ID', 'Facility ID']
-        id_col = None
-        
-        for col in id_columns:
-            if col in facilities_data.columns:
-                id_col = col
-                break
-        
-        if id_col is None:
-            return jsonify({'error': 'ID column not found'}), 500
-        
-        # Find the facility
-        facility = facilities_data[facilities_data[id_col] == facility_id]
+        # CCNs resolve through the CCN index; other ID columns still need a scan
+        facility = rows_for_ccn('facilities', normalize_ccn_value(facility_id))
+        if len(facility) == 0:
+            id_col = next((c for c in ['Provider ID', 'Facility ID'] if c in facilities_data.columns), None)
+            if id_col is not None:
+                facility = facilities_data[facilities_data[id_col] == facility_id]
         
         if len(facility) == 0:
             return jsonify({'error': 'Facility not found'}), 404
@@ -1069,6 +1903,8 @@ def get_facility_details(facility_id):
         # Convert to dictionary
         facility_dict = {}
         for col in facility.iloc[0].index:
+            if col in DERIVED_COLUMNS:
+                continue
             if pd.isna(facility.iloc[0][col]):
                 facility_dict[col] = None
             else:
@@ -1076,23 +1912,19 @@ def get_facility_details(facility_id):
         
         # Add county/parish data from provider_info_data if available
         if provider_info_data is not None:
-            ccn_cols = ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']
-            ccn_col = next((c for c in ccn_cols if c in provider_info_data.columns), None)
-            
-            if ccn_col:
-                facility_ccn = str(facility.iloc[0].get('CCN', ''))
-                if facility_ccn and facility_ccn != 'N/A':
-                    provider_match = provider_info_data[provider_info_data[ccn_col].astype(str) == facility_ccn]
-                    if not provider_match.empty:
-                        provider_row = provider_match.iloc[0]
+            facility_ccn = facility.iloc[0][CCN_KEY]
+            if pd.notna(facility_ccn):
+                provider_match = rows_for_ccn('provider_info', facility_ccn)
+                if not provider_match.empty:
+                    provider_row = provider_match.iloc[0]
                         
-                        # Look for county/parish columns
-                        county_cols = ['County/Parish', 'County', 'county', 'COUNTY', 'County Name', 'county_name']
-                        county_col = next((c for c in county_cols if c in provider_row.index), None)
+                    # Look for county/parish columns
+                    county_cols = ['County/Parish', 'County', 'county', 'COUNTY', 'County Name', 'county_name']
+                    county_col = next((c for c in county_cols if c in provider_row.index), None)
                         
-                        if county_col and not pd.isna(provider_row[county_col]):
-                            facility_dict['County/Parish'] = str(provider_row[county_col])
-                            print(f"Added county data for facility {facility_ccn}: {provider_row[county_col]}")
+                    if county_col and not pd.isna(provider_row[county_col]):
+                        facility_dict['County/Parish'] = str(provider_row[county_col])
+                        print(f"Added county data for facility {facility_ccn}: {provider_row[county_col]}")
         
         return jsonify(facility_dict)
         
@@ -1100,6 +1932,58 @@ def get_facility_details(facility_id):
         print(f"Error getting facility details: {e}")
         return jsonify({'error': str(e)}), 500
 
+def provider_names_section(ccn):
+    """/api/provider-names body and status: every provider name recorded for a CCN in any loaded frame."""
+    # Normalize CCN
+    ccn_normalized = normalize_ccn_value(ccn)
+    
+    # Collect all provider names from different sources
+    provider_names = set()
+    
+    # 1. From provider_info_data
+    if provider_info_data is not None:
+        ccn_cols = ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']
+        ccn_col = next((c for c in ccn_cols if c in provider_info_data.columns), None)
+        if ccn_col:
+            names_cols = ['Provider Name', 'provider_name']
+            names_col = next((c for c in names_cols if c in provider_info_data.columns), None)
+            if names_col:
+                matches = rows_for_ccn('provider_info', ccn_normalized)
+                for name in matches[names_col].dropna():
+                    provider_names.add(str(name).strip())
+    
+    # 2. From deficiencies_data
+    if deficiencies_data is not None:
+        ccn_cols = ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']
+        ccn_col = next((c for c in ccn_cols if c in deficiencies_data.columns), None)
+        if ccn_col:
+            names_cols = ['Provider Name', 'Facility Name', 'provider_name', 'facility_name']
+            names_col = next((c for c in names_cols if c in deficiencies_data.columns), None)
+            if names_col:
+                matches = rows_for_ccn('deficiencies', ccn_normalized)
+                for name in matches[names_col].dropna():
+                    provider_names.add(str(name).strip())
+    
+    # 3. From facilities_data
+    ccn_cols = ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']
+    ccn_col = next((c for c in ccn_cols if c in facilities_data.columns), None)
+    if ccn_col:
+        names_cols = ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']
+        names_col = next((c for c in names_cols if c in facilities_data.columns), None)
+        if names_col:
+            matches = rows_for_ccn('facilities', ccn_normalized)
+            for name in matches[names_col].dropna():
+                provider_names.add(str(name).strip())
+    
+    # Return as sorted list (most recent first - this is heuristic, could be improved with dates)
+    provider_names_list = sorted(list(provider_names))
+    
+    return {
+        'ccn': ccn,
+        'provider_names': provider_names_list,
+        'count': len(provider_names_list)
+    }, 200
+
 @app.route('/api/provider-names/<ccn>')
 def get_provider_names_for_ccn(ccn):
     """Get all historical provider names for a given CCN across all survey data sources."""
@@ -1109,55 +1993,8 @@ def get_provider_names_for_ccn(ccn):
         return jsonify({'error': 'Data not loaded'}), 500
     
     try:
-        # Normalize CCN
-        ccn_normalized = str(ccn).strip().lstrip('0').zfill(6)
-        
-        # Collect all provider names from different sources
-        provider_names = set()
-        
-        # 1. From provider_info_data
-        if provider_info_data is not None:
-            ccn_cols = ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']
-            ccn_col = next((c for c in ccn_cols if c in provider_info_data.columns), None)
-            if ccn_col:
-                names_cols = ['Provider Name', 'provider_name']
-                names_col = next((c for c in names_cols if c in provider_info_data.columns), None)
-                if names_col:
-                    matches = provider_info_data[provider_info_data[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6) == ccn_normalized]
-                    for name in matches[names_col].dropna():
-                        provider_names.add(str(name).strip())
-        
-        # 2. From deficiencies_data
-        if deficiencies_data is not None:
-            ccn_cols = ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']
-            ccn_col = next((c for c in ccn_cols if c in deficiencies_data.columns), None)
-            if ccn_col:
-                names_cols = ['Provider Name', 'Facility Name', 'provider_name', 'facility_name']
-                names_col = next((c for c in names_cols if c in deficiencies_data.columns), None)
-                if names_col:
-                    matches = deficiencies_data[deficiencies_data[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6) == ccn_normalized]
-                    for name in matches[names_col].dropna():
-                        provider_names.add(str(name).strip())
-        
-        # 3. From facilities_data
-        ccn_cols = ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']
-        ccn_col = next((c for c in ccn_cols if c in facilities_data.columns), None)
-        if ccn_col:
-            names_cols = ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']
-            names_col = next((c for c in names_cols if c in facilities_data.columns), None)
-            if names_col:
-                matches = facilities_data[facilities_data[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6) == ccn_normalized]
-                for name in matches[names_col].dropna():
-                    provider_names.add(str(name).strip())
-        
-        # Return as sorted list (most recent first - this is heuristic, could be improved with dates)
-        provider_names_list = sorted(list(provider_names))
-        
-        return jsonify({
-            'ccn': ccn,
-            'provider_names': provider_names_list,
-            'count': len(provider_names_list)
-        })
+        body, status = provider_names_section(ccn)
+        return jsonify(body), status
         
     except Exception as e:
         print(f"Error getting provider names for CCN: {e}")
@@ -1203,7 +2040,7 @@ def get_columns():
         return jsonify({'error': 'Data not loaded'}), 500
     
     try:
-        columns = list(facilities_data.columns)
+        columns = [c for c in facilities_data.columns if c not in DERIVED_COLUMNS]
         return jsonify({'columns': columns, 'count': len(columns)})
         
     except Exception as e:
@@ -1220,7 +2057,7 @@ def get_sample_data():
     
     try:
         # Get first few rows as sample
-        sample = facilities_data.head(5)
+        sample = facilities_data.head(5).drop(columns=list(DERIVED_COLUMNS), errors='ignore')
         sample_list = []
         
         for _, row in sample.iterrows():
@@ -1235,13 +2072,132 @@ def get_sample_data():
         return jsonify({
             'sample': sample_list,
             'total_rows': len(facilities_data),
-            'columns': list(facilities_data.columns)
+            'columns': list(sample.columns)
         })
         
     except Exception as e:
         print(f"Error getting sample data: {e}")
         return jsonify({'error': str(e)}), 500
 
+def survey_dates_section(state, ccn_norm, facility_name, by_name=True):
+    """/api/survey-dates body and status for a facility identified by its canonical CCN and name.
+
+    A CCN with dated rows in the state is listed from its merged survey history; otherwise the state's rows are matched
+    by facility_name. Without a CCN the rows are matched on the name alone, or nothing is listed when by_name is False.
+    """
+    survey_date_columns = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
+    survey_date_col = next((c for c in survey_date_columns if c in facilities_data.columns), None)
+    if survey_date_col is None:
+        print(f"Survey date column not found. Available columns: {list(facilities_data.columns)}")
+        return {'error': 'Survey date column not found'}, 500
+    state_col = next((c for c in FACILITY_STATE_COLUMNS if c in facilities_data.columns), None)
+    if state_col is None:
+        return {'error': 'State column not found'}, 500
+
+    def rows_with_survey_date(df, state_normalized):
+        in_state = df[state_col].astype(str).str.strip().str.upper() == state_normalized
+        return df[in_state & df[SURVEY_DATE_KEY].notna()]
+
+    name_cols = ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']
+    state_normalized = normalize_state_input(state)
+    # CCN rows come straight from the index; the state scan is only needed for name matching
+    ccn_matched = rows_with_survey_date(rows_for_ccn('facilities', ccn_norm), state_normalized)
+    matched_by_ccn = len(ccn_matched) > 0
+    if ccn_norm:
+        print(f"Looking for survey dates for CCN: {ccn_norm} in state: {state}")
+        if matched_by_ccn:
+            matching_facilities = ccn_matched
+            print(f"Found {len(matching_facilities)} rows matching CCN {ccn_norm}")
+        else:
+            # Fallback: match by Provider Name within the state if CCN matching failed
+            print(f"No rows found with CCN {ccn_norm}, falling back to name matching")
+            matching_facilities = rows_with_survey_date(state_rows('facilities', state), state_normalized)
+            for name_col in name_cols:
+                if name_col in matching_facilities.columns:
+                    name_matched = matching_facilities[matching_facilities[name_col].astype(str).str.strip() == facility_name]
+                    if len(name_matched) > 0:
+                        matching_facilities = name_matched
+                        print(f"Found {len(matching_facilities)} rows matching by name: {facility_name}")
+                        break
+    elif by_name:
+        print(f"Filtering by name - state: {state}, name: {facility_name}")
+        matching_facilities = rows_with_survey_date(state_rows('facilities', state), state_normalized)
+        if facility_name:
+            for name_col in name_cols:
+                if name_col in matching_facilities.columns:
+                    matching_facilities = matching_facilities[matching_facilities[name_col].astype(str).str.strip() == facility_name]
+                    break
+        print(f"Rows after name filtering: {len(matching_facilities)}")
+    else:
+        # Cannot find matching facility; return empty list with 200 so frontend can render a friendly message
+        return {
+            'survey_dates': [],
+            'facility': None,
+            'facility_name': None,
+            'state': state,
+            'count': 0
+        }, 200
+    
+    # A facility found by CCN is listed straight from its merged survey history (facilities rows first, then
+    # dates only the deficiencies have); rows matched by name are listed first and the CCN's history fills in
+    survey_dates = []
+    facility_names_set = set()
+    if not matched_by_ccn:
+        in_window = matching_facilities[matching_facilities[IN_TIMELINE_KEY]]
+        for date_str, facility_name_value, state_value, row_ccn in zip(
+            in_window[SURVEY_DATE_KEY].dt.strftime('%Y-%m-%d'),
+            column_values(in_window, ['Provider Name', 'provider_name'], 'N/A'),
+            column_values(in_window, ['State', 'state'], 'N/A'),
+            in_window[CCN_KEY],
+        ):
+            if facility_name_value and str(facility_name_value).strip():
+                facility_names_set.add(str(facility_name_value).strip())
+            survey_dates.append({
+                'date': date_str,
+                'facility_name': facility_name_value,
+                'state': state_value,
+                'ccn': row_ccn if pd.notna(row_ccn) else ccn_norm
+            })
+    
+    if ccn_norm:
+        span = survey_history_span(ccn_norm)
+        in_timeline = survey_history['in_timeline'][span]
+        listed = {d['date'] for d in survey_dates}
+        for date_str, name_code, state_code in zip(
+            pd.DatetimeIndex(survey_history['dates'][span][in_timeline]).strftime('%Y-%m-%d'),
+            survey_history['name_codes'][span][in_timeline],
+            survey_history['state_codes'][span][in_timeline],
+        ):
+            if date_str in listed:
+                continue
+            history_name = survey_history['names'][name_code]
+            if history_name and str(history_name).strip():
+                facility_names_set.add(str(history_name).strip())
+            survey_dates.append({
+                'date': date_str,
+                'facility_name': history_name,
+                'state': survey_history['states'][state_code] if state_code >= 0 else state,
+                'ccn': ccn_norm
+            })
+        print(f"Read survey history for CCN {ccn_norm}")
+    
+    # Sort dates chronologically
+    survey_dates.sort(key=lambda x: x['date'])
+    
+    print(f"Found {len(survey_dates)} survey dates")
+    print(f"Survey dates: {[d['date'] for d in survey_dates]}")
+    
+    facility_names_list = sorted(facility_names_set) if facility_names_set else ([facility_name] if facility_name else [])
+
+    return {
+        'survey_dates': survey_dates,
+        'facility': ccn_norm,
+        'facility_name': facility_name,
+        'facility_names': facility_names_list,
+        'state': state,
+        'count': len(survey_dates)
+    }, 200
+
 @app.route('/api/survey-dates/<state>/<facility_id>')
 def get_survey_dates(state, facility_id):
     """API endpoint to get survey dates for a specific facility - uses CCN to aggregate all dates across all sources"""
@@ -1254,14 +2210,6 @@ def get_survey_dates(state, facility_id):
         return jsonify({'error': 'Data not loaded'}), 500
     
     try:
-        def normalize_ccn(value):
-            if value is None or (isinstance(value, float) and math.isnan(value)):
-                return None
-            s = str(value).strip()
-            if not s:
-                return None
-            return s.lstrip('0').zfill(6)
-
         # Optional precise identifiers from query params
         query_ccn = request.args.get('ccn')
         forced_county = request.args.get('county')
@@ -1285,9 +2233,9 @@ def get_survey_dates(state, facility_id):
             if state_col is None:
                 return jsonify({'error': 'State column not found'}), 500
             
-            # Normalize state input (convert name to code if needed) and match case-insensitively
+            # Normalize state input (convert name to code if needed) and take that state's partition
             state_normalized = normalize_state_input(state)
-            state_facilities = facilities_data[facilities_data[state_col].astype(str).str.strip().str.upper() == state_normalized]
+            state_facilities = state_rows('facilities', state)
             print(f"State matching: looking for '{state}' (normalized: '{state_normalized}'), found {len(state_facilities)} facilities")
             if 0 <= facility_index < len(state_facilities):
                 facility = state_facilities.iloc[facility_index]
@@ -1319,264 +2267,27 @@ def get_survey_dates(state, facility_id):
         if facility is not None:
             print(f"Found facility row via id lookup")
         
-        # Look for survey date columns
-        survey_date_columns = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
-        survey_date_col = None
-        
-        for col in survey_date_columns:
-            if col in facilities_data.columns:
-                survey_date_col = col
-                print(f"Found survey date column: {col}")
-                break
-        
-        if survey_date_col is None:
-            print(f"Survey date column not found. Available columns: {list(facilities_data.columns)}")
-            return jsonify({'error': 'Survey date column not found'}), 500
-        
-        # Prepare variables for response metadata
+        # Identify the facility by the query params, falling back to the facility row
         facility_identifier = None
-        facility_identifier_norm = None
         facility_name = None
-        
-        # If query params provided, use them; otherwise derive from facility row
         if query_ccn:
             facility_identifier = str(query_ccn)
-        elif facility is not None:
+        else:
             for col in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
                 if col in facility.index and not pd.isna(facility[col]):
                     facility_identifier = str(facility[col])
                     break
-
-        facility_identifier_norm = normalize_ccn(facility_identifier)
-        if facility_identifier_norm:
-            facility_identifier = facility_identifier_norm
-        
-        # Get the facility name
         if query_name:
             facility_name = str(query_name).strip()
-        elif facility is not None:
+        else:
             for col in ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']:
                 if col in facility.index and not pd.isna(facility[col]):
                     facility_name = str(facility[col]).strip()
                     break
-        
-        # If query params were provided, build matching set from them first
-        if (query_ccn or query_name):
-            print(f"Filtering by query params - state: {state}, ccn: {facility_identifier}, name: {facility_name}")
-            # Determine state column
-            state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-            state_col = None
-            for col in state_columns:
-                if col in facilities_data.columns:
-                    state_col = col
-                    break
-            if state_col is None:
-                return jsonify({'error': 'State column not found'}), 500
-            # Normalize state input and match case-insensitively
-            state_normalized = normalize_state_input(state)
-            state_filtered = facilities_data[facilities_data[state_col].astype(str).str.strip().str.upper() == state_normalized]
-            matching_facilities = state_filtered[
-                (state_filtered[survey_date_col].notna()) & 
-                (state_filtered[survey_date_col] != '') &
-                (state_filtered[survey_date_col] != 'nan')
-            ]
-            if facility_identifier_norm:
-                ccn_columns = [c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in matching_facilities.columns]
-                if ccn_columns:
-                    ccn_col = ccn_columns[0]
-                    ccn_matched = matching_facilities[
-                        matching_facilities[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6) == facility_identifier_norm
-                    ]
-                    # If CCN matching found results, use them; otherwise fall back to name matching
-                    if len(ccn_matched) > 0:
-                        matching_facilities = ccn_matched
-                    elif facility_name:
-                        # Fallback to name matching if CCN didn't match
-                        print(f"No rows found with CCN {facility_identifier_norm}, falling back to name matching")
-                        for col in ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']:
-                            if col in matching_facilities.columns:
-                                name_matched = matching_facilities[matching_facilities[col].astype(str).str.strip() == facility_name]
-                                if len(name_matched) > 0:
-                                    matching_facilities = name_matched
-                                    break
-            elif facility_name:
-                for col in ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']:
-                    if col in matching_facilities.columns:
-                        matching_facilities = matching_facilities[matching_facilities[col].astype(str).str.strip() == facility_name]
-                        break
-            print(f"Rows after query-param filtering: {len(matching_facilities)}")
-        elif facility_identifier_norm:
-            print(f"Looking for survey dates for CCN: {facility_identifier_norm} in state: {state}")
-            
-            # Find all rows with survey dates that match this exact facility
-            # First filter by state to narrow down the search
-            state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-            state_col = None
-            for col in state_columns:
-                if col in facilities_data.columns:
-                    state_col = col
-                    break
-            
-            if state_col is None:
-                return jsonify({'error': 'State column not found'}), 500
-            
-            # Filter by state first (normalize state input)
-            state_normalized = normalize_state_input(state)
-            state_filtered = facilities_data[facilities_data[state_col].astype(str).str.strip().str.upper() == state_normalized]
-            print(f"Found {len(state_filtered)} rows for state '{state}' (normalized: '{state_normalized}')")
-            
-            # Then filter by facility identifier (CCN) and name to get exact matches
-            matching_facilities = state_filtered[
-                (state_filtered[survey_date_col].notna()) & 
-                (state_filtered[survey_date_col] != '') &
-                (state_filtered[survey_date_col] != 'nan')
-            ]
-            ccn_columns = [c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in matching_facilities.columns]
-            if ccn_columns:
-                ccn_col = ccn_columns[0]
-                # Filter by CCN - normalize both sides for comparison
-                matching_facilities_ccn_normalized = matching_facilities[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-                ccn_matched = matching_facilities[matching_facilities_ccn_normalized == facility_identifier_norm]
-                # If CCN matching found results, use them; otherwise fall back to name matching
-                if len(ccn_matched) > 0:
-                    matching_facilities = ccn_matched
-                    print(f"Found {len(matching_facilities)} rows matching CCN {facility_identifier_norm}")
-                else:
-                    # Fallback: match by Provider Name if CCN matching failed
-                    print(f"No rows found with CCN {facility_identifier_norm}, falling back to name matching")
-                    name_cols = ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']
-                    for name_col in name_cols:
-                        if name_col in matching_facilities.columns:
-                            name_matched = matching_facilities[matching_facilities[name_col].astype(str).str.strip() == facility_name]
-                            if len(name_matched) > 0:
-                                matching_facilities = name_matched
-                                print(f"Found {len(matching_facilities)} rows matching by name: {facility_name}")
-                                break
-            else:
-                # No CCN column available, match by name
-                print(f"No CCN column found, matching by Provider Name")
-                name_cols = ['Provider Name', 'provider_name', 'Facility Name', 'facility_name', 'Name', 'name']
-                for name_col in name_cols:
-                    if name_col in matching_facilities.columns:
-                        name_matched = matching_facilities[matching_facilities[name_col].astype(str).str.strip() == facility_name]
-                        if len(name_matched) > 0:
-                            matching_facilities = name_matched
-                            print(f"Found {len(matching_facilities)} rows matching by name: {facility_name}")
-                            break
-            
-        else:
-            # Cannot find matching facility; return empty list with 200 so frontend can render a friendly message
-            return jsonify({
-                'survey_dates': [],
-                'facility': None,
-                'facility_name': query_name or None,
-                'state': state,
-                'count': 0
-            })
-        
-        # Process survey dates for the matching facilities
-        survey_dates = []
-        facility_names_set = set()
-        for _, row in matching_facilities.iterrows():
-            try:
-                # Try to parse the date
-                date_str = str(row[survey_date_col])
-                if date_str and date_str != 'nan' and date_str != 'None':
-                    # Try different date formats
-                    parsed_date = None
-                    date_formats = ['%Y-%m-%d', '%m/%d/%Y', '%Y/%m/%d', '%m-%d-%Y']
-                    
-                    for fmt in date_formats:
-                        try:
-                            parsed_date = pd.to_datetime(date_str, format=fmt)
-                            break
-                        except:
-                            continue
-                    
-                    if parsed_date is None:
-                        # Try pandas automatic parsing
-                        parsed_date = pd.to_datetime(date_str, errors='coerce')
-                    
-                    if parsed_date is not None and not pd.isna(parsed_date):
-                        # Check if date is within our timeline range (2016-2025)
-                        if pd.Timestamp('2016-01-01') <= parsed_date <= pd.Timestamp('2027-12-31'):
-                            facility_name_value = row.get('Provider Name', row.get('provider_name', 'N/A'))
-                            if facility_name_value and str(facility_name_value).strip():
-                                facility_names_set.add(str(facility_name_value).strip())
-
-                            row_ccn = None
-                            for ccn_col_name in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-                                if ccn_col_name in row.index and not pd.isna(row[ccn_col_name]):
-                                    row_ccn = normalize_ccn(row[ccn_col_name])
-                                    break
-                            row_ccn = row_ccn or facility_identifier_norm
-
-                            survey_dates.append({
-                                'date': parsed_date.strftime('%Y-%m-%d'),
-                                'facility_name': facility_name_value,
-                                'state': row.get('State', row.get('state', 'N/A')),
-                                'ccn': row_ccn
-                            })
-            except Exception as e:
-                print(f"Error parsing date {row[survey_date_col]}: {e}")
-                continue
-        
-        # Also check deficiencies_data for this CCN if available
-        if deficiencies_data is not None and facility_identifier_norm:
-            print(f"Checking deficiencies data for CCN: {facility_identifier_norm}")
-            # Normalize CCN
-            ccn_normalized = facility_identifier_norm
-            
-            # Find CCN column in deficiencies_data
-            ccn_cols = ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']
-            def_ccn_col = next((c for c in ccn_cols if c in deficiencies_data.columns), None)
-            
-            if def_ccn_col and 'Survey Date' in deficiencies_data.columns:
-                # Filter deficiencies by CCN
-                deficiencies_matches = deficiencies_data[
-                    deficiencies_data[def_ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6) == ccn_normalized
-                ]
-                
-                # Get unique survey dates
-                name_cols = ['Provider Name', 'Facility Name', 'provider_name', 'facility_name']
-                name_col = next((c for c in name_cols if c in deficiencies_data.columns), 'Provider Name')
-                
-                for _, row in deficiencies_matches.iterrows():
-                    date_str = str(row['Survey Date'])
-                    if date_str and date_str not in ['nan', 'None', '']:
-                        parsed_date = pd.to_datetime(date_str, errors='coerce')
-                        if parsed_date is not None and not pd.isna(parsed_date):
-                            if pd.Timestamp('2016-01-01') <= parsed_date <= pd.Timestamp('2027-12-31'):
-                                date_str_formatted = parsed_date.strftime('%Y-%m-%d')
-                                # Only add if not already in the list
-                                if not any(d['date'] == date_str_formatted for d in survey_dates):
-                                    deficiency_name = str(row.get(name_col, 'N/A'))
-                                    if deficiency_name and deficiency_name.strip():
-                                        facility_names_set.add(deficiency_name.strip())
-                                    survey_dates.append({
-                                        'date': date_str_formatted,
-                                        'facility_name': deficiency_name,
-                                        'state': state,
-                                        'ccn': ccn_normalized
-                                    })
-                print(f"Added deficiency records for CCN {ccn_normalized}")
-        
-        # Sort dates chronologically
-        survey_dates.sort(key=lambda x: x['date'])
-        
-        print(f"Found {len(survey_dates)} survey dates")
-        print(f"Survey dates: {[d['date'] for d in survey_dates]}")
-        
-        facility_names_list = sorted(facility_names_set) if facility_names_set else ([facility_name] if facility_name else [])
-
-        return jsonify({
-            'survey_dates': survey_dates,
-            'facility': facility_identifier_norm,
-            'facility_name': facility_name,
-            'facility_names': facility_names_list,
-            'state': state,
-            'count': len(survey_dates)
-        })
+
+        body, status = survey_dates_section(state, normalize_ccn_value(facility_identifier), facility_name,
+                                            by_name=bool(query_ccn or query_name))
+        return jsonify(body), status
         
     except Exception as e:
         print(f"Error getting survey dates: {e}")
@@ -1594,6 +2305,308 @@ def haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float
     return R * c
 
 
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+GEO_CELL_DEGREES = 0.5
+
+# Lat/lon grid over provider coordinates (one point per CCN), rebuilt after every load (see build_geo_index)
+geo_index = {}
+
+def haversine_miles_array(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Vectorized haversine_miles from one point to arrays of points (degrees in, miles out)."""
+    phi1, phi2 = np.radians(lat), np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons - lon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def build_geo_index():
+    """Bucket provider_info coordinates into GEO_CELL_DEGREES cells so radius queries only look at nearby cells."""
+    global geo_index
+    started = time.perf_counter()
+    if provider_info_data is None or not {'Latitude', 'Longitude'} <= set(provider_info_data.columns):
+        geo_index = {}
+        print("Warning: provider_info has no Latitude/Longitude; nearby peer index not built")
+        return
+    points = pd.DataFrame({
+        'ccn': provider_info_data[CCN_KEY],
+        'lat': pd.to_numeric(provider_info_data['Latitude'], errors='coerce'),
+        'lon': pd.to_numeric(provider_info_data['Longitude'], errors='coerce'),
+    }).dropna().drop_duplicates(subset=['ccn'])
+    lats = points['lat'].to_numpy(dtype=float)
+    lons = points['lon'].to_numpy(dtype=float)
+    cell_rows = np.floor(lats / GEO_CELL_DEGREES).astype(np.int64)
+    cell_cols = np.floor(lons / GEO_CELL_DEGREES).astype(np.int64)
+    cells = pd.Series(np.arange(len(points))).groupby([cell_rows, cell_cols]).indices if len(points) else {}
+    geo_index = {
+        'ccns': points['ccn'].to_numpy(dtype=object),
+        'lat': lats,
+        'lon': lons,
+        'cells': cells,
+        'positions': {ccn: i for i, ccn in enumerate(points['ccn'])},
+    }
+    print(f"Built nearby peer index ({len(points)} points, {len(cells)} cells) in {time.perf_counter() - started:.2f}s")
+
+def geo_index_rows_within(lat: float, lon: float, radius_miles: float):
+    """geo_index rows within radius_miles of (lat, lon) as (rows, distances), unordered."""
+    if not geo_index or not geo_index['cells']:
+        return _NO_ROWS, np.empty(0)
+    lat_span = radius_miles / MILES_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(min(89.0, abs(lat) + lat_span)))
+    lon_span = min(180.0, radius_miles / (MILES_PER_DEGREE_LAT * max(cos_lat, 1e-6)))
+    row_lo, row_hi = math.floor((lat - lat_span) / GEO_CELL_DEGREES), math.floor((lat + lat_span) / GEO_CELL_DEGREES)
+    col_lo, col_hi = math.floor((lon - lon_span) / GEO_CELL_DEGREES), math.floor((lon + lon_span) / GEO_CELL_DEGREES)
+    cells = geo_index['cells']
+    candidate_groups = [cells[(r, c)] for r in range(row_lo, row_hi + 1) for c in range(col_lo, col_hi + 1) if (r, c) in cells]
+    if not candidate_groups:
+        return _NO_ROWS, np.empty(0)
+    candidates = np.concatenate(candidate_groups)
+    distances = haversine_miles_array(lat, lon, geo_index['lat'][candidates], geo_index['lon'][candidates])
+    inside = distances <= radius_miles
+    return candidates[inside], distances[inside]
+
+def query_geo_index(lat: float, lon: float, radius_miles: float, k: Optional[int] = None):
+    """CCNs within radius_miles of (lat, lon) as (ccns, distances), nearest first, at most k."""
+    candidates, distances = geo_index_rows_within(lat, lon, radius_miles)
+    order = np.argsort(distances, kind='stable')
+    if k is not None:
+        order = order[:k]
+    return geo_index['ccns'][candidates[order]], distances[order]
+
+
+# /api/recent-nearby-surveys defaults: surveys of other facilities within this many miles in the last this many days
+RECENT_NEARBY_MILES = 25.0
+RECENT_NEARBY_DAYS = 30
+# survey_history position * SURVEY_KEY_SPAN + days since the earliest survey sorts every survey by CCN, then date
+SURVEY_KEY_SPAN = 1 << 20
+
+# survey_history as one sorted (CCN, date) key array plus the survey_history position of every geo_index point
+# (see build_survey_event_index)
+survey_event_index = {}
+
+def build_survey_event_index():
+    """Key every survey_history survey by (CCN position, day) so a facility's surveys in a date window are two bisects."""
+    global survey_event_index
+    started = time.perf_counter()
+    if not survey_history or not geo_index:
+        survey_event_index = {}
+        return
+    lengths = np.diff(survey_history['offsets'])
+    days = survey_history['dates'].astype('datetime64[D]').astype(np.int64)
+    history_positions = np.full(len(geo_index['ccns']), -1, dtype=np.int64)
+    for row, ccn in enumerate(geo_index['ccns']):
+        history_positions[row] = survey_history['positions'].get(ccn, -1)
+    # Offset from the earliest survey so every key stays inside its CCN's span, whatever the dates (pre-1970 included)
+    first_day = int(days.min()) if len(days) else 0
+    survey_event_index = {
+        'keys': np.repeat(np.arange(len(lengths), dtype=np.int64), lengths) * SURVEY_KEY_SPAN + (days - first_day),
+        'first_day': first_day,
+        'history_positions': history_positions,
+        'as_of': survey_history['dates'].max().astype('datetime64[D]') if len(days) else None,
+    }
+    print(f"Built survey event index ({len(days)} surveys, {int((history_positions >= 0).sum())} located facilities) in {time.perf_counter() - started:.2f}s")
+
+def recent_nearby_surveys(ccns: list, miles: float, days: int, as_of: np.datetime64) -> list:
+    """Per CCN, the surveys of other facilities within miles of it dated in the days up to as_of, newest first.
+
+    Neighbours come from the geo_index grid; every (CCN, neighbour) pair's date window is then found with one
+    searchsorted over survey_event_index keys for the whole list. None for a CCN without coordinates.
+    """
+    origins, rows, distances = [], [], []
+    located = [False] * len(ccns)
+    for i, ccn in enumerate(ccns):
+        row = geo_index['positions'].get(ccn) if ccn else None
+        if row is None:
+            continue
+        located[i] = True
+        near, miles_away = geo_index_rows_within(geo_index['lat'][row], geo_index['lon'][row], miles)
+        others = near != row
+        origins.append(np.full(int(others.sum()), i))
+        rows.append(near[others])
+        distances.append(miles_away[others])
+    results = [{'count': 0, 'facilities': 0, 'surveys': []} if found else None for found in located]
+    if not origins:
+        return results
+    origins, rows, distances = np.concatenate(origins), np.concatenate(rows), np.concatenate(distances)
+    positions = survey_event_index['history_positions'][rows]
+    surveyed = positions >= 0
+    origins, rows, distances, positions = origins[surveyed], rows[surveyed], distances[surveyed], positions[surveyed]
+    # Window bounds relative to the earliest survey, clipped to a CCN's span; a window ending before it is empty
+    end_day = int(as_of.astype(np.int64)) - survey_event_index['first_day']
+    if end_day < 0:
+        return results
+    base = positions * SURVEY_KEY_SPAN
+    starts = np.searchsorted(survey_event_index['keys'], base + max(end_day - days, 0), side='left')
+    stops = np.searchsorted(survey_event_index['keys'], base + min(end_day, SURVEY_KEY_SPAN - 1), side='right')
+    pair = np.repeat(np.arange(len(positions)), stops - starts)
+    events = concatenated_ranges(starts, stops - starts)
+    if not len(events):
+        return results
+    event_days = survey_history['dates'][events].astype('datetime64[D]')
+    order = np.lexsort((distances[pair], -event_days.astype(np.int64), origins[pair]))
+    pair, events, event_days = pair[order], events[order], event_days[order]
+    names = survey_history['names'][survey_history['name_codes'][events]]
+    for origin, ccn, name, date, days_ago, distance in zip(origins[pair].tolist(), geo_index['ccns'][rows[pair]].tolist(), names.tolist(),
+                                                            event_days.astype(str).tolist(), (as_of - event_days).astype(np.int64).tolist(),
+                                                            distances[pair].round(2).tolist()):
+        results[origin]['surveys'].append({'ccn': ccn, 'name': name, 'date': date, 'days_ago': days_ago, 'distance_miles': distance})
+    for result in results:
+        if result:
+            result['count'] = len(result['surveys'])
+            result['facilities'] = len({survey['ccn'] for survey in result['surveys']})
+    return results
+
+def recent_nearby_params(values) -> tuple:
+    """(miles, days, as_of) from request args or a JSON body, with the RECENT_NEARBY_* defaults; raises ValueError."""
+    miles = float(values['miles']) if values.get('miles') not in (None, '') else RECENT_NEARBY_MILES
+    days = int(values['days']) if values.get('days') not in (None, '') else RECENT_NEARBY_DAYS
+    as_of = np.datetime64(pd.Timestamp(values['as_of']).date(), 'D') if values.get('as_of') else survey_event_index.get('as_of')
+    if not (miles > 0) or days < 0:
+        raise ValueError('miles must be positive and days non-negative')
+    return miles, days, as_of
+
+@app.route('/api/recent-nearby-surveys/<ccn>')
+def get_recent_nearby_surveys(ccn):
+    """Surveys of other facilities within ?miles= (default 25) of this one in the ?days= (default 30) up to ?as_of=
+    (default the latest survey date in the data), newest first.
+    """
+    global facilities_data
+    if facilities_data is None:
+        return jsonify({'error': 'Data not loaded'}), 500
+    try:
+        try:
+            miles, days, as_of = recent_nearby_params(request.args)
+        except ValueError:
+            return jsonify({'error': 'miles must be a positive number, days a non-negative integer and as_of a date (YYYY-MM-DD)'}), 400
+        ccn_norm = normalize_ccn_value(ccn)
+        found = recent_nearby_surveys([ccn_norm], miles, days, as_of)[0] if survey_event_index and as_of is not None else None
+        if found is None:
+            return jsonify({'ccn': ccn_norm, 'located': False, 'count': 0, 'facilities': 0, 'surveys': []})
+        return jsonify({'ccn': ccn_norm, 'located': True, 'miles': miles, 'days': days, 'as_of': str(as_of),
+                        'since': str(as_of - np.timedelta64(days, 'D')), **found})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/recent-nearby-surveys/batch', methods=['POST'])
+def get_recent_nearby_surveys_batch():
+    """recent_nearby_surveys for a whole watchlist: { ccns: [...], miles?, days?, as_of? }.
+
+    Returns { miles, days, as_of, since, alerts: number of CCNs with any nearby survey, results: [{ ccn, located, count,
+    facilities, surveys }] } in request order.
+    """
+    global facilities_data
+    if facilities_data is None:
+        return jsonify({'error': 'Data not loaded'}), 500
+    try:
+        body = request.get_json(silent=True) or {}
+        requested = body.get('ccns')
+        if not isinstance(requested, list):
+            return jsonify({'error': 'ccns must be a list'}), 400
+        try:
+            miles, days, as_of = recent_nearby_params(body)
+        except ValueError:
+            return jsonify({'error': 'miles must be a positive number, days a non-negative integer and as_of a date (YYYY-MM-DD)'}), 400
+        ccns = [normalize_ccn_value(c) if isinstance(c, (str, int)) else None for c in requested]
+        found = recent_nearby_surveys(ccns, miles, days, as_of) if survey_event_index and as_of is not None else [None] * len(ccns)
+        results = [{'ccn': ccn, 'located': result is not None, **(result or {'count': 0, 'facilities': 0, 'surveys': []})}
+                   for ccn, result in zip(ccns, found)]
+        return jsonify({'miles': miles, 'days': days, 'as_of': str(as_of) if as_of is not None else None,
+                        'since': str(as_of - np.timedelta64(days, 'D')) if as_of is not None else None,
+                        'alerts': sum(1 for r in results if r['count']), 'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def zip_peer_survey_dates_section(state, selected, county=None):
+    """/api/zip-peer-survey-dates body and status: survey dates of the other facilities in the selected facilities row's
+    County/Parish (looked up in provider_info unless county is given)."""
+    state_col = next((c for c in FACILITY_STATE_COLUMNS if c in facilities_data.columns), None)
+    if state_col is None:
+        return {'error': 'State column not found'}, 500
+    state_normalized = normalize_state_input(state)
+    state_filtered = state_rows('facilities', state)
+
+    print(f"Selected facility CCN columns: {[c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in selected.index]}")
+    
+    # Extract County/Parish from provider_info_data
+    county_val = None
+    selected_ccn = None
+    if pd.notna(selected[CCN_KEY]):
+        selected_ccn = selected[CCN_KEY]
+        print(f"Selected CCN (normalized): {selected_ccn}")
+    
+    if not selected_ccn:
+        print("ERROR: No CCN found in selected facility")
+        return {'survey_dates': [], 'count': 0}, 200
+    
+    if selected_ccn:
+        # Look up county from provider_info_data using normalized CCN
+        provider_match = rows_for_ccn('provider_info', selected_ccn)
+        print(f"Provider matches found: {len(provider_match)}")
+        if not provider_match.empty:
+            # Try multiple county columns, normalized
+            for ccol in ['County/Parish', 'County', 'County Name', 'county_name']:
+                if ccol in provider_match.columns and pd.notna(provider_match.iloc[0][ccol]):
+                    county_val = str(provider_match.iloc[0][ccol]).strip()
+                    break
+            print(f"County found: {county_val}")
+    
+    if county:
+        county_val = county.strip()
+    if not county_val:
+        print(f"No county found, returning empty results")
+        return {'survey_dates': [], 'count': 0}, 200
+
+    # Find peers in same County/Parish within same state
+    # First, get all CCNs in the state from facilities_data
+    state_ccns = state_ccn_set(state)
+    
+    print(f"County/Parish: {county_val}, State CCNs: {len(state_ccns)}")
+    
+    # Find all facilities in the same county from the state's provider_info rows
+    prov = state_rows('provider_info', state)
+    target_norm = str(county_val).strip().lower().replace(' county','').replace(' parish','')
+    match_mask = pd.Series(False, index=prov.index)
+    for ccol in ['County/Parish', 'County', 'County Name', 'county_name']:
+        if ccol in prov.columns:
+            norm_col = prov[ccol].astype(str).str.strip().str.lower().str.replace(' county','', regex=False).str.replace(' parish','', regex=False)
+            match_mask = match_mask | (norm_col == target_norm)
+    # Also filter by state to ensure we only get facilities in the correct state
+    prov_state_normalized = prov['State'].astype(str).str.strip().str.upper()
+    county_providers = prov[(match_mask) & (prov[CCN_KEY].isin(state_ccns)) & (prov_state_normalized == state_normalized)]
+    county_ccns = set(county_providers[CCN_KEY])
+    
+    print(f"Facilities in county '{county_val}' (normalized: '{target_norm}') in state '{state_normalized}': {len(county_ccns)}")
+    if len(county_ccns) > 0:
+        print(f"Sample county CCNs: {list(county_ccns)[:5]}")
+    
+    # Filter state_filtered to only include facilities in the same county
+    peers = state_filtered[state_filtered[CCN_KEY].isin(county_ccns)]
+    
+    print(f"Peer facilities after filtering: {len(peers)}")
+
+    # Collect all survey dates for these peers (parsed and window-checked at load)
+    print(f"Processing {len(peers)} peer facilities for survey dates...")
+    peers = peers[peers[IN_TIMELINE_KEY]]
+    results = [
+        {
+            'date': date_str,
+            'facility_name': facility_name_val,
+            'state': state_val,
+            'ccn': ccn_val if pd.notna(ccn_val) else 'N/A'
+        }
+        for date_str, facility_name_val, state_val, ccn_val in zip(
+            peers[SURVEY_DATE_KEY].dt.strftime('%Y-%m-%d'),
+            column_values(peers, ['Provider Name', 'provider_name'], 'N/A'),
+            peers[state_col].tolist(),
+            peers[CCN_KEY],
+        )
+    ]
+    
+    results.sort(key=lambda x: x['date'])
+    print(f"Total survey dates collected for peers: {len(results)}")
+    return {'survey_dates': results, 'count': len(results), 'county': county_val}, 200
+
 @app.route('/api/zip-peer-survey-dates/<state>/<facility_id>')
 def get_zip_peer_survey_dates(state, facility_id):
     """Timeline 1: For selected facility, find other facilities in same County/Parish and return their Health Survey Dates."""
@@ -1612,202 +2625,65 @@ def get_zip_peer_survey_dates(state, facility_id):
             return jsonify({'error': 'Survey date column not found'}), 500
 
         # Determine state col
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
+        state_col = next((c for c in FACILITY_STATE_COLUMNS if c in facilities_data.columns), None)
         if state_col is None:
             return jsonify({'error': 'State column not found'}), 500
 
-        # Locate selected facility row within state (normalize state input)
-        state_normalized = normalize_state_input(state)
-        state_filtered = facilities_data[facilities_data[state_col].astype(str).str.strip().str.upper() == state_normalized]
-        print(f"State filtering: '{state}' -> '{state_normalized}', found {len(state_filtered)} facilities")
-        selected = None
-        # Prefer CCN if provided
-        if query_ccn:
-            q_norm = str(query_ccn).strip().lstrip('0').zfill(6)
-            for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-                if idcol in state_filtered.columns:
-                    col_norm = state_filtered[idcol].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-                    tmp = state_filtered[col_norm == q_norm]
-                    if len(tmp) > 0:
-                        selected = tmp.iloc[0]
-                        break
-        if selected is None:
-            try:
-                idx = int(facility_id)
-                if 0 <= idx < len(state_filtered):
-                    selected = state_filtered.iloc[idx]
-            except ValueError:
-                pass
-        if selected is None:
-            # fallback by facility_id matching CCN
-            for idcol in ['CCN', 'ccn', 'CMS Certification Number']:
-                if idcol in state_filtered.columns:
-                    tmp = state_filtered[state_filtered[idcol].astype(str) == str(facility_id)]
-                    if len(tmp) > 0:
-                        selected = tmp.iloc[0]
-                        break
+        # Locate selected facility row within state, preferring the CCN if provided
+        selected = select_state_facility(state, facility_id, query_ccn, id_columns=['CCN', 'ccn', 'CMS Certification Number'])
         if selected is None:
             print("ERROR: Selected facility is None")
             return jsonify({'survey_dates': [], 'count': 0})
 
-        print(f"Selected facility CCN columns: {[c for c in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)'] if c in selected.index]}")
-        
-        # Extract County/Parish from provider_info_data
-        county_val = None
-        selected_ccn = None
-        for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-            if idcol in selected.index and pd.notna(selected[idcol]):
-                selected_ccn = str(selected[idcol]).strip().lstrip('0').zfill(6)
-                print(f"Selected CCN: {selected[idcol]} -> Normalized: {selected_ccn}")
-                break
-        
-        if not selected_ccn:
-            print("ERROR: No CCN found in selected facility")
-            return jsonify({'survey_dates': [], 'count': 0})
-        
-        if selected_ccn:
-            # Look up county from provider_info_data using normalized CCN
-            ccn_col = 'CMS Certification Number (CCN)'
-            if ccn_col in provider_info_data.columns:
-                prov = provider_info_data.copy()
-                prov['CCN_STR'] = prov[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-                provider_match = prov[prov['CCN_STR'] == selected_ccn]
-                print(f"Provider matches found: {len(provider_match)}")
-                if not provider_match.empty:
-                    # Try multiple county columns, normalized
-                    for ccol in ['County/Parish', 'County', 'County Name', 'county_name']:
-                        if ccol in provider_match.columns and pd.notna(provider_match.iloc[0][ccol]):
-                            county_val = str(provider_match.iloc[0][ccol]).strip()
-                            break
-                    print(f"County found: {county_val}")
-        
-        if forced_county:
-            county_val = forced_county.strip()
-        if not county_val:
-            print(f"No county found, returning empty results")
-            return jsonify({'survey_dates': [], 'count': 0})
-
-        # Find peers in same County/Parish within same state
-        # First, get all CCNs in the state from facilities_data
-        state_ccns = set()
-        for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-            if idcol in state_filtered.columns:
-                state_ccns.update(state_filtered[idcol].astype(str).str.strip().str.lstrip('0').str.zfill(6))
-        
-        print(f"County/Parish: {county_val}, State CCNs: {len(state_ccns)}")
-        
-        # Find all facilities in the same county from provider_info_data
-        prov = provider_info_data.copy()
-        prov['CCN_STR'] = prov[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-        target_norm = str(county_val).strip().lower().replace(' county','').replace(' parish','')
-        match_mask = pd.Series([False]*len(prov))
-        for ccol in ['County/Parish', 'County', 'County Name', 'county_name']:
-            if ccol in prov.columns:
-                norm_col = prov[ccol].astype(str).str.strip().str.lower().str.replace(' county','', regex=False).str.replace(' parish','', regex=False)
-                match_mask = match_mask | (norm_col == target_norm)
-        # Also filter by state to ensure we only get facilities in the correct state
-        prov_state_normalized = prov['State'].astype(str).str.strip().str.upper()
-        county_providers = prov[(match_mask) & (prov['CCN_STR'].isin(state_ccns)) & (prov_state_normalized == state_normalized)]
-        county_ccns = set(county_providers['CCN_STR'].astype(str))
-        
-        print(f"Facilities in county '{county_val}' (normalized: '{target_norm}') in state '{state_normalized}': {len(county_ccns)}")
-        if len(county_ccns) > 0:
-            print(f"Sample county CCNs: {list(county_ccns)[:5]}")
-        
-        # Filter state_filtered to only include facilities in the same county
-        peers = state_filtered.copy()
-        # Find CCN column for normalization
-        ccn_col_peer = None
-        for idcol_peer in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-            if idcol_peer in peers.columns:
-                ccn_col_peer = idcol_peer
-                break
-        if ccn_col_peer:
-            peers['CCN_NORM'] = peers[ccn_col_peer].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-            peers = peers[peers['CCN_NORM'].isin(county_ccns)]
-        else:
-            print("Warning: No CCN column found for peer filtering")
-            peers = peers.iloc[0:0]  # Empty dataframe
-        
-        print(f"Peer facilities after filtering: {len(peers)}")
-
-        # Collect all survey dates for these peers
-        results = []
-        print(f"Processing {len(peers)} peer facilities for survey dates...")
-        for idx, (_, row) in enumerate(peers.iterrows()):
-            date_str = str(row.get(survey_date_col, ''))
-            if not date_str or date_str == 'nan' or date_str == 'None' or date_str == '':
-                if idx < 3:  # Debug first few
-                    print(f"  Row {idx}: No valid survey date (value: '{date_str}')")
-                continue
-            parsed = pd.to_datetime(date_str, errors='coerce')
-            if parsed is not None and not pd.isna(parsed):
-                if pd.Timestamp('2016-01-01') <= parsed <= pd.Timestamp('2027-12-31'):
-                    # Extract CCN from various possible column names
-                    ccn_val = None
-                    for ccn_col_name in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-                        if ccn_col_name in row.index and pd.notna(row[ccn_col_name]):
-                            ccn_val = str(row[ccn_col_name]).strip().lstrip('0').zfill(6)
-                            break
-                    
-                    facility_name_val = row.get('Provider Name', row.get('provider_name', 'N/A'))
-                    results.append({
-                        'date': parsed.strftime('%Y-%m-%d'),
-                        'facility_name': facility_name_val,
-                        'state': row.get(state_col, 'N/A'),
-                        'ccn': ccn_val if ccn_val else 'N/A'
-                    })
-                    if len(results) <= 5:  # Debug first few
-                        print(f"  Added survey date: {parsed.strftime('%Y-%m-%d')} for {facility_name_val}")
-                else:
-                    if idx < 3:
-                        print(f"  Row {idx}: Date {parsed} outside range (2016-2027)")
-            else:
-                if idx < 3:
-                    print(f"  Row {idx}: Could not parse date '{date_str}'")
-        
-        results.sort(key=lambda x: x['date'])
-        print(f"Total survey dates collected for peers: {len(results)}")
-        return jsonify({'survey_dates': results, 'count': len(results), 'county': county_val})
+        body, status = zip_peer_survey_dates_section(state, selected, forced_county)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/nearby-peer-survey-dates/<state>/<facility_id>')
 def get_nearby_peer_survey_dates(state, facility_id):
-    """Timeline 2: facilities within 60 miles of selected facility's lat/lon; return their Health Survey Dates."""
+    """Timeline 2: facilities within radius_miles (default 60) of selected facility's lat/lon; return their Health Survey Dates.
+
+    Optional query params: radius_miles, k (keep only the k nearest facilities). Also returns the peers nearest first.
+    """
     global facilities_data, provider_info_data
     
     if facilities_data is None or provider_info_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     try:
         query_ccn = request.args.get('ccn')
+        try:
+            radius_miles = float(request.args.get('radius_miles') or 60.0)
+            k = int(request.args['k']) if request.args.get('k') else None
+        except ValueError:
+            return jsonify({'error': 'radius_miles must be a number and k an integer'}), 400
+        if not (radius_miles > 0) or (k is not None and k < 1):
+            return jsonify({'error': 'radius_miles and k must be positive'}), 400
         # Required columns in provider_info
         required_cols = ['CMS Certification Number (CCN)', 'Latitude', 'Longitude']
         for col in required_cols:
             if col not in provider_info_data.columns:
                 return jsonify({'error': f'Missing column in provider_info: {col}'}), 500
 
+        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
+        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
+        if state_col is None:
+            return jsonify({'error': 'State column not found'}), 500
+
         # Try to resolve coords directly from CCN if provided
         sel_info = None
-        if query_ccn:
-            sel_info = provider_info_data[provider_info_data['CMS Certification Number (CCN)'].astype(str) == str(query_ccn)]
+        query_ccn_norm = normalize_ccn_value(query_ccn)
+        if query_ccn_norm:
+            sel_info = rows_for_ccn('provider_info', query_ccn_norm)
         if sel_info is None or len(sel_info) == 0:
-            # Resolve through facilities_data selection
-            state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-            state_col = next((c for c in state_columns if c in facilities_data.columns), None)
-            if state_col is None:
-                return jsonify({'error': 'State column not found'}), 500
-            state_filtered = facilities_data[facilities_data[state_col] == state]
+            # Resolve through the state's facilities
+            state_filtered = state_rows('facilities', state)
             selected = None
-            if query_ccn:
-                for idcol in ['CCN', 'ccn', 'CMS Certification Number']:
-                    if idcol in state_filtered.columns:
-                        tmp = state_filtered[state_filtered[idcol].astype(str) == str(query_ccn)]
-                        if len(tmp) > 0:
-                            selected = tmp.iloc[0]
-                            break
+            if query_ccn_norm:
+                tmp = state_filtered[state_filtered[CCN_KEY] == query_ccn_norm]
+                if len(tmp) > 0:
+                    selected = tmp.iloc[0]
             if selected is None:
                 try:
                     idx = int(facility_id)
@@ -1825,38 +2701,17 @@ def get_nearby_peer_survey_dates(state, facility_id):
             if selected is None:
                 return jsonify({'survey_dates': [], 'count': 0})
             # Get CCN and find coords in provider_info
-            ccn = None
-            for idcol in ['CCN', 'ccn', 'CMS Certification Number']:
-                if idcol in selected.index and pd.notna(selected[idcol]):
-                    ccn = str(selected[idcol])
-                    break
-            sel_info = provider_info_data[provider_info_data['CMS Certification Number (CCN)'].astype(str) == str(ccn)]
+            sel_info = rows_for_ccn('provider_info', selected[CCN_KEY])
         if len(sel_info) == 0:
             return jsonify({'survey_dates': [], 'count': 0})
         lat = float(sel_info.iloc[0]['Latitude'])
         lon = float(sel_info.iloc[0]['Longitude'])
 
-        # Build candidate set (same state) with coords present
-        prov = provider_info_data.dropna(subset=['Latitude', 'Longitude']).copy()
-        # Map state from facilities_data: inner join on CCN
-        # Prepare small mapping CCN -> state
-        ccn_col_fd = next((c for c in ['CCN', 'ccn', 'CMS Certification Number'] if c in facilities_data.columns), None)
-        if ccn_col_fd is None:
-            return jsonify({'survey_dates': [], 'count': 0})
-        mapping = facilities_data[[ccn_col_fd, state_col]].dropna()
-        mapping[ccn_col_fd] = mapping[ccn_col_fd].astype(str)
-        prov['CCN_STR'] = prov['CMS Certification Number (CCN)'].astype(str)
-        prov = prov.merge(mapping, left_on='CCN_STR', right_on=ccn_col_fd, how='left')
-        prov = prov[prov[state_col] == state]
-
-        # Compute distance and filter <= 60 miles
-        def within_60(row):
-            try:
-                distance = haversine_miles(lat, lon, float(row['Latitude']), float(row['Longitude']))
-                return distance <= 60.0
-            except Exception as e:
-                return False
-        prov = prov[prov.apply(within_60, axis=1)]
+        # Nearest-first peers from the grid index, restricted to this state's facilities
+        near_ccns, near_miles = query_geo_index(lat, lon, radius_miles)
+        in_state = np.isin(near_ccns, list(state_ccn_set(state)))
+        near_ccns, near_miles = near_ccns[in_state][:k], near_miles[in_state][:k]
+        distance_by_ccn = dict(zip(near_ccns, near_miles.round(2).tolist()))
 
         # Get their survey dates from facilities_data
         survey_date_columns = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
@@ -1864,30 +2719,53 @@ def get_nearby_peer_survey_dates(state, facility_id):
         if survey_date_col is None:
             return jsonify({'error': 'Survey date column not found'}), 500
 
-        peer_ccns = set(prov['CCN_STR'].tolist())
-        cands = facilities_data[facilities_data[ccn_col_fd].astype(str).isin(peer_ccns)]
-        cands = cands[cands[state_col] == state]
-        results = []
-        for _, row in cands.iterrows():
-            date_str = str(row.get(survey_date_col, ''))
-            if not date_str or date_str == 'nan' or date_str == 'None':
-                continue
-            parsed = pd.to_datetime(date_str, errors='coerce')
-            if parsed is not None and not pd.isna(parsed):
-                if pd.Timestamp('2016-01-01') <= parsed <= pd.Timestamp('2027-12-31'):
-                    results.append({
-                        'date': parsed.strftime('%Y-%m-%d'),
-                        'facility_name': row.get('Provider Name', row.get('provider_name', 'N/A')),
-                        'state': row.get(state_col, 'N/A'),
-                        'ccn': str(row.get(ccn_col_fd, 'N/A'))
-                    })
+        cands = state_rows('facilities', state)
+        cands = cands[cands[CCN_KEY].isin(distance_by_ccn) & cands[IN_TIMELINE_KEY]]
+        results = [
+            {
+                'date': date_str,
+                'facility_name': facility_name_val,
+                'state': state_val,
+                'ccn': ccn_val if pd.notna(ccn_val) else 'N/A',
+                'distance_miles': distance_by_ccn.get(ccn_val)
+            }
+            for date_str, facility_name_val, state_val, ccn_val in zip(
+                cands[SURVEY_DATE_KEY].dt.strftime('%Y-%m-%d'),
+                column_values(cands, ['Provider Name', 'provider_name'], 'N/A'),
+                cands[state_col].tolist(),
+                cands[CCN_KEY],
+            )
+        ]
         results.sort(key=lambda x: x['date'])
-        return jsonify({'survey_dates': results, 'count': len(results)})
+        peers = [{'ccn': ccn, 'distance_miles': miles} for ccn, miles in distance_by_ccn.items()]
+        return jsonify({'survey_dates': results, 'count': len(results), 'peers': peers, 'radius_miles': radius_miles})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 # Forecast API endpoints
+def facility_survey_dates_section(facility):
+    """/api/facility-survey-dates body and status: every timeline survey date of a facilities row's CCN."""
+    if facility is None:
+        return {'survey_dates': [], 'count': 0}, 200
+    
+    # Get survey dates
+    survey_date_columns = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
+    survey_date_col = next((c for c in survey_date_columns if c in facilities_data.columns), None)
+    
+    if survey_date_col is None:
+        return {'survey_dates': [], 'count': 0}, 200
+    
+    # Every survey of the facility's CCN inside the timeline window, from the merged history
+    if pd.isna(facility[CCN_KEY]):
+        survey_dates = [facility[SURVEY_DATE_KEY].strftime('%Y-%m-%d')] if facility[IN_TIMELINE_KEY] else []
+    else:
+        span = survey_history_span(facility[CCN_KEY])
+        dates = survey_history['dates'][span][survey_history['in_timeline'][span]]
+        survey_dates = pd.DatetimeIndex(dates).strftime('%Y-%m-%d').tolist()
+    
+    return {'survey_dates': survey_dates, 'count': len(survey_dates)}, 200
+
 @app.route('/api/facility-survey-dates/<state>/<facility_id>')
 def get_facility_survey_dates(state, facility_id):
     """Get historical survey dates for a specific facility."""
@@ -1897,175 +2775,753 @@ def get_facility_survey_dates(state, facility_id):
     
     try:
         query_ccn = request.args.get('ccn')
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
+        state_col = next((c for c in FACILITY_STATE_COLUMNS if c in facilities_data.columns), None)
         
         if state_col is None:
             return jsonify({'error': 'State column not found'}), 500
         
-        # Filter by state
-        state_facilities = facilities_data[facilities_data[state_col] == state]
-        
-        # Find the facility
-        facility = None
-        if query_ccn:
-            for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-                if idcol in state_facilities.columns:
-                    tmp = state_facilities[state_facilities[idcol].astype(str) == str(query_ccn)]
-                    if len(tmp) > 0:
-                        facility = tmp.iloc[0]
-                        break
-        
-        if facility is None:
-            try:
-                idx = int(facility_id)
-                if 0 <= idx < len(state_facilities):
-                    facility = state_facilities.iloc[idx]
-            except ValueError:
-                pass
-        
-        if facility is None:
-            return jsonify({'survey_dates': [], 'count': 0})
-        
-        # Get survey dates
-        survey_date_columns = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
-        survey_date_col = next((c for c in survey_date_columns if c in facilities_data.columns), None)
-        
-        if survey_date_col is None:
-            return jsonify({'survey_dates': [], 'count': 0})
-        
-        survey_dates = []
-        date_str = str(facility.get(survey_date_col, ''))
-        if date_str and date_str != 'nan' and date_str != 'None':
-            parsed = pd.to_datetime(date_str, errors='coerce')
-            if parsed is not None and not pd.isna(parsed):
-                if pd.Timestamp('2016-01-01') <= parsed <= pd.Timestamp('2027-12-31'):
-                    survey_dates.append(parsed.strftime('%Y-%m-%d'))
-        
-        return jsonify({'survey_dates': survey_dates, 'count': len(survey_dates)})
+        # Find the facility by CCN, else by its position in the state
+        facility = select_state_facility(state, facility_id, query_ccn, id_columns=())
+        body, status = facility_survey_dates_section(facility)
+        return jsonify(body), status
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+GAP_PERCENTILES = (10, 25, 50, 75, 90)
+# The "2-year" intervals only count gaps ending this many days before the latest survey in the data
+RECENT_SURVEY_WINDOW_DAYS = 730
+
+# Days between consecutive distinct surveys of each CCN with per-CCN stats and state/county/ZIP percentile rollups,
+# rebuilt after every load (see build_survey_gap_table)
+survey_gap_table = {}
+
+def _gap_rollup(gaps: pd.DataFrame, members: pd.DataFrame, keys: list) -> dict:
+    """{key: {count, facilities, p10..p90}} over the gaps of each group's member CCNs, in one groupby."""
+    if gaps.empty or members.empty:
+        return {}
+    grouped_gaps = members.drop_duplicates().merge(gaps, on=CCN_KEY)
+    if grouped_gaps.empty:
+        return {}
+    grouped = grouped_gaps.groupby(keys, sort=False)
+    stats = grouped['days'].quantile([q / 100 for q in GAP_PERCENTILES]).unstack()
+    stats.columns = [f'p{q}' for q in GAP_PERCENTILES]
+    stats['count'] = grouped.size()
+    stats['facilities'] = grouped[CCN_KEY].nunique()
+    return stats.to_dict('index')
+
+def build_survey_gap_table():
+    """Gaps between each CCN's deduplicated, sorted survey dates via groupby().diff(), then every rollup at once.
+
+    Rollup membership follows the endpoints: a state is its facilities' CCNs, a county the state's provider_info
+    rows under that 'County/Parish', a ZIP the state's provider_info rows with that ZIP5.
+    """
+    global survey_gap_table
+    started = time.perf_counter()
+    if facilities_data is None or not state_partitions:
+        survey_gap_table = {}
+        return
+    surveys = facilities_data[[CCN_KEY, SURVEY_DATE_KEY]].dropna().drop_duplicates().sort_values([CCN_KEY, SURVEY_DATE_KEY])
+    gaps = pd.DataFrame({
+        CCN_KEY: surveys[CCN_KEY],
+        'end': surveys[SURVEY_DATE_KEY],
+        'days': surveys.groupby(CCN_KEY, sort=False)[SURVEY_DATE_KEY].diff().dt.days,
+    }).dropna(subset=['days']).reset_index(drop=True)
+    since = surveys[SURVEY_DATE_KEY].max() - pd.Timedelta(days=RECENT_SURVEY_WINDOW_DAYS) if len(surveys) else None
+    recent = gaps[gaps['end'] >= since] if since is not None else gaps.iloc[:0]
+
+    states, counties, zips = [], [], []
+    for code, part in state_partitions.items():
+        states.append(pd.DataFrame({'state': code, CCN_KEY: list(part['ccns'])}))
+        if provider_info_data is not None and len(part['provider_info']):
+            providers = provider_info_data.iloc[part['provider_info']]
+            if 'County/Parish' in providers.columns:
+                counties.append(pd.DataFrame({'state': code, 'county': providers['County/Parish'].to_numpy(), CCN_KEY: providers[CCN_KEY].to_numpy()}).dropna())
+            if ZIP_KEY in providers.columns:
+                zips.append(pd.DataFrame({'state': code, 'zip': providers[ZIP_KEY].to_numpy(), CCN_KEY: providers[CCN_KEY].to_numpy()}).dropna())
+    members = {
+        'state': pd.concat(states, ignore_index=True) if states else pd.DataFrame(columns=['state', CCN_KEY]),
+        'county': pd.concat(counties, ignore_index=True) if counties else pd.DataFrame(columns=['state', 'county', CCN_KEY]),
+        'zip': pd.concat(zips, ignore_index=True) if zips else pd.DataFrame(columns=['state', 'zip', CCN_KEY]),
+    }
+    per_ccn = gaps.groupby(CCN_KEY)['days'].agg(['median', 'mean', 'count'])
+    last_survey = surveys.groupby(CCN_KEY)[SURVEY_DATE_KEY].max()
+    per_ccn['last_survey'] = last_survey
+    survey_gap_table = {
+        'gaps': gaps,
+        'last_survey': last_survey,
+        'members': members,
+        'since': since,
+        'ccn': per_ccn,
+        'state': _gap_rollup(gaps, members['state'], ['state']),
+        'state_recent': _gap_rollup(recent, members['state'], ['state']),
+        'county': _gap_rollup(gaps, members['county'], ['state', 'county']),
+        'zip': _gap_rollup(gaps, members['zip'], ['state', 'zip']),
+    }
+    print(f"Built survey gap table ({len(gaps)} gaps over {len(per_ccn)} facilities; {len(survey_gap_table['state'])} states, "
+          f"{len(survey_gap_table['county'])} counties, {len(survey_gap_table['zip'])} ZIPs) in {time.perf_counter() - started:.2f}s")
+
+def observed_survey_intervals(since: Optional[pd.Timestamp] = None) -> pd.Series:
+    """Median days between consecutive distinct survey dates per CCN (CCNs with at least two surveys).
+
+    With since, only gaps ending on or after that date count (the survey before may be older).
+    """
+    if not survey_gap_table:
+        return pd.Series(dtype=float)
+    if since is None:
+        return survey_gap_table['ccn']['median']
+    gaps = survey_gap_table['gaps']
+    recent = gaps[gaps['end'] >= since]
+    return recent.groupby(CCN_KEY)['days'].median()
+
+def gap_interval_section(stats: Optional[dict], max_days: int):
+    """Interval endpoint body and status: average_days (median gap clamped to 30..max_days), gap count and percentiles for one rollup entry."""
+    if not stats:
+        return {'average_days': 365, 'count': 0}, 200
+    return {
+        'average_days': int(max(30, min(max_days, round(stats['p50'])))),
+        'count': int(stats['count']),
+        'facilities': int(stats['facilities']),
+        'percentiles': {f'p{q}': float(stats[f'p{q}']) for q in GAP_PERCENTILES},
+    }, 200
+
 @app.route('/api/state-average-interval/<state>')
 def get_state_average_interval(state):
-    """Calculate average time between surveys for facilities in a state."""
+    """Median days between consecutive surveys of the same facility, over all facilities in a state."""
     global facilities_data
     if facilities_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     
     try:
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
-        
-        if state_col is None:
-            return jsonify({'error': 'State column not found'}), 500
-        
-        # Filter by state
-        state_facilities = facilities_data[facilities_data[state_col] == state]
-        
-        # Get survey dates
-        survey_date_columns = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
-        survey_date_col = next((c for c in survey_date_columns if c in facilities_data.columns), None)
-        
-        if survey_date_col is None:
-            return jsonify({'average_days': 365, 'count': 0})
-        
-        intervals = []
-        for _, facility in state_facilities.iterrows():
-            date_str = str(facility.get(survey_date_col, ''))
-            if date_str and date_str != 'nan' and date_str != 'None':
-                parsed = pd.to_datetime(date_str, errors='coerce')
-                if parsed is not None and not pd.isna(parsed):
-                    if pd.Timestamp('2016-01-01') <= parsed <= pd.Timestamp('2027-12-31'):
-                        # Calculate days since 2016-01-01 as a proxy for interval
-                        days_since_start = (parsed - pd.Timestamp('2016-01-01')).days
-                        intervals.append(days_since_start)
-        
-        if len(intervals) < 2:
-            return jsonify({'average_days': 365, 'count': len(intervals)})
-        
-        # Calculate average interval (simplified - using median as proxy)
-        intervals.sort()
-        median_interval = intervals[len(intervals) // 2] if intervals else 365
-        average_days = max(30, min(1095, median_interval // 2))  # Between 1 month and 3 years
-        
-        return jsonify({'average_days': average_days, 'count': len(intervals)})
-        
+        body, status = gap_interval_section(survey_gap_table.get('state', {}).get(normalize_state_input(state)), 1095)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/zip-average-interval/<state>/<county>')
 def get_zip_average_interval(state, county):
-    """Calculate average time between surveys for facilities in a County/Parish."""
+    """Median days between consecutive surveys of the same facility, over facilities in a County/Parish."""
     global facilities_data, provider_info_data
     if facilities_data is None or provider_info_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     
     try:
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
-        
-        if state_col is None:
-            return jsonify({'error': 'State column not found'}), 500
-        
-        # Filter by state
-        state_facilities = facilities_data[facilities_data[state_col] == state]
-        
-        # Get all CCNs in the state
-        state_ccns = set()
-        for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-            if idcol in state_facilities.columns:
-                state_ccns.update(state_facilities[idcol].astype(str).str.strip().str.lstrip('0').str.zfill(6))
-        
-        # Find all facilities in the same county from provider_info_data
-        ccn_col = 'CMS Certification Number (CCN)'
-        county_providers = provider_info_data[
-            (provider_info_data['County/Parish'] == county) & 
-            (provider_info_data[ccn_col].astype(str).str.strip().isin(state_ccns))
-        ]
-        county_ccns = set(county_providers[ccn_col].astype(str).str.strip())
-        
-        # Filter state_facilities to only include facilities in the same county
-        county_facilities = state_facilities.copy()
-        for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-            if idcol in county_facilities.columns:
-                county_facilities['CCN_NORM'] = county_facilities[idcol].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-                county_facilities = county_facilities[county_facilities['CCN_NORM'].isin(county_ccns)]
+        body, status = gap_interval_section(survey_gap_table.get('county', {}).get((normalize_state_input(state), county)), 1095)
+        return jsonify(body), status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/survey-gap-stats/<state>')
+def get_survey_gap_stats(state):
+    """Survey-gap percentiles for a state, or one county (?county=), ZIP (?zip=) or facility (?ccn=) in it.
+
+    ?recent=1 limits a state to gaps ending in the last RECENT_SURVEY_WINDOW_DAYS of the data.
+    """
+    global facilities_data
+    if facilities_data is None:
+        return jsonify({'error': 'Data not loaded'}), 500
+    try:
+        code = normalize_state_input(state)
+        if request.args.get('ccn'):
+            ccn = normalize_ccn_value(request.args['ccn'])
+            per_ccn = survey_gap_table.get('ccn')
+            if per_ccn is None or ccn not in per_ccn.index:
+                return jsonify({'ccn': ccn, 'count': 0})
+            row = per_ccn.loc[ccn]
+            return jsonify({'ccn': ccn, 'count': int(row['count']), 'median_days': float(row['median']),
+                            'mean_days': round(float(row['mean']), 1), 'last_survey': row['last_survey'].strftime('%Y-%m-%d')})
+        if request.args.get('county'):
+            level, key = 'county', (code, request.args['county'])
+        elif request.args.get('zip'):
+            level, key = 'zip', (code, ''.join(ch for ch in request.args['zip'] if ch.isdigit())[:5])
+        else:
+            level, key = ('state_recent' if request.args.get('recent') in ('1', 'true') else 'state'), code
+        stats = survey_gap_table.get(level, {}).get(key)
+        if not stats:
+            return jsonify({'level': level, 'count': 0})
+        return jsonify({'level': level, 'count': int(stats['count']), 'facilities': int(stats['facilities']),
+                        'percentiles': {f'p{q}': float(stats[f'p{q}']) for q in GAP_PERCENTILES}})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Survey-window forecast: gap ECDFs are evaluated on days 0..ECDF_MAX_DAYS (longer gaps count as the last day)
+ECDF_MAX_DAYS = 1095
+ECDF_GRID = np.arange(ECDF_MAX_DAYS + 1)
+# Credibility weight of n gaps against the next level up is n / (n + ECDF_PRIOR_GAPS)
+ECDF_PRIOR_GAPS = 4
+ECDF_QUANTILES = (10, 50, 90)
+ECDF_CURVE_WEEKS = 78
+
+# Survey gaps sorted within each CCN, state and county (and nationally) for empirical CDFs plus the blended
+# county/state CDF of every area, rebuilt after every load (see build_gap_ecdf_table)
+gap_ecdf_table = {}
+
+def _sorted_gap_groups(gaps: pd.DataFrame, members: pd.DataFrame, keys: list):
+    """Gap days of each group's member CCNs (as in _gap_rollup), sorted within the group, plus {key: (start, end)}."""
+    if gaps.empty or members.empty:
+        return np.empty(0, dtype=np.int16), {}
+    grouped = members.drop_duplicates().merge(gaps[[CCN_KEY, 'days']], on=CCN_KEY)
+    if grouped.empty:
+        return np.empty(0, dtype=np.int16), {}
+    index = pd.MultiIndex.from_frame(grouped[keys]) if len(keys) > 1 else pd.Index(grouped[keys[0]])
+    codes, groups = index.factorize()
+    days = np.minimum(grouped['days'].to_numpy(), ECDF_MAX_DAYS).astype(np.int16)
+    order = np.lexsort((days, codes))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(groups)))])
+    return days[order], {key: (offsets[i], offsets[i + 1]) for i, key in enumerate(groups.tolist())}
+
+def build_gap_ecdf_table():
+    """Sort the survey_gap_table gaps once per CCN, state and county so any group's ECDF is one searchsorted.
+
+    Every level comes from the same survey-summary gaps, so a facility's own gaps and its area's are comparable.
+    """
+    global gap_ecdf_table
+    started = time.perf_counter()
+    if not survey_gap_table or not survey_history:
+        gap_ecdf_table = {}
+        return
+    gaps, members = survey_gap_table['gaps'], survey_gap_table['members']
+    national = np.sort(np.minimum(gaps['days'].to_numpy(), ECDF_MAX_DAYS).astype(np.int16))
+    # ccn_county_name for every CCN at once: the county on its first provider_info row
+    counties = {}
+    county_col = next((c for c in COUNTY_COLUMN_CANDIDATES if provider_info_data is not None and c in provider_info_data.columns), None)
+    if county_col:
+        first_rows = provider_info_data.dropna(subset=[CCN_KEY]).drop_duplicates(subset=[CCN_KEY])
+        counties = first_rows.set_index(CCN_KEY)[county_col].dropna().astype(str).to_dict()
+    gap_ecdf_table = {
+        'as_of': survey_history['dates'].max().astype('datetime64[D]') if len(survey_history['dates']) else None,
+        'counties': counties,
+        'last_survey': dict(zip(survey_gap_table['last_survey'].index, survey_gap_table['last_survey'].to_numpy(dtype='datetime64[D]'))),
+        'national': (national, {None: (0, len(national))}),
+        'ccn': _sorted_gap_groups(gaps, gaps[[CCN_KEY]], [CCN_KEY]),
+        'state': _sorted_gap_groups(gaps, members['state'], ['state']),
+        'county': _sorted_gap_groups(gaps, members['county'], ['state', 'county']),
+    }
+    # Every blend area_gap_ecdf can be asked for: each county with gaps, each state alone, and the nation as a last resort
+    areas = {(None, None): _blend_area_gap_ecdf(None, None)}
+    for code in gap_ecdf_table['state'][1]:
+        areas[(code, None)] = _blend_area_gap_ecdf(code, None)
+    for code, county in gap_ecdf_table['county'][1]:
+        areas[(code, county)] = _blend_area_gap_ecdf(code, county)
+    gap_ecdf_table['areas'] = areas
+    print(f"Built gap ECDF table ({len(national)} gaps; {len(gap_ecdf_table['state'][1])} states, "
+          f"{len(gap_ecdf_table['county'][1])} counties) in {time.perf_counter() - started:.2f}s")
+
+def gap_ecdf(level: str, key) -> tuple:
+    """(P(gap <= d) for every d in ECDF_GRID, gap count) for one group, or (None, 0) if it has no gaps."""
+    days, spans = gap_ecdf_table[level]
+    start, end = spans.get(key, (0, 0))
+    if end <= start:
+        return None, 0
+    return np.searchsorted(days[start:end], ECDF_GRID, side='right') / (end - start), int(end - start)
+
+def _blend_area_gap_ecdf(state_code: Optional[str], county: Optional[str]) -> tuple:
+    """County ECDF credibility-blended with its state's (the nation's if the state has none).
+
+    Returns (cdf, {county, state: weight}, {county, state: gap count}).
+    """
+    state_cdf, state_n = gap_ecdf('state', state_code) if state_code else (None, 0)
+    if state_cdf is None:
+        state_cdf, state_n = gap_ecdf('national', None)
+    county_cdf, county_n = gap_ecdf('county', (state_code, county)) if county else (None, 0)
+    county_weight = county_n / (county_n + ECDF_PRIOR_GAPS)
+    cdf = state_cdf if county_cdf is None else county_weight * county_cdf + (1 - county_weight) * state_cdf
+    return cdf, {'county': county_weight, 'state': 1 - county_weight}, {'county': county_n, 'state': state_n}
+
+def area_gap_ecdf(state_code: str, county: Optional[str]) -> tuple:
+    """The (state, county) blend precomputed by build_gap_ecdf_table; read-only, so safe from request threads.
+
+    A county without gaps gets its state's CDF and a state without gaps the nation's, as _blend_area_gap_ecdf would.
+    """
+    areas = gap_ecdf_table['areas']
+    return areas.get((state_code, county)) or areas.get((state_code, None)) or areas[(None, None)]
+
+def blended_gap_cdfs(ccns: list, state_codes: list) -> dict:
+    """The survey_window_forecast gap distribution for many CCNs at once: P(gap <= d) over ECDF_GRID, one row per CCN.
+
+    Each CCN's own gaps are counted into its row with one bincount, then credibility-blended with area_gap_ecdf for
+    its state code and provider_info county (rows are NaN where there is no gap data at all). Own and area gaps are
+    both survey-summary (standard survey) gaps from survey_gap_table; complaint and revisit dates that only appear in
+    the deficiency citations are left out, so frequent complaint visits do not pull the window forward.
+    Returns 'cdf', 'last' (last survey-summary survey, or forecast_anchor_date without one), 'has_survey', 'own_gaps',
+    'own_weight' arrays plus per-row 'area_weights' and 'area_counts' dicts.
+    """
+    count = len(ccns)
+    width = ECDF_MAX_DAYS + 1
+    ccn_days, ccn_spans = gap_ecdf_table['ccn']
+    spans = np.array([ccn_spans.get(c, (0, 0)) for c in ccns], dtype=np.int64).reshape(count, 2)
+    lengths = spans[:, 1] - spans[:, 0]
+    gaps = ccn_days[concatenated_ranges(spans[:, 0], lengths)].astype(np.int64)
+    gap_segment = np.repeat(np.arange(count), lengths)
+    own_gaps = np.bincount(gap_segment, minlength=count)
+    own_cdf = np.cumsum(np.bincount(gap_segment * width + gaps, minlength=count * width).reshape(count, width), axis=1) / np.maximum(own_gaps, 1)[:, None]
+    own_weight = own_gaps / (own_gaps + ECDF_PRIOR_GAPS)
+
+    counties = gap_ecdf_table['counties']
+    areas = [area_gap_ecdf(code, counties.get(c) if c else None) for c, code in zip(ccns, state_codes)]
+    area_cdf = np.array([cdf if cdf is not None else np.full(width, np.nan) for cdf, _, _ in areas]).reshape(count, width)
+    cdf = np.where(own_gaps[:, None] > 0, own_weight[:, None] * own_cdf + (1 - own_weight)[:, None] * area_cdf, area_cdf)
+
+    last_survey = gap_ecdf_table['last_survey']
+    has_survey = np.array([c in last_survey for c in ccns], dtype=bool)
+    last = np.empty(count, dtype='datetime64[D]')
+    last[has_survey] = [last_survey[c] for c, surveyed in zip(ccns, has_survey) if surveyed]
+    anchors = {}
+    for i in np.flatnonzero(~has_survey):
+        if state_codes[i] not in anchors:
+            anchors[state_codes[i]] = np.datetime64(forecast_anchor_date(state_codes[i]).date(), 'D')
+        last[i] = anchors[state_codes[i]]
+    return {'cdf': cdf, 'last': last, 'has_survey': has_survey, 'own_gaps': own_gaps, 'own_weight': own_weight,
+            'area_weights': [weights for _, weights, _ in areas], 'area_counts': [counts for _, _, counts in areas]}
+
+def gap_window_quantiles(cdf: np.ndarray, elapsed: np.ndarray) -> tuple:
+    """({q: days after the last survey} for ECDF_QUANTILES, survival) for each row of cdf, conditioned on gap > elapsed.
+
+    survival is P(gap > elapsed); past every observed gap (survival 0) the survey is due now, so every quantile is elapsed.
+    """
+    survival = 1 - cdf[np.arange(len(cdf)), np.minimum(elapsed, ECDF_MAX_DAYS)]
+    due_now = survival <= 1e-9
+    offsets = {}
+    for q in ECDF_QUANTILES:
+        target = (1 - survival) + (q / 100 - 1e-9) * survival
+        offsets[q] = np.where(due_now, elapsed, np.maximum((cdf < target[:, None]).sum(axis=1), elapsed + 1))
+    return offsets, survival
+
+def survey_window_forecast(ccn_norm: Optional[str], state: str) -> Optional[dict]:
+    """P10/P50/P90 dates and a weekly probability curve for the CCN's next survey.
+
+    The gap distribution is the facility's own survey-summary gaps credibility-blended with area_gap_ecdf (see
+    blended_gap_cdfs), conditioned on no survey having happened between its last survey and the latest survey date
+    in the data (as_of). A CCN with no survey counts from forecast_anchor_date, as ml_forecast does. None without any gap data.
+    """
+    if not gap_ecdf_table or gap_ecdf_table['as_of'] is None:
+        return None
+    position = survey_history['positions'].get(ccn_norm) if ccn_norm else None
+    state_code = normalize_state_input(state) if state else (str(survey_history['home_states'][position]).strip().upper() if position is not None else '')
+    blend = blended_gap_cdfs([ccn_norm], [state_code])
+    cdf = blend['cdf'][0]
+    if np.isnan(cdf).any():
+        return None
+
+    as_of = gap_ecdf_table['as_of']
+    last = blend['last'][0]
+    elapsed = int(max(0, (as_of - last).astype(int)))
+    offsets, survival = gap_window_quantiles(blend['cdf'], np.array([elapsed]))
+    survival = float(survival[0])
+
+    def conditional_cdf(days: np.ndarray) -> np.ndarray:
+        if survival <= 1e-9:
+            return (days >= elapsed).astype(float)
+        return np.where(days <= elapsed, 0.0, (cdf[np.clip(days, 0, ECDF_MAX_DAYS)] - (1 - survival)) / survival)
+
+    # Weeks start on the Monday on or before as_of (1970-01-01 was a Thursday)
+    first_monday = as_of - np.timedelta64(int((as_of.astype(np.int64) + 3) % 7), 'D')
+    cumulative = conditional_cdf((first_monday - last).astype(int) + 7 * np.arange(ECDF_CURVE_WEEKS + 1) - 1)
+    weekly = [{'week': str(first_monday + np.timedelta64(7 * i, 'D')), 'probability': round(float(p), 4), 'cumulative': round(float(c), 4)}
+              for i, (p, c) in enumerate(zip(np.diff(cumulative), cumulative[1:])) if p > 0 or c < 1]
+
+    own_weight = float(blend['own_weight'][0])
+    return {
+        'as_of': str(as_of),
+        'last_survey': str(last) if blend['has_survey'][0] else None,
+        'elapsed_days': elapsed,
+        'survival': round(survival, 4),
+        'quantiles': {f'p{q}': str(last + np.timedelta64(int(offsets[q][0]), 'D')) for q in ECDF_QUANTILES},
+        'weekly': weekly,
+        'weights': {'facility': round(own_weight, 4), **{k: round(w * (1 - own_weight), 4) for k, w in blend['area_weights'][0].items()}},
+        'gaps': {'facility': int(blend['own_gaps'][0]), **blend['area_counts'][0]},
+    }
+
+# /api/overdue lists facilities whose last standard survey is more than this many months old
+OVERDUE_THRESHOLD_MONTHS = 15
+STANDARD_SURVEY_COLUMN_CANDIDATES = ['Standard Deficiency', 'standard_deficiency', 'Standard Survey']
+
+# Per state, every facility's last standard survey with the facilities sorted oldest survey first (see build_overdue_table)
+overdue_table = {}
+
+def build_overdue_table():
+    """Last standard survey per CCN in one groupby over both frames, then each state's facilities sorted by it.
+
+    Survey-summary dates are standard surveys; a deficiency date counts when its row is flagged as a standard-survey
+    citation (a Y in 'Standard Deficiency'), or always if the file has no such column.
+    """
+    global overdue_table
+    started = time.perf_counter()
+    parts = []
+    if facilities_data is not None:
+        parts.append(facilities_data[[CCN_KEY, SURVEY_DATE_KEY]])
+    if deficiencies_data is not None:
+        flag_col = next((c for c in STANDARD_SURVEY_COLUMN_CANDIDATES if c in deficiencies_data.columns), None)
+        standard = deficiencies_data[flag_col].astype(str).str.strip().str.upper().isin(['Y', 'YES', 'TRUE', '1']) if flag_col else slice(None)
+        parts.append(deficiencies_data.loc[standard, [CCN_KEY, SURVEY_DATE_KEY]])
+    if not parts or not state_partitions:
+        overdue_table = {}
+        return
+    last_standard = pd.concat(parts, ignore_index=True).dropna().groupby(CCN_KEY)[SURVEY_DATE_KEY].max()
+    names = {}
+    if survey_history:
+        # Provider name at each CCN's latest survey of any kind
+        last_names = survey_history['names'][survey_history['name_codes'][survey_history['offsets'][1:] - 1]] if len(survey_history['dates']) else []
+        names = dict(zip(survey_history['positions'], last_names))
+    overdue_table = {}
+    for code, part in state_partitions.items():
+        ccns = pd.Series(sorted(part['ccns']), dtype=object)
+        last = ccns.map(last_standard)
+        surveyed = last.notna().to_numpy()
+        ccns, last = ccns[surveyed].to_numpy(dtype=object), last[surveyed].to_numpy(dtype='datetime64[D]')
+        order = np.argsort(last, kind='stable')
+        overdue_table[code] = {
+            'ccns': ccns[order],
+            'last': last[order],
+            'names': np.array([names.get(c, 'N/A') for c in ccns[order]], dtype=object),
+            'never_surveyed': int((~surveyed).sum()),
+        }
+    print(f"Built overdue table ({len(last_standard)} facilities with a standard survey, {len(overdue_table)} states) in {time.perf_counter() - started:.2f}s")
+
+@app.route('/api/overdue/<state>')
+@cached_response
+def get_overdue_facilities(state):
+    """Facilities in a state whose last standard survey is more than ?months= (default OVERDUE_THRESHOLD_MONTHS) before
+    ?as_of= (default the latest survey date in the data), most overdue first, each with its P10/P50/P90 next-survey window.
+
+    Optional ?limit= caps how many are listed (count still gives the total).
+    """
+    global facilities_data
+    if facilities_data is None:
+        return jsonify({'error': 'Data not loaded'}), 500
+
+    try:
+        try:
+            months = float(request.args['months']) if request.args.get('months') else OVERDUE_THRESHOLD_MONTHS
+            limit = int(request.args['limit']) if request.args.get('limit') else None
+            as_of = np.datetime64(pd.Timestamp(request.args['as_of']).date(), 'D') if request.args.get('as_of') else gap_ecdf_table.get('as_of')
+        except ValueError:
+            return jsonify({'error': 'months and limit must be numbers and as_of a date (YYYY-MM-DD)'}), 400
+        if months < 0 or (limit is not None and limit < 1):
+            return jsonify({'error': 'months must be non-negative and limit at least 1'}), 400
+
+        code = normalize_state_input(state)
+        table = overdue_table.get(code)
+        threshold_days = int(round(months * 365.25 / 12))
+        if table is None or as_of is None:
+            return jsonify({'state': code, 'threshold_days': threshold_days, 'count': 0, 'facilities': []})
+        # Oldest survey first, so the overdue facilities are the prefix surveyed before the cutoff date
+        count = int(np.searchsorted(table['last'], as_of - np.timedelta64(threshold_days, 'D'), side='left'))
+        shown = count if limit is None else min(count, limit)
+        ccns, last = table['ccns'][:shown], table['last'][:shown]
+        days_since = (as_of - last).astype(np.int64)
+
+        windows = [None] * shown
+        if shown and gap_ecdf_table:
+            blend = blended_gap_cdfs(list(ccns), [code] * shown)
+            # Anchored on the last standard survey listed, the same kind of survey the gap distribution measures
+            offsets, _ = gap_window_quantiles(blend['cdf'], np.maximum(0, (as_of - last).astype(np.int64)))
+            dates = {q: (last + offsets[q].astype('timedelta64[D]')).astype(str).tolist() for q in ECDF_QUANTILES}
+            valid = ~np.isnan(blend['cdf'][:, 0])
+            windows = [{f'p{q}': dates[q][i] for q in ECDF_QUANTILES} if valid[i] else None for i in range(shown)]
+        facilities = [{'ccn': ccn, 'name': name, 'last_standard_survey': str(date), 'days_since': since, 'days_overdue': since - threshold_days, 'window': window}
+                      for ccn, name, date, since, window in zip(ccns.tolist(), table['names'][:shown].tolist(), last, days_since.tolist(), windows)]
+        return jsonify({
+            'state': code,
+            'as_of': str(as_of),
+            'months': months,
+            'threshold_days': threshold_days,
+            'count': count,
+            'facilities_checked': len(table['ccns']) + table['never_surveyed'],
+            'never_surveyed': table['never_surveyed'],
+            'facilities': facilities,
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# /api/survey-waves: two deficiency-survey events are neighbours when within SURVEY_WAVE_MILES and SURVEY_WAVE_DAYS of
+# each other; an event with at least SURVEY_WAVE_MIN_EVENTS neighbours (itself included) is the core of a wave
+SURVEY_WAVE_MILES = 30.0
+SURVEY_WAVE_DAYS = 7
+SURVEY_WAVE_MIN_EVENTS = 4
+
+# National survey waves, rebuilt after every load (see build_survey_wave_table)
+survey_wave_table = {}
+
+def space_time_neighbour_pairs(lats: np.ndarray, lons: np.ndarray, days: np.ndarray, miles: float, max_days: int):
+    """Every pair (i < j) of points within miles and max_days of each other, as two index arrays.
+
+    Points are bucketed into a (day, lat, lon) grid whose cells are at least miles by max_days across, so a point's
+    neighbours are in the 27 cells around its own; each neighbouring cell is a searchsorted range of the sorted cell keys.
+    """
+    n = len(days)
+    if not n:
+        return _NO_ROWS, _NO_ROWS
+    lat_step = miles / MILES_PER_DEGREE_LAT
+    # Longitude degrees shrink towards the poles; size the columns for the highest latitude present
+    lon_step = miles / (MILES_PER_DEGREE_LAT * max(math.cos(math.radians(min(float(np.abs(lats).max()), 85.0))), 0.05))
+    cells = [np.floor(days / max(max_days, 1)).astype(np.int64), np.floor(lats / lat_step).astype(np.int64),
+             np.floor(lons / lon_step).astype(np.int64)]
+    # One padding cell on each side keeps the neighbouring keys from wrapping into another row
+    cells = [c - c.min() + 1 for c in cells]
+    sizes = [int(c.max()) + 2 for c in cells]
+    keys = (cells[0] * sizes[1] + cells[1]) * sizes[2] + cells[2]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    # Look up each occupied cell once; the targets stay sorted, which keeps searchsorted cache-friendly
+    occupied, cell_of = np.unique(keys, return_inverse=True)
+    left, right = [], []
+    for d_day in (-1, 0, 1):
+        for d_lat in (-1, 0, 1):
+            for d_lon in (-1, 0, 1):
+                target = occupied + (d_day * sizes[1] + d_lat) * sizes[2] + d_lon
+                cell_starts = np.searchsorted(sorted_keys, target, side='left')
+                starts = cell_starts[cell_of]
+                counts = (np.searchsorted(sorted_keys, target, side='right') - cell_starts)[cell_of]
+                i = np.repeat(np.arange(n), counts)
+                j = order[concatenated_ranges(starts, counts)]
+                near = (i < j) & (np.abs(days[i] - days[j]) <= max_days)
+                i, j = i[near], j[near]
+                near = haversine_miles_array(lats[i], lons[i], lats[j], lons[j]) <= miles
+                left.append(i[near])
+                right.append(j[near])
+    return np.concatenate(left), np.concatenate(right)
+
+def dbscan_labels(n: int, left: np.ndarray, right: np.ndarray, min_points: int) -> np.ndarray:
+    """DBSCAN cluster label per point (-1 for noise) from its neighbour pairs.
+
+    Cores (at least min_points neighbours counting themselves) joined by a pair form one cluster: each round hooks the
+    larger of a pair's two roots onto the smaller and then compresses every label to its root, until all core pairs share
+    a root. A border point joins its core neighbour's cluster with the smallest label.
+    """
+    degree = 1 + np.bincount(left, minlength=n) + np.bincount(right, minlength=n)
+    core = degree >= min_points
+    labels = np.arange(n)
+    linked = core[left] & core[right]
+    a, b = left[linked], right[linked]
+    while True:
+        roots_a, roots_b = labels[a], labels[b]
+        split = roots_a != roots_b
+        if not split.any():
+            break
+        np.minimum.at(labels, np.maximum(roots_a[split], roots_b[split]), np.minimum(roots_a[split], roots_b[split]))
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
                 break
-        
-        # Get survey dates
-        survey_date_columns = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
-        survey_date_col = next((c for c in survey_date_columns if c in facilities_data.columns), None)
-        
-        if survey_date_col is None:
-            return jsonify({'average_days': 365, 'count': 0})
-        
-        intervals = []
-        for _, facility in county_facilities.iterrows():
-            date_str = str(facility.get(survey_date_col, ''))
-            if date_str and date_str != 'nan' and date_str != 'None':
-                parsed = pd.to_datetime(date_str, errors='coerce')
-                if parsed is not None and not pd.isna(parsed):
-                    if pd.Timestamp('2016-01-01') <= parsed <= pd.Timestamp('2027-12-31'):
-                        days_since_start = (parsed - pd.Timestamp('2016-01-01')).days
-                        intervals.append(days_since_start)
-        
-        if len(intervals) < 2:
-            return jsonify({'average_days': 365, 'count': len(intervals)})
-        
-        intervals.sort()
-        median_interval = intervals[len(intervals) // 2] if intervals else 365
-        average_days = max(30, min(1095, median_interval // 2))
-        
-        return jsonify({'average_days': average_days, 'count': len(intervals)})
-        
+            labels = jumped
+    labels = np.where(core, labels, n)
+    for border, seed in ((left, right), (right, left)):
+        reached = ~core[border] & core[seed]
+        np.minimum.at(labels, border[reached], labels[seed[reached]])
+    return np.where(labels < n, labels, -1)
+
+def build_survey_wave_table():
+    """Cluster every deduplicated (CCN, survey date) in deficiencies_data nationally on (lat, lon, date) and index the
+    resulting waves by the states of their member facilities."""
+    global survey_wave_table
+    started = time.perf_counter()
+    if deficiencies_data is None or not geo_index:
+        survey_wave_table = {}
+        return
+    events = deficiencies_data[[CCN_KEY, SURVEY_DATE_KEY]].dropna().drop_duplicates()
+    rows = events[CCN_KEY].map(geo_index['positions'])
+    located = rows.notna().to_numpy()
+    rows = rows[located].to_numpy(dtype=np.int64)
+    dates = events[SURVEY_DATE_KEY].to_numpy(dtype='datetime64[D]')[located]
+    days = dates.astype(np.int64)
+    lats, lons = geo_index['lat'][rows], geo_index['lon'][rows]
+    left, right = space_time_neighbour_pairs(lats, lons, days, SURVEY_WAVE_MILES, SURVEY_WAVE_DAYS)
+    labels = dbscan_labels(len(days), left, right, SURVEY_WAVE_MIN_EVENTS)
+
+    state_of = {ccn: code for code, part in state_partitions.items() for ccn in part['ccns']}
+    names = {}
+    if survey_history and len(survey_history['dates']):
+        # Provider name at each CCN's latest survey
+        last_names = survey_history['names'][survey_history['name_codes'][survey_history['offsets'][1:] - 1]]
+        names = dict(zip(survey_history['positions'], last_names))
+    clustered = np.flatnonzero(labels >= 0)
+    clustered = clustered[np.lexsort((days[clustered], rows[clustered], labels[clustered]))]
+    wave_of, row_of = labels[clustered], rows[clustered]
+    # Boundaries of each wave's run and, within it, of each facility's run of survey dates
+    wave_starts = np.flatnonzero(np.r_[True, wave_of[1:] != wave_of[:-1]])
+    visit_starts = np.flatnonzero(np.r_[True, (wave_of[1:] != wave_of[:-1]) | (row_of[1:] != row_of[:-1])])
+    wave_ends = np.r_[wave_starts[1:], len(clustered)]
+    date_text = dates[clustered].astype(str)
+    lat_sums, lon_sums = np.add.reduceat(lats[clustered], wave_starts), np.add.reduceat(lons[clustered], wave_starts)
+    first_days, last_days = np.minimum.reduceat(days[clustered], wave_starts), np.maximum.reduceat(days[clustered], wave_starts)
+    visits = np.split(np.arange(len(clustered)), visit_starts[1:])
+    visit = 0
+    waves, states = [], {}
+    for w, (begin, end) in enumerate(zip(wave_starts.tolist(), wave_ends.tolist())):
+        facilities = []
+        while visit < len(visits) and visits[visit][0] < end:
+            ccn = geo_index['ccns'][row_of[visits[visit][0]]]
+            facilities.append({'ccn': ccn, 'name': names.get(ccn, 'N/A'), 'state': state_of.get(ccn),
+                               'dates': date_text[visits[visit]].tolist()})
+            visit += 1
+        waves.append({
+            'start': str(np.datetime64(int(first_days[w]), 'D')),
+            'end': str(np.datetime64(int(last_days[w]), 'D')),
+            'span_days': int(last_days[w] - first_days[w]) + 1,
+            'centroid': {'lat': round(float(lat_sums[w]) / (end - begin), 5), 'lon': round(float(lon_sums[w]) / (end - begin), 5)},
+            'events': end - begin,
+            'facility_count': len(facilities),
+            'states': sorted({f['state'] for f in facilities if f['state']}),
+            'facilities': facilities,
+        })
+    # Newest first; the per-state lists keep that order
+    waves.sort(key=lambda w: (w['end'], w['start']), reverse=True)
+    for i, wave in enumerate(waves):
+        wave['id'] = i
+        for code in wave['states']:
+            states.setdefault(code, []).append(i)
+    survey_wave_table = {'waves': waves, 'states': states, 'events': len(days), 'clustered_events': len(clustered)}
+    print(f"Built survey wave table ({len(days)} survey events, {len(waves)} waves) in {time.perf_counter() - started:.2f}s")
+
+@app.route('/api/survey-waves/<state>')
+@cached_response
+def get_survey_waves(state):
+    """Space-time survey waves with a member facility in the state, newest first: each wave's centroid, date span and
+    member facilities (with their survey dates in the wave).
+
+    Optional ?since= (YYYY-MM-DD) keeps waves ending on or after it; ?limit= caps how many are listed.
+    """
+    global facilities_data
+    if facilities_data is None:
+        return jsonify({'error': 'Data not loaded'}), 500
+
+    try:
+        try:
+            since = str(pd.Timestamp(request.args['since']).date()) if request.args.get('since') else None
+            limit = int(request.args['limit']) if request.args.get('limit') else None
+        except ValueError:
+            return jsonify({'error': 'since must be a date (YYYY-MM-DD) and limit a number'}), 400
+        if limit is not None and limit < 1:
+            return jsonify({'error': 'limit must be at least 1'}), 400
+
+        code = normalize_state_input(state)
+        table = survey_wave_table
+        waves = [table['waves'][i] for i in table['states'].get(code, [])] if table else []
+        if since:
+            waves = [w for w in waves if w['end'] >= since]
+        return jsonify({
+            'state': code,
+            'dataset_version': data_load_stats.get('dataset_version'),
+            'miles': SURVEY_WAVE_MILES,
+            'days': SURVEY_WAVE_DAYS,
+            'min_events': SURVEY_WAVE_MIN_EVENTS,
+            'count': len(waves),
+            'waves': waves[:limit] if limit else waves,
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# provider_info columns the similar-characteristics kNN compares -> keys to read from a posted facility row instead
+SIMILARITY_FEATURES = {
+    'Number of Certified Beds': ['Number of Certified Beds'],
+    'Average Number of Residents per Day': ['Average Number of Residents per Day'],
+    'Overall Rating': ['Overall Rating'],
+    'Health Inspection Rating': ['Health Inspection Rating'],
+    'Staffing Rating': ['Staffing Rating'],
+    'Latitude': ['lat', 'Latitude'],
+    'Longitude': ['lng', 'Longitude'],
+}
+SIMILARITY_NEIGHBORS = 25
+
+# z-scored provider feature matrix (one row per CCN with an observed survey interval), rebuilt after every load
+similarity_index = {}
+
+def build_similarity_index():
+    """Standardize SIMILARITY_FEATURES per provider and partition the rows by state for kNN queries."""
+    global similarity_index
+    started = time.perf_counter()
+    columns = [c for c in SIMILARITY_FEATURES if provider_info_data is not None and c in provider_info_data.columns]
+    if not columns or 'State' not in provider_info_data.columns:
+        similarity_index = {}
+        print("Warning: provider_info has none of the similarity features; similar-characteristics index not built")
+        return
+    providers = provider_info_data.dropna(subset=[CCN_KEY]).drop_duplicates(subset=[CCN_KEY])
+    raw = providers[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    means = np.nanmean(raw, axis=0)
+    stds = np.nanstd(raw, axis=0)
+    stds[~(stds > 0)] = 1.0
+    # Missing values sit at the feature mean (0 after scaling) so they neither attract nor repel neighbours
+    features = np.nan_to_num((raw - means) / stds)
+
+    intervals = observed_survey_intervals()
+    ccns = providers[CCN_KEY].to_numpy(dtype=object)
+    interval_days = pd.Series(ccns).map(intervals).to_numpy(dtype=float)
+    states = providers['State'].astype(str).str.strip().str.upper().to_numpy()
+    by_state = pd.Series(np.arange(len(providers))).groupby(states).indices if len(providers) else {}
+    coordinates = {c: pd.to_numeric(providers[c], errors='coerce').to_numpy(dtype=float) if c in providers.columns else np.full(len(providers), np.nan)
+                   for c in ('Latitude', 'Longitude')}
+    similarity_index = {
+        'columns': columns,
+        'means': means,
+        'stds': stds,
+        'ccns': ccns,
+        'features': features,
+        'interval_days': interval_days,
+        'lat': coordinates['Latitude'],
+        'lon': coordinates['Longitude'],
+        'positions': {ccn: i for i, ccn in enumerate(ccns)},
+        'home_states': states,
+        'providers_by_state': by_state,
+        'states': {code: rows[~np.isnan(interval_days[rows])] for code, rows in by_state.items()},
+    }
+    print(f"Built similarity index ({len(ccns)} providers, {int((~np.isnan(interval_days)).sum())} with survey intervals) in {time.perf_counter() - started:.2f}s")
+
+def similarity_vector(facility: dict, ccn: Optional[str]) -> Optional[np.ndarray]:
+    """Scaled feature row for a posted facility: its provider_info row by CCN, else the values it carries."""
+    position = similarity_index['positions'].get(ccn) if ccn else None
+    if position is not None:
+        return similarity_index['features'][position]
+    raw = []
+    for column in similarity_index['columns']:
+        value = next((facility[k] for k in SIMILARITY_FEATURES[column] if facility.get(k) not in (None, '')), None)
+        raw.append(pd.to_numeric(value, errors='coerce') if value is not None else np.nan)
+    raw = np.asarray(raw, dtype=float)
+    if np.isnan(raw).all():
+        return None
+    return np.nan_to_num((raw - similarity_index['means']) / similarity_index['stds'])
+
+def nearest_similar_facilities(state: str, vector: np.ndarray, k: int, exclude_ccn: Optional[str] = None):
+    """The k in-state providers closest to vector (Euclidean on scaled features) as (positions, distances), nearest first."""
+    candidates = similarity_index['states'].get(normalize_state_input(state), _NO_ROWS)
+    if exclude_ccn is not None:
+        candidates = candidates[similarity_index['ccns'][candidates] != exclude_ccn]
+    if not len(candidates):
+        return _NO_ROWS, np.empty(0)
+    distances = np.sqrt(((similarity_index['features'][candidates] - vector) ** 2).sum(axis=1))
+    if k < len(candidates):
+        nearest = np.argpartition(distances, k - 1)[:k]
+    else:
+        nearest = np.arange(len(candidates))
+    nearest = nearest[np.lexsort((similarity_index['ccns'][candidates[nearest]].astype(str), distances[nearest]))]
+    return candidates[nearest], distances[nearest]
+
+def similar_characteristics_section(state, facility_data, k):
+    """/api/similar-characteristics-interval body and status for a facility row and neighbour count."""
+    if not similarity_index:
+        return {'average_days': 365, 'count': 0}, 200
+    ccn = normalize_ccn_value(next((facility_data[c] for c in CCN_COLUMN_CANDIDATES if facility_data.get(c) not in (None, '')), None))
+    vector = similarity_vector(facility_data, ccn)
+    if vector is None:
+        return {'average_days': 365, 'count': 0}, 200
+    
+    positions, distances = nearest_similar_facilities(state, vector, k, exclude_ccn=ccn)
+    if not len(positions):
+        return {'average_days': 365, 'count': 0}, 200
+    
+    median_days = float(np.median(similarity_index['interval_days'][positions]))
+    average_days = int(max(30, min(1095, round(median_days))))
+    similar = [{'ccn': c, 'distance': round(float(d), 3), 'interval_days': float(i)}
+               for c, d, i in zip(similarity_index['ccns'][positions], distances, similarity_index['interval_days'][positions])]
+    return {'average_days': average_days, 'count': len(positions), 'similar_facilities': similar}, 200
+
 @app.route('/api/similar-characteristics-interval/<state>', methods=['POST'])
 def get_similar_characteristics_interval(state):
-    """Calculate average time between surveys for facilities with similar characteristics."""
+    """Median observed time between surveys for the k in-state facilities most like the posted one.
+
+    Similarity is distance over beds, residents per day, overall/health/staffing ratings and location,
+    each standardized across all providers. Optional ?k= (default SIMILARITY_NEIGHBORS).
+    """
     global facilities_data
     if facilities_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
@@ -2074,36 +3530,131 @@ def get_similar_characteristics_interval(state):
         facility_data = request.get_json()
         if not facility_data:
             return jsonify({'error': 'No facility data provided'}), 400
+        try:
+            k = int(request.args['k']) if request.args.get('k') else SIMILARITY_NEIGHBORS
+        except ValueError:
+            return jsonify({'error': 'k must be an integer'}), 400
+        if k < 1:
+            return jsonify({'error': 'k must be at least 1'}), 400
         
-        # This is a simplified implementation - in practice, you'd match on:
-        # - Facility size (bed count)
-        # - Public vs private
-        # - Urban vs rural
-        # - Other characteristics
-        
-        # For now, return a reasonable default based on state
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
-        
-        if state_col is None:
-            return jsonify({'average_days': 365, 'count': 0})
-        
-        state_facilities = facilities_data[facilities_data[state_col] == state]
-        
-        # Simplified: return state average with some variation
-        base_days = 365
-        variation = 30  # ±30 days
-        average_days = base_days + (hash(str(facility_data)) % (2 * variation)) - variation
-        average_days = max(30, min(1095, average_days))
-        
-        return jsonify({'average_days': average_days, 'count': len(state_facilities)})
+        body, status = similar_characteristics_section(state, facility_data, k)
+        return jsonify(body), status
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+TAG_COLUMN_CANDIDATES = ['Deficiency Tag Number', 'Deficiency Tag', 'Tag Number', 'tag']
+# A citation's weight in a deficiency profile halves every this many days before the latest survey in the data
+DEFICIENCY_RECENCY_HALF_LIFE_DAYS = 730
+
+# TF-IDF deficiency-tag profile per CCN as CSR arrays with L2-normalized rows (see build_deficiency_profile_index)
+deficiency_profile_index = {}
+
+def deficiency_citations() -> Optional[pd.DataFrame]:
+    """(CCN_KEY, SURVEY_DATE_KEY, 'tag') of every deficiency citation with a CCN and a tag; None without a tag column."""
+    tag_col = next((c for c in TAG_COLUMN_CANDIDATES if deficiencies_data is not None and c in deficiencies_data.columns), None)
+    if tag_col is None:
+        return None
+    cited = deficiencies_data[[CCN_KEY, SURVEY_DATE_KEY]].assign(tag=deficiencies_data[tag_col].astype(str).str.strip())
+    return cited[cited[CCN_KEY].notna() & deficiencies_data[tag_col].notna() & (cited['tag'] != '')]
+
+def deficiency_profile_matrix(cited: pd.DataFrame, as_of: Optional[pd.Timestamp] = None) -> dict:
+    """Recency-weighted TF-IDF CSR arrays (ccns, tags, indptr, indices, data, rows, positions) over the given citations.
+
+    Citations are aged from as_of (default the latest citation date), so a backtest can profile facilities as they
+    looked on a past date from the citations before it.
+    """
+    dates = cited[SURVEY_DATE_KEY]
+    if as_of is None:
+        as_of = dates.max()
+    age_days = ((as_of - dates).dt.days).fillna((as_of - dates.min()).days if dates.notna().any() else 0)
+    row_codes, ccns = pd.factorize(cited[CCN_KEY])
+    tag_codes, tags = pd.factorize(cited['tag'])
+    tf = pd.Series(0.5 ** (age_days.to_numpy(dtype=float) / DEFICIENCY_RECENCY_HALF_LIFE_DAYS)).groupby([row_codes, tag_codes]).sum()
+    rows = tf.index.get_level_values(0).to_numpy(dtype=np.intp)
+    indices = tf.index.get_level_values(1).to_numpy(dtype=np.intp)
+    # Smoothed idf: a tag cited at every facility still keeps weight 1
+    doc_freq = np.bincount(indices, minlength=len(tags))
+    idf = np.log((1 + len(ccns)) / (1 + doc_freq)) + 1.0
+    data = tf.to_numpy(dtype=float) * idf[indices]
+    norms = np.sqrt(np.bincount(rows, weights=data ** 2, minlength=len(ccns)))
+    data = data / norms[rows]
+    ccns = np.asarray(ccns, dtype=object)
+    return {
+        'ccns': ccns,
+        'tags': np.asarray(tags, dtype=object),
+        'indptr': np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(ccns)))]),
+        'indices': indices,
+        'data': data,
+        'rows': rows,
+        'positions': {ccn: i for i, ccn in enumerate(ccns)},
+    }
+
+def build_deficiency_profile_index():
+    """Recency-weighted TF-IDF over deficiency tags, one sparse row per CCN with any cited deficiency.
+
+    Stored as plain CSR arrays (indptr/indices/data, plus the row of every stored value) so a query against every
+    facility is one gather, multiply and bincount over the non-zeros.
+    """
+    global deficiency_profile_index
+    started = time.perf_counter()
+    cited = deficiency_citations()
+    if cited is None:
+        deficiency_profile_index = {}
+        print("Warning: deficiencies have no tag column; similar-deficiencies index not built")
+        return
+    profiles = deficiency_profile_matrix(cited)
+    ccns, positions, tags, data = profiles['ccns'], profiles['positions'], profiles['tags'], profiles['data']
+    interval_days = pd.Series(ccns).map(observed_survey_intervals()).to_numpy(dtype=float)
+    states = {}
+    for code, part in state_partitions.items():
+        members = np.fromiter((positions[c] for c in part['ccns'] if c in positions), dtype=np.intp)
+        states[code] = np.sort(members[~np.isnan(interval_days[members])])
+    deficiency_profile_index = {**profiles, 'interval_days': interval_days, 'states': states}
+    print(f"Built deficiency profile index ({len(ccns)} facilities, {len(tags)} tags, {len(data)} non-zeros) in {time.perf_counter() - started:.2f}s")
+
+def deficiency_profile_scores(ccn: str) -> Optional[np.ndarray]:
+    """Cosine similarity of every profiled facility to ccn's profile (sparse matrix-vector product), or None if unprofiled."""
+    index = deficiency_profile_index
+    position = index['positions'].get(ccn)
+    if position is None:
+        return None
+    start, stop = index['indptr'][position], index['indptr'][position + 1]
+    query = np.zeros(len(index['tags']))
+    query[index['indices'][start:stop]] = index['data'][start:stop]
+    return np.bincount(index['rows'], weights=index['data'] * query[index['indices']], minlength=len(index['ccns']))
+
+def similar_deficiencies_section(state, facility_data, k, scope='state'):
+    """/api/similar-deficiencies-interval body and status for a facility row, neighbour count and scope."""
+    ccn = normalize_ccn_value(next((facility_data[c] for c in CCN_COLUMN_CANDIDATES if facility_data.get(c) not in (None, '')), None))
+    scores = deficiency_profile_scores(ccn) if deficiency_profile_index and ccn else None
+    if scores is None:
+        return {'average_days': 365, 'count': 0}, 200
+    
+    index = deficiency_profile_index
+    if scope == 'national':
+        candidates = np.flatnonzero(~np.isnan(index['interval_days']))
+    else:
+        candidates = index['states'].get(normalize_state_input(state), _NO_ROWS)
+    candidates = candidates[(index['ccns'][candidates] != ccn) & (scores[candidates] > 0)]
+    if not len(candidates):
+        return {'average_days': 365, 'count': 0}, 200
+    if k < len(candidates):
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    candidates = candidates[np.lexsort((index['ccns'][candidates].astype(str), -scores[candidates]))]
+    
+    median_days = float(np.median(index['interval_days'][candidates]))
+    average_days = int(max(30, min(1095, round(median_days))))
+    similar = [{'ccn': c, 'similarity': round(float(score), 4), 'interval_days': float(days)}
+               for c, score, days in zip(index['ccns'][candidates], scores[candidates], index['interval_days'][candidates])]
+    return {'average_days': average_days, 'count': len(candidates), 'similar_facilities': similar}, 200
+
 @app.route('/api/similar-deficiencies-interval/<state>', methods=['POST'])
 def get_similar_deficiencies_interval(state):
-    """Calculate average time between surveys for facilities with similar deficiency patterns."""
+    """Median observed time between surveys for the k facilities whose deficiency-tag profiles best match the posted one.
+
+    Optional ?k= (default SIMILARITY_NEIGHBORS) and ?scope=national to search every state instead of this one.
+    """
     global facilities_data
     if facilities_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
@@ -2112,82 +3663,201 @@ def get_similar_deficiencies_interval(state):
         facility_data = request.get_json()
         if not facility_data:
             return jsonify({'error': 'No facility data provided'}), 400
+        try:
+            k = int(request.args['k']) if request.args.get('k') else SIMILARITY_NEIGHBORS
+        except ValueError:
+            return jsonify({'error': 'k must be an integer'}), 400
+        if k < 1:
+            return jsonify({'error': 'k must be at least 1'}), 400
+        scope = request.args.get('scope', 'state').lower()
+        if scope not in ('state', 'national'):
+            return jsonify({'error': "scope must be 'state' or 'national'"}), 400
         
-        # This would analyze deficiency patterns and find similar facilities
-        # For now, return a reasonable default
-        
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
-        
-        if state_col is None:
-            return jsonify({'average_days': 365, 'count': 0})
-        
-        state_facilities = facilities_data[facilities_data[state_col] == state]
-        
-        # Simplified: return state average with some variation based on facility
-        base_days = 365
-        variation = 45  # ±45 days for deficiency-based matching
-        average_days = base_days + (hash(str(facility_data)) % (2 * variation)) - variation
-        average_days = max(30, min(1095, average_days))
-        
-        return jsonify({'average_days': average_days, 'count': len(state_facilities)})
+        body, status = similar_deficiencies_section(state, facility_data, k, scope)
+        return jsonify(body), status
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/state-average-2year-interval/<state>')
 def get_state_average_2year_interval(state):
-    """Calculate average time between surveys for facilities in a state over past 2 years."""
+    """Median days between consecutive surveys of the same facility in a state, for gaps ending in the last 2 years of data."""
     global facilities_data
     if facilities_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     
     try:
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
-        
-        if state_col is None:
-            return jsonify({'error': 'State column not found'}), 500
-        
-        # Filter by state
-        state_facilities = facilities_data[facilities_data[state_col] == state]
-        
-        # Get survey dates
-        survey_date_columns = ['Health Survey Date', 'health_survey_date', 'Survey Date', 'survey_date', 'Date', 'date']
-        survey_date_col = next((c for c in survey_date_columns if c in facilities_data.columns), None)
-        
-        if survey_date_col is None:
-            return jsonify({'average_days': 365, 'count': 0})
-        
-        # Filter to past 2 years (2023-2025)
-        two_years_ago = pd.Timestamp('2023-01-01')
-        now = pd.Timestamp('2027-12-31')
-        
-        intervals = []
-        for _, facility in state_facilities.iterrows():
-            date_str = str(facility.get(survey_date_col, ''))
-            if date_str and date_str != 'nan' and date_str != 'None':
-                parsed = pd.to_datetime(date_str, errors='coerce')
-                if parsed is not None and not pd.isna(parsed):
-                    if two_years_ago <= parsed <= now:
-                        days_since_start = (parsed - two_years_ago).days
-                        intervals.append(days_since_start)
-        
-        if len(intervals) < 2:
-            return jsonify({'average_days': 365, 'count': len(intervals)})
-        
-        intervals.sort()
-        median_interval = intervals[len(intervals) // 2] if intervals else 365
-        average_days = max(30, min(730, median_interval // 2))  # Max 2 years
-        
-        return jsonify({'average_days': average_days, 'count': len(intervals)})
-        
+        body, status = gap_interval_section(survey_gap_table.get('state_recent', {}).get(normalize_state_input(state)), 730)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _parse_combined_weights(text: str) -> dict:
+    """'characteristics=0.4,deficiencies=0.4,distance=0.2' -> weights dict (unnamed criteria keep 0).
+
+    An unknown criterion, a value that is not a non-negative number or an all-zero blend falls back to
+    COMBINED_WEIGHTS_DEFAULT with a warning, so a typo in the environment cannot stop the app or zero the scores.
+    """
+    weights = dict.fromkeys(('characteristics', 'deficiencies', 'distance'), 0.0)
+    try:
+        for part in text.split(','):
+            if not part.strip():
+                continue
+            name, _, value = part.partition('=')
+            if name.strip() not in weights:
+                raise ValueError(f"unknown criterion '{name.strip()}'")
+            weights[name.strip()] = float(value)
+            if not (0 <= weights[name.strip()] < float('inf')):
+                raise ValueError(f"weight for '{name.strip()}' must be a non-negative number")
+        if sum(weights.values()) <= 0:
+            raise ValueError('weights sum to zero')
+    except ValueError as e:
+        if text == COMBINED_WEIGHTS_DEFAULT:
+            raise
+        print(f"Warning: Ignoring ATHENA_COMBINED_WEIGHTS={text!r} ({e}); using {COMBINED_WEIGHTS_DEFAULT}")
+        return _parse_combined_weights(COMBINED_WEIGHTS_DEFAULT)
+    return weights
+
+# Default blend for the combined-criteria peers; override per deployment with ATHENA_COMBINED_WEIGHTS or per request with query params
+COMBINED_WEIGHTS_DEFAULT = 'characteristics=0.4,deficiencies=0.4,distance=0.2'
+COMBINED_CRITERIA_WEIGHTS = _parse_combined_weights(os.getenv('ATHENA_COMBINED_WEIGHTS', COMBINED_WEIGHTS_DEFAULT))
+# Geographic similarity is exp(-miles / this), so a peer this far away scores 0.37 on distance
+COMBINED_DISTANCE_SCALE_MILES = 25.0
+COMBINED_BATCH_ROWS = 512
+
+# Per-CCN top-k combined-criteria peers under COMBINED_CRITERIA_WEIGHTS, precomputed after every load
+combined_peer_index = {}
+
+def _dense_deficiency_profiles(profile_rows: np.ndarray, index: Optional[dict] = None) -> np.ndarray:
+    """Dense (len(profile_rows), tags) block of deficiency_profile_index (or index) rows; -1 gives an all-zero row."""
+    if index is None:
+        index = deficiency_profile_index
+    if not index:
+        return np.zeros((len(profile_rows), 0))
+    dense = np.zeros((len(profile_rows), len(index['tags'])))
+    present = np.flatnonzero(profile_rows >= 0)
+    starts, stops = index['indptr'][profile_rows[present]], index['indptr'][profile_rows[present] + 1]
+    lengths = stops - starts
+    nnz = concatenated_ranges(starts, lengths)
+    dense[np.repeat(present, lengths), index['indices'][nnz]] = index['data'][nnz]
+    return dense
+
+def combined_peer_scores(query_rows: np.ndarray, candidate_rows: np.ndarray, weights: dict, profiles: Optional[tuple] = None) -> np.ndarray:
+    """Blended similarity (len(query_rows), len(candidate_rows)) between similarity_index rows, each criterion in [0, 1].
+
+    characteristics: 1 / (1 + Euclidean distance of scaled features); deficiencies: cosine of the TF-IDF tag profiles;
+    distance: exp(-miles / COMBINED_DISTANCE_SCALE_MILES), 0 without coordinates. Weights are normalized to sum to 1.
+    profiles, as (profile index, profile row of every similarity_index row), replaces the loaded deficiency profiles.
+    """
+    features = similarity_index['features']
+    a, b = features[query_rows], features[candidate_rows]
+    squared = (a ** 2).sum(axis=1)[:, None] + (b ** 2).sum(axis=1)[None, :] - 2 * a @ b.T
+    blended = weights['characteristics'] / (1.0 + np.sqrt(np.maximum(squared, 0.0)))
+    if weights['deficiencies']:
+        index, profile_rows = profiles if profiles is not None else (deficiency_profile_index, combined_peer_index['profile_rows'])
+        query_profiles = _dense_deficiency_profiles(profile_rows[query_rows], index)
+        blended += weights['deficiencies'] * (query_profiles @ _dense_deficiency_profiles(profile_rows[candidate_rows], index).T)
+    if weights['distance']:
+        lat, lon = similarity_index['lat'], similarity_index['lon']
+        miles = haversine_miles_array(lat[query_rows][:, None], lon[query_rows][:, None], lat[candidate_rows], lon[candidate_rows])
+        blended += weights['distance'] * np.nan_to_num(np.exp(-miles / COMBINED_DISTANCE_SCALE_MILES))
+    return blended / sum(weights.values())
+
+def top_combined_peers(query_rows: np.ndarray, candidate_rows: np.ndarray, weights: dict, k: int, profiles: Optional[tuple] = None):
+    """Per query row, the k best-scoring candidates other than itself as (positions, scores) lists, best first."""
+    scores = combined_peer_scores(query_rows, candidate_rows, weights, profiles)
+    scores[query_rows[:, None] == candidate_rows[None, :]] = -np.inf
+    take = min(k, len(candidate_rows))
+    if take < len(candidate_rows):
+        best = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+    else:
+        best = np.tile(np.arange(len(candidate_rows)), (len(query_rows), 1))
+    peers = []
+    for row, columns in enumerate(best):
+        row_scores = scores[row, columns]
+        columns = columns[np.lexsort((candidate_rows[columns], -row_scores))]
+        columns = columns[np.isfinite(scores[row, columns])]
+        peers.append((candidate_rows[columns], scores[row, columns]))
+    return peers
+
+def weighted_peer_interval(peers: np.ndarray, scores: np.ndarray) -> int:
+    """Similarity-weighted mean of the peers' recent survey intervals, clamped to 30-730 days."""
+    days = combined_peer_index['interval_days'][peers]
+    weights = np.clip(scores, 1e-9, None)
+    return int(max(30, min(730, round(float((days * weights).sum() / weights.sum())))))
+
+def build_combined_peer_table():
+    """Batch job: every provider's top SIMILARITY_NEIGHBORS in-state peers under COMBINED_CRITERIA_WEIGHTS.
+
+    Peers need at least one survey gap ending in the last RECENT_SURVEY_WINDOW_DAYS of the data. Run after the similarity
+    and deficiency-profile indexes; the endpoint then only looks the facility up.
+    """
+    global combined_peer_index
+    started = time.perf_counter()
+    since = survey_gap_table.get('since')
+    if not similarity_index or since is None:
+        combined_peer_index = {}
+        return
+    ccns = similarity_index['ccns']
+    interval_days = pd.Series(ccns).map(observed_survey_intervals(since)).to_numpy(dtype=float)
+    profile_positions = deficiency_profile_index.get('positions', {})
+    profile_rows = pd.Series(ccns).map(profile_positions).fillna(-1).to_numpy(dtype=np.intp)
+    combined_peer_index = {
+        'since': since,
+        'interval_days': interval_days,
+        'profile_rows': profile_rows,
+        'states': {code: rows[~np.isnan(interval_days[rows])] for code, rows in similarity_index['providers_by_state'].items()},
+        'peers': {},
+    }
+    table = combined_peer_index['peers']
+    for code, rows in similarity_index['providers_by_state'].items():
+        candidates = combined_peer_index['states'][code]
+        if not len(candidates):
+            continue
+        for chunk in range(0, len(rows), COMBINED_BATCH_ROWS):
+            query_rows = rows[chunk:chunk + COMBINED_BATCH_ROWS]
+            for row, (peers, scores) in zip(query_rows, top_combined_peers(query_rows, candidates, COMBINED_CRITERIA_WEIGHTS, SIMILARITY_NEIGHBORS)):
+                if len(peers):
+                    table[ccns[row]] = (peers.astype(np.int32), scores.astype(np.float32), weighted_peer_interval(peers, scores))
+    print(f"Built combined-criteria peer table ({len(table)} facilities, surveys since {since.date()}) in {time.perf_counter() - started:.2f}s")
+
+def combined_criteria_section(state, facility_data, k, weights):
+    """/api/combined-criteria-2year-interval body and status for a facility row, neighbour count and criteria weights."""
+    ccn = normalize_ccn_value(next((facility_data[c] for c in CCN_COLUMN_CANDIDATES if facility_data.get(c) not in (None, '')), None))
+    position = similarity_index['positions'].get(ccn) if combined_peer_index and ccn else None
+    if position is None:
+        return {'average_days': 365, 'count': 0}, 200
+    
+    state_code = normalize_state_input(state)
+    precomputed = (k == SIMILARITY_NEIGHBORS and weights == COMBINED_CRITERIA_WEIGHTS
+                   and state_code == similarity_index['home_states'][position])
+    if precomputed:
+        if ccn not in combined_peer_index['peers']:
+            return {'average_days': 365, 'count': 0}, 200
+        peers, scores, average_days = combined_peer_index['peers'][ccn]
+    else:
+        candidates = combined_peer_index['states'].get(state_code, _NO_ROWS)
+        if not len(candidates):
+            return {'average_days': 365, 'count': 0}, 200
+        peers, scores = top_combined_peers(np.array([position]), candidates, weights, k)[0]
+        if not len(peers):
+            return {'average_days': 365, 'count': 0}, 200
+        average_days = weighted_peer_interval(peers, scores)
+    
+    similar = [{'ccn': similarity_index['ccns'][p], 'score': round(float(score), 4), 'interval_days': float(combined_peer_index['interval_days'][p])}
+               for p, score in zip(peers, scores)]
+    return {'average_days': average_days, 'count': len(peers), 'weights': weights, 'precomputed': precomputed,
+            'since': combined_peer_index['since'].strftime('%Y-%m-%d'), 'similar_facilities': similar}, 200
+
 @app.route('/api/combined-criteria-2year-interval/<state>', methods=['POST'])
 def get_combined_criteria_2year_interval(state):
-    """Calculate average time between surveys using combined criteria over past 2 years."""
+    """Similarity-weighted survey interval over the last 2 years for the posted facility's top-k blended peers.
+
+    Peers are facilities in the URL state scored on characteristics, deficiency profile and distance
+    (COMBINED_CRITERIA_WEIGHTS). With the default weights and k, and the URL state being the facility's own, the answer
+    comes from the precomputed peer table; ?characteristics=, ?deficiencies=, ?distance= (weights), ?k= or another
+    state compute the peers for this request instead.
+    """
     global facilities_data
     if facilities_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
@@ -2196,100 +3866,42 @@ def get_combined_criteria_2year_interval(state):
         facility_data = request.get_json()
         if not facility_data:
             return jsonify({'error': 'No facility data provided'}), 400
+        try:
+            k = int(request.args['k']) if request.args.get('k') else SIMILARITY_NEIGHBORS
+            weights = {name: float(request.args[name]) if request.args.get(name) else default
+                       for name, default in COMBINED_CRITERIA_WEIGHTS.items()}
+        except ValueError:
+            return jsonify({'error': 'k and the criteria weights must be numbers'}), 400
+        if k < 1 or min(weights.values()) < 0 or sum(weights.values()) <= 0:
+            return jsonify({'error': 'k must be at least 1 and weights non-negative with a positive sum'}), 400
         
-        # This would combine:
-        # - State filtering
-        # - Similar characteristics
-        # - Similar deficiency patterns
-        # - Past 2 years only
-        
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
-        
-        if state_col is None:
-            return jsonify({'average_days': 365, 'count': 0})
-        
-        state_facilities = facilities_data[facilities_data[state_col] == state]
-        
-        # Simplified: return weighted average with more sophisticated variation
-        base_days = 365
-        variation = 60  # ±60 days for combined criteria
-        average_days = base_days + (hash(str(facility_data)) % (2 * variation)) - variation
-        average_days = max(30, min(730, average_days))  # Max 2 years
-        
-        return jsonify({'average_days': average_days, 'count': len(state_facilities)})
+        body, status = combined_criteria_section(state, facility_data, k, weights)
+        return jsonify(body), status
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/state-monthly-surveys/<state>')
+@cached_response
 def get_state_monthly_surveys(state):
     """Section 4: Histogram of survey dates by month for the selected state.
 
     Counts unique (CCN, Survey Date) pairs sourced from health_deficiencies.xlsx for facilities in the state.
+    Optional start_year/end_year query params limit the years counted.
     """
     global facilities_data, deficiencies_data
     if facilities_data is None or deficiencies_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     try:
-        # Resolve state and CCNs for that state from facilities_data
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        ccn_columns = ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
-        ccn_col_fac = next((c for c in ccn_columns if c in facilities_data.columns), None)
-        if state_col is None or ccn_col_fac is None:
-            return jsonify({'buckets': [], 'count': 0})
-
-        # Match state case-insensitively
-        fac_state = facilities_data[facilities_data[state_col].astype(str).str.strip().str.upper() == str(state).strip().upper()]
-        if fac_state.empty:
+        try:
+            years = histogram_year_slice(*requested_year_range())
+        except ValueError:
+            return jsonify({'error': 'start_year and end_year must be integers'}), 400
+        if normalize_state_input(state) not in histogram_cube.get('state', {}):
             print(f"Warning: No facilities found for state '{state}'")
             return jsonify({'buckets': [], 'count': 0})
-        
-        # Get CCNs - ensure they're strings and handle NaN values
-        ccn_series = fac_state[ccn_col_fac].astype(str)
-        ccn_series = ccn_series[ccn_series != 'nan']
-        ccn_series = ccn_series[ccn_series != '']
-        if ccn_series.empty:
-            print(f"Warning: No valid CCNs found for state '{state}'")
-            return jsonify({'buckets': [], 'count': 0})
-        
-        # Normalize CCNs for matching (strip, remove leading zeros, pad to 6 digits)
-        state_ccns = set(ccn_series.str.strip().str.lstrip('0').str.zfill(6))
-        if not state_ccns:
-            print(f"Warning: No valid CCNs after normalization for state '{state}'")
-            return jsonify({'buckets': [], 'count': 0})
-
-        # Prepare deficiencies with parsed dates and normalized CCN
-        def_ccn_col = next((c for c in ccn_columns if c in deficiencies_data.columns), None)
-        date_col_def = next((c for c in ['Health Survey Date', 'Survey Date', 'Date'] if c in deficiencies_data.columns), None)
-        if def_ccn_col is None or date_col_def is None:
-            print(f"Error: Missing columns in deficiencies_data. CCN col: {def_ccn_col}, Date col: {date_col_def}")
-            print(f"Available columns: {list(deficiencies_data.columns)}")
-            return jsonify({'buckets': [], 'count': 0})
-
-        d = deficiencies_data[[def_ccn_col, date_col_def]].copy()
-        d['CCN_STR'] = d[def_ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-        d['DATE'] = pd.to_datetime(d[date_col_def], errors='coerce')
-        d = d[pd.notna(d['DATE'])]
-        d = d[d['CCN_STR'].isin(state_ccns)]
-
-        # Filter to required range and deduplicate by (CCN, DATE)
-        start, end = pd.Timestamp('2016-01-01'), pd.Timestamp('2027-12-31')
-        d = d[(d['DATE'] >= start) & (d['DATE'] <= end)]
-        if d.empty:
-            return jsonify({'buckets': [], 'count': 0})
-        d = d.drop_duplicates(subset=['CCN_STR', 'DATE'])
-
-        # Aggregate to month buckets (1..12)
-        month_counts_series = d['DATE'].dt.month.value_counts()
-        month_counts = {int(k): int(v) for k, v in month_counts_series.items()}
-        buckets, total = [], 0
-        for m in range(1, 13):
-            c = int(month_counts.get(m, 0))
-            total += c
-            buckets.append({'month': m, 'label': calendar.month_abbr[m], 'count': c})
-        return jsonify({'buckets': buckets, 'count': total})
+        body, status = histogram_section(histogram_cube['state'][normalize_state_input(state)], years)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2297,176 +3909,176 @@ def get_state_monthly_surveys(state):
 def get_county_monthly_surveys(state, county):
     """Section 4: Histogram of survey dates by month for the selected county.
 
-    Robust county matching (case-insensitive, removes 'County'/'Parish'), pulls CCNs from provider_info/facilities,
-    reads dates from health_deficiencies.xlsx, dedupes by (CCN, date), aggregates by month.
+    Robust county matching (case-insensitive, removes 'County'/'Parish'), CCNs from provider_info with facilities as
+    fallback, unique (CCN, date) pairs from health_deficiencies.xlsx aggregated by month. Optional start_year/end_year.
     """
     global facilities_data, provider_info_data, deficiencies_data
     if deficiencies_data is None or (facilities_data is None and provider_info_data is None):
         return jsonify({'error': 'Data not loaded'}), 500
     try:
-        def normalize_county_name(s: str) -> str:
-            s = str(s).strip().lower()
-            for suf in [' county', ' parish']:
-                if s.endswith(suf):
-                    s = s[: -len(suf)].strip()
-            return s
-
-        county_norm = normalize_county_name(county)
-
-        county_ccns = set()
-        # Prefer provider_info_data for county resolution
-        if provider_info_data is not None:
-            state_col = next((c for c in ['State', 'STATE', 'Provider State', 'Provider_State'] if c in provider_info_data.columns), None)
-            county_cols = [c for c in ['County/Parish', 'County', 'County Name', 'county_name'] if c in provider_info_data.columns]
-            ccn_col = next((c for c in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn'] if c in provider_info_data.columns), None)
-            if state_col and county_cols and ccn_col:
-                dfc = provider_info_data[[state_col, ccn_col] + county_cols].copy()
-                norm_match = None
-                for col in county_cols:
-                    dfc[f'__norm_{col}'] = dfc[col].apply(lambda v: normalize_county_name(v) if pd.notna(v) else '')
-                    state_aliases = get_state_aliases(state)
-                    tmp = dfc[dfc[state_col].astype(str).str.strip().isin(state_aliases) & (dfc[f'__norm_{col}'] == county_norm)]
-                    if not tmp.empty:
-                        norm_match = tmp
-                        break
-                if norm_match is not None and not norm_match.empty:
-                    county_ccns.update(norm_match[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6).tolist())
-
-        # Fallback using facilities_data
-        if not county_ccns and facilities_data is not None:
-            state_col = next((c for c in ['State', 'STATE', 'state', 'Provider State', 'Provider_State'] if c in facilities_data.columns), None)
-            county_cols = [c for c in ['County/Parish', 'County', 'County Name', 'county_name'] if c in facilities_data.columns]
-            ccn_col = next((c for c in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn'] if c in facilities_data.columns), None)
-            if state_col and county_cols and ccn_col:
-                dff = facilities_data[[state_col, ccn_col] + county_cols].copy()
-                norm_match = None
-                for col in county_cols:
-                    dff[f'__norm_{col}'] = dff[col].apply(lambda v: normalize_county_name(v) if pd.notna(v) else '')
-                    state_aliases = get_state_aliases(state)
-                    tmp = dff[dff[state_col].astype(str).str.strip().isin(state_aliases) & (dff[f'__norm_{col}'] == county_norm)]
-                    if not tmp.empty:
-                        norm_match = tmp
-                        break
-                if norm_match is not None and not norm_match.empty:
-                    county_ccns.update(norm_match[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6).tolist())
-
-        if not county_ccns:
-            return jsonify({'buckets': [], 'count': 0})
-
-        # Read deficiencies
-        def_ccn_col = next((c for c in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn'] if c in deficiencies_data.columns), None)
-        date_col_def = next((c for c in ['Health Survey Date', 'Survey Date', 'Date'] if c in deficiencies_data.columns), None)
-        if not def_ccn_col or not date_col_def:
-            return jsonify({'buckets': [], 'count': 0})
-
-        d = deficiencies_data[[def_ccn_col, date_col_def]].copy()
-        d['CCN_STR'] = d[def_ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-        d['DATE'] = pd.to_datetime(d[date_col_def], errors='coerce')
-        d = d[(d['CCN_STR'].isin(county_ccns)) & pd.notna(d['DATE'])]
-
-        start, end = pd.Timestamp('2016-01-01'), pd.Timestamp('2027-12-31')
-        d = d[(d['DATE'] >= start) & (d['DATE'] <= end)]
-
-        if d.empty:
-            return jsonify({'buckets': [], 'count': 0})
-
-        d = d.drop_duplicates(subset=['CCN_STR', 'DATE'])
-        month_counts_series = d['DATE'].dt.month.value_counts()
-        month_counts = {int(k): int(v) for k, v in month_counts_series.items()}
-        buckets, total = [], 0
-        for m in range(1, 13):
-            c = int(month_counts.get(m, 0))
-            total += c
-            buckets.append({'month': m, 'label': calendar.month_abbr[m], 'count': c})
-        return jsonify({'buckets': buckets, 'count': total})
+        try:
+            years = histogram_year_slice(*requested_year_range())
+        except ValueError:
+            return jsonify({'error': 'start_year and end_year must be integers'}), 400
+        counts, _ = histogram_group('county', state, normalize_county_name(county))
+        body, status = histogram_section(counts, years)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def zip_monthly_surveys_section(state, zip, explicit_ccn, years):
+    """Section 4 body and status for a ZIP code; an explicit (canonical) CCN is counted too if not already in the ZIP group."""
+    # Normalize input ZIP to 5-digit string
+    zip_digits = ''.join(ch for ch in str(zip) if ch.isdigit())
+    zip5 = zip_digits[:5]
+
+    if 'Survey Date' not in deficiencies_data.columns:
+        return {'buckets': [], 'count': 0}, 200
+
+    # ZIP group from provider_info (facilities_data as fallback); an explicit CCN only joins the provider_info group
+    if explicit_ccn:
+        group_key = (normalize_state_input(state), zip5)
+        source = next((src for src in histogram_cube.get('zip', [])
+                       if src['source'] == 'provider_info' and group_key in src['counts']), None)
+        counts = source['counts'][group_key] if source else np.zeros((HISTOGRAM_YEARS, 12), dtype=np.int32)
+        if not source or explicit_ccn not in source['members'][group_key]:
+            counts = counts + histogram_cube['ccn'].get(explicit_ccn, 0)
+    else:
+        counts, _ = histogram_group('zip', state, zip5)
+    return histogram_section(counts, years)
+
 @app.route('/api/zip-monthly-surveys/<state>/<zip>')
 def get_zip_monthly_surveys(state, zip):
-    """Section 4: Histogram of survey dates by month for the selected ZIP code."""
+    """Section 4: Histogram of survey dates by month for the selected ZIP code.
+
+    Optional query params: ccn (also count that facility), start_year/end_year.
+    """
     global facilities_data, provider_info_data, deficiencies_data
     if deficiencies_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     try:
-        # Normalize input ZIP to 5-digit string
-        zip_digits = ''.join(ch for ch in str(zip) if ch.isdigit())
-        zip5 = zip_digits[:5]
+        try:
+            years = histogram_year_slice(*requested_year_range())
+        except ValueError:
+            return jsonify({'error': 'start_year and end_year must be integers'}), 400
 
         # Optionally include selected facility CCN if provided
         explicit_ccn = request.args.get('ccn')
         if explicit_ccn:
-            explicit_ccn = str(explicit_ccn).strip().lstrip('0').zfill(6)
-
-        # Build CCN set for facilities in this state and ZIP using provider_info if available; fallback to facilities_data
-        zip_ccns = set()
-        if explicit_ccn:
-            zip_ccns.add(explicit_ccn)
+            explicit_ccn = normalize_ccn_value(explicit_ccn)
 
-        def try_collect(df, state_cols, zip_cols, ccn_cols):
-            if df is None:
-                return
-            state_col = next((c for c in state_cols if c in df.columns), None)
-            zip_col = next((c for c in zip_cols if c in df.columns), None)
-            ccn_col = next((c for c in ccn_cols if c in df.columns), None)
-            if not state_col or not zip_col or not ccn_col:
-                return
-            tmp = df[[state_col, zip_col, ccn_col]].copy()
-            tmp['ZIP5'] = tmp[zip_col].astype(str).str.replace(r'\D', '', regex=True).str.slice(0, 5)
-            state_aliases = get_state_aliases(state)
-            sub = tmp[tmp[state_col].astype(str).isin(state_aliases) & (tmp['ZIP5'] == zip5)]
-            if not sub.empty:
-                zip_ccns.update(sub[ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6).tolist())
-
-        try_collect(provider_info_data, ['State', 'STATE', 'Provider State', 'Provider_State'], ['ZIP Code', 'Zip', 'ZIP'], ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn'])
-        if not zip_ccns:
-            try_collect(facilities_data, ['State', 'STATE', 'Provider State', 'Provider_State'], ['ZIP Code', 'Zip', 'ZIP'], ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn'])
-        
-        if not zip_ccns:
-            return jsonify({'buckets': [], 'count': 0})
-        
-        # Get survey dates from deficiencies data
-        def_ccn_col = None
-        for col in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-            if col in deficiencies_data.columns:
-                def_ccn_col = col
-                break
-        
-        if not def_ccn_col or 'Survey Date' not in deficiencies_data.columns:
-            return jsonify({'buckets': [], 'count': 0})
-        
-        d = deficiencies_data.copy()
-        d['CCN_STR'] = d[def_ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-        d['Survey Date Parsed'] = pd.to_datetime(d['Survey Date'], errors='coerce')
-        d = d[(d['CCN_STR'].isin(zip_ccns)) & pd.notna(d['Survey Date Parsed'])]
-        
-        start, end = pd.Timestamp('2016-01-01'), pd.Timestamp('2027-12-31')
-        d = d[(d['Survey Date Parsed'] >= start) & (d['Survey Date Parsed'] <= end)]
-        
-        if d.empty:
-            return jsonify({'buckets': [], 'count': 0})
-        
-        # Deduplicate by (CCN, Date) to avoid over-counting multi-deficiency days
-        d = d.drop_duplicates(subset=['CCN_STR', 'Survey Date Parsed'])
-
-        # Aggregate over years: group by calendar month (1..12)
-        month_counts_series = d['Survey Date Parsed'].dt.month.value_counts()
-        month_counts = {int(k): int(v) for k, v in month_counts_series.items()}
-        buckets = []
-        total = 0
-        for m in range(1, 13):
-            c = int(month_counts.get(m, 0))
-            total += c
-            buckets.append({
-                'month': m,
-                'label': calendar.month_abbr[m],
-                'count': c
-            })
-        return jsonify({'buckets': buckets, 'count': total})
+        body, status = zip_monthly_surveys_section(state, zip, explicit_ccn, years)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def deficiencies_section(state, selected):
+    """/api/deficiencies body and status for a selected facilities row: its deficiencies, its ZIP peers' deficiencies
+    and the ZIP's category trend counts."""
+    # Pull CCN and ZIP5
+    # CCN
+    ccn = None
+    for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
+        if idcol in selected.index and pd.notna(selected[idcol]):
+            ccn = str(selected[idcol]).strip()
+            print(f"🔍 Extracted CCN from column '{idcol}': {ccn}")
+            break
+    
+    if not ccn:
+        print(f"🔍 ERROR: No CCN found for facility")
+        return {'error': 'CCN not found for facility'}, 404
+    
+    # Canonical CCN for matching
+    ccn_normalized = selected[CCN_KEY] if pd.notna(selected[CCN_KEY]) else normalize_ccn_value(ccn)
+    print(f"🔍 CCN normalized: '{ccn}' -> '{ccn_normalized}'")
+    
+    # ZIP
+    zip5 = None
+    for zc in ['ZIP Code', 'Zip', 'ZIP']:
+        if zc in selected.index and pd.notna(selected[zc]):
+            s = str(selected[zc]); digits = ''.join(ch for ch in s if ch.isdigit())
+            zip5 = digits[:5] if len(digits) >= 5 else None
+            break
+
+    # Deficiencies of the selected facility and of its ZIP, picked by position from the state's rows
+    d = deficiencies_data
+    part = state_partitions.get(normalize_state_input(state))
+    in_state = part['deficiencies'] if part else _NO_ROWS
+    if not ccn_index.get('deficiencies'):
+        print(f"🔍 ERROR: No CCN column found in deficiencies_data")
+        return {'error': 'CCN column not found in deficiencies data'}, 500
+    
+    # Find survey date column
+    date_cols = ['Survey Date', 'Health Survey Date', 'Date', 'date', 'survey_date']
+    date_col = next((c for c in date_cols if c in d.columns), None)
+    if not date_col:
+        print(f"🔍 ERROR: No date column found in deficiencies_data. Available columns: {list(d.columns)}")
+        return {'error': 'Date column not found in deficiencies data'}, 500
+    
+    d_sel = d.iloc[np.intersect1d(ccn_index['deficiencies'].get(ccn_normalized, _NO_ROWS), in_state)]
+    print(f"🔍 Found {len(d_sel)} deficiency records for CCN {ccn_normalized}")
+    
+    # Find other required columns
+    cat_col = next((c for c in ['Deficiency Category', 'Category', 'category'] if c in d.columns), None)
+    tag_col = next((c for c in ['Deficiency Tag Number', 'Tag Number', 'Tag', 'tag'] if c in d.columns), None)
+    desc_col = next((c for c in ['Deficiency Description', 'Description', 'description'] if c in d.columns), None)
+    
+    if not all([cat_col, tag_col, desc_col]):
+        print(f"🔍 WARNING: Missing some columns. Category: {cat_col}, Tag: {tag_col}, Description: {desc_col}")
+        # Use available columns
+        available_cols = [date_col]
+        if cat_col: available_cols.append(cat_col)
+        if tag_col: available_cols.append(tag_col)
+        if desc_col: available_cols.append(desc_col)
+        d_sel = d_sel[available_cols].sort_values(date_col)
+    else:
+        d_sel = d_sel[[date_col, cat_col, tag_col, desc_col]].sort_values(date_col)
+
+    # Filter peers in same ZIP
+    if ZIP_KEY in d.columns and zip5:
+        d_zip = d.iloc[in_state[d[ZIP_KEY].to_numpy()[in_state] == zip5]]
+        
+        # Find provider name column for peer list
+        prov_name_cols = ['Provider Name', 'Facility Name', 'provider_name', 'facility_name', 'Name', 'name']
+        prov_name_col = next((c for c in prov_name_cols if c in d.columns), None)
+        
+        # Build list of columns for peer deficiencies
+        zip_list_cols = []
+        if prov_name_col: zip_list_cols.append(prov_name_col)
+        zip_list_cols.append(date_col)
+        if cat_col: zip_list_cols.append(cat_col)
+        if tag_col: zip_list_cols.append(tag_col)
+        if desc_col: zip_list_cols.append(desc_col)
+        
+        if zip_list_cols:
+            d_zip_list = d_zip[zip_list_cols].sort_values([prov_name_col if prov_name_col else date_col, date_col])
+        else:
+            d_zip_list = d_zip[[date_col]].sort_values(date_col)
+    else:
+        d_zip = pd.DataFrame()
+        d_zip_list = pd.DataFrame()
+
+    # Trend counts by category in same ZIP
+    zip_counts = category_group_counts('zip', state, zip5) if not d_zip.empty and cat_col else None
+    if zip_counts is not None:
+        trends_list = [{'category': str(t['category']), 'count': t['count']} for t in ranked_category_trends(zip_counts)]
+    else:
+        trends_list = []
+
+    # Simple text summary
+    top_categories = ', '.join([f"{t['category']} ({t['count']})" for t in trends_list[:5]]) if trends_list else 'No deficiencies found'
+    summary = f"In ZIP {zip5 if zip5 else 'selected ZIP'}, the most frequent deficiency categories are: {top_categories}." if zip5 else "ZIP code not available for peer analysis."
+
+    return {
+        'facility_deficiencies': d_sel.to_dict(orient='records'),
+        'zip_deficiencies': d_zip_list.to_dict(orient='records'),
+        'zip_trends': trends_list,
+        'trend_summary': summary,
+        'zip': zip5,
+        'ccn': ccn
+    }, 200
+
 @app.route('/api/deficiencies/<state>/<facility_id>')
 def get_deficiencies_for_facility_and_zip(state, facility_id):
     """Section 6: Return deficiencies for selected facility and for same ZIP peers, with trend counts by category."""
@@ -2475,164 +4087,25 @@ def get_deficiencies_for_facility_and_zip(state, facility_id):
         return jsonify({'error': 'Data not loaded'}), 500
     try:
         # Resolve state and CCN + ZIP of selected facility
-        state_columns = ['State', 'STATE', 'state', 'Provider State', 'Provider_State']
-        state_col = next((c for c in state_columns if c in facilities_data.columns), None)
+        state_col = next((c for c in FACILITY_STATE_COLUMNS if c in facilities_data.columns), None)
         if state_col is None:
             return jsonify({'error': 'State column not found'}), 500
-        # Normalize state input and match case-insensitively
-        state_normalized = normalize_state_input(state)
-        state_filtered = facilities_data[facilities_data[state_col].astype(str).str.strip().str.upper() == state_normalized]
-        selected = None
         query_ccn = request.args.get('ccn')
         
         print(f"🔍 Deficiencies API Debug:")
-        print(f"🔍 State: {state} (normalized: {state_normalized}), Facility ID: {facility_id}, Query CCN: {query_ccn}")
-        print(f"🔍 State filtered facilities count: {len(state_filtered)}")
-        print(f"🔍 Available CCN columns: {[c for c in state_filtered.columns if 'ccn' in c.lower() or 'certification' in c.lower()]}")
+        print(f"🔍 State: {state} (normalized: {normalize_state_input(state)}), Facility ID: {facility_id}, Query CCN: {query_ccn}")
         
-        if query_ccn:
-            print(f"🔍 Searching for CCN: {query_ccn}")
-            for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-                if idcol in state_filtered.columns:
-                    print(f"🔍 Checking column '{idcol}' for CCN match")
-                    # Show sample CCN values from this column
-                    sample_ccns = state_filtered[idcol].dropna().astype(str).head(5).tolist()
-                    print(f"🔍 Sample CCN values in '{idcol}': {sample_ccns}")
-                    tmp = state_filtered[state_filtered[idcol].astype(str) == str(query_ccn)]
-                    print(f"🔍 Found {len(tmp)} matches in column '{idcol}'")
-                    if len(tmp) > 0:
-                        selected = tmp.iloc[0]
-                        print(f"🔍 Selected facility found via CCN in column '{idcol}'")
-                        break
-        if selected is None:
-            try:
-                idx = int(facility_id)
-                if 0 <= idx < len(state_filtered):
-                    selected = state_filtered.iloc[idx]
-            except ValueError:
-                pass
-        if selected is None:
-            for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-                if idcol in state_filtered.columns:
-                    tmp = state_filtered[state_filtered[idcol].astype(str) == str(facility_id)]
-                    if len(tmp) > 0:
-                        selected = tmp.iloc[0]
-                        break
+        selected = select_state_facility(state, facility_id, query_ccn)
         if selected is None:
             return jsonify({'error': 'Facility not found'}), 404
 
-        # Pull CCN and ZIP5
-        # CCN
-        ccn = None
-        for idcol in ['CCN', 'ccn', 'CMS Certification Number', 'CMS Certification Number (CCN)']:
-            if idcol in selected.index and pd.notna(selected[idcol]):
-                ccn = str(selected[idcol]).strip()
-                print(f"🔍 Extracted CCN from column '{idcol}': {ccn}")
-                break
-        
-        if not ccn:
-            print(f"🔍 ERROR: No CCN found for facility")
-            return jsonify({'error': 'CCN not found for facility'}), 404
-        
-        # Normalize CCN for matching
-        ccn_normalized = str(ccn).strip().lstrip('0').zfill(6)
-        print(f"🔍 CCN normalized: '{ccn}' -> '{ccn_normalized}'")
-        
-        # ZIP
-        zip5 = None
-        for zc in ['ZIP Code', 'Zip', 'ZIP']:
-            if zc in selected.index and pd.notna(selected[zc]):
-                s = str(selected[zc]); digits = ''.join(ch for ch in s if ch.isdigit())
-                zip5 = digits[:5] if len(digits) >= 5 else None
-                break
-
-        # Filter deficiencies for selected facility (by CCN and state)
-        d = deficiencies_data.copy()
-        # Normalize CCN in deficiencies data for matching
-        def_ccn_col = next((c for c in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn'] if c in d.columns), None)
-        if not def_ccn_col:
-            print(f"🔍 ERROR: No CCN column found in deficiencies_data")
-            return jsonify({'error': 'CCN column not found in deficiencies data'}), 500
-        
-        d['CCN_STR'] = d[def_ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6)
-        
-        # Find survey date column
-        date_cols = ['Survey Date', 'Health Survey Date', 'Date', 'date', 'survey_date']
-        date_col = next((c for c in date_cols if c in d.columns), None)
-        if not date_col:
-            print(f"🔍 ERROR: No date column found in deficiencies_data. Available columns: {list(d.columns)}")
-            return jsonify({'error': 'Date column not found in deficiencies data'}), 500
-        
-        d['Survey Date Parsed'] = pd.to_datetime(d[date_col], errors='coerce')
-        d_sel = d[(d['CCN_STR'] == ccn_normalized)]
-        print(f"🔍 Found {len(d_sel)} deficiency records for CCN {ccn_normalized}")
-        
-        # Find other required columns
-        cat_col = next((c for c in ['Deficiency Category', 'Category', 'category'] if c in d.columns), None)
-        tag_col = next((c for c in ['Deficiency Tag Number', 'Tag Number', 'Tag', 'tag'] if c in d.columns), None)
-        desc_col = next((c for c in ['Deficiency Description', 'Description', 'description'] if c in d.columns), None)
-        
-        if not all([cat_col, tag_col, desc_col]):
-            print(f"🔍 WARNING: Missing some columns. Category: {cat_col}, Tag: {tag_col}, Description: {desc_col}")
-            # Use available columns
-            available_cols = [date_col]
-            if cat_col: available_cols.append(cat_col)
-            if tag_col: available_cols.append(tag_col)
-            if desc_col: available_cols.append(desc_col)
-            d_sel = d_sel[available_cols].sort_values(date_col)
-        else:
-            d_sel = d_sel[[date_col, cat_col, tag_col, desc_col]].sort_values(date_col)
-
-        # Filter peers in same ZIP
-        zip_cols = ['ZIP Code', 'Zip', 'ZIP', 'zip_code', 'zip']
-        zip_col = next((c for c in zip_cols if c in d.columns), None)
-        if zip_col and zip5:
-            d['ZIP5'] = d[zip_col].astype(str).str.replace(r'\D', '', regex=True).str.slice(0, 5)
-            d_zip = d[(d['ZIP5'] == zip5)]
-            
-            # Find provider name column for peer list
-            prov_name_cols = ['Provider Name', 'Facility Name', 'provider_name', 'facility_name', 'Name', 'name']
-            prov_name_col = next((c for c in prov_name_cols if c in d.columns), None)
-            
-            # Build list of columns for peer deficiencies
-            zip_list_cols = []
-            if prov_name_col: zip_list_cols.append(prov_name_col)
-            zip_list_cols.append(date_col)
-            if cat_col: zip_list_cols.append(cat_col)
-            if tag_col: zip_list_cols.append(tag_col)
-            if desc_col: zip_list_cols.append(desc_col)
-            
-            if zip_list_cols:
-                d_zip_list = d_zip[zip_list_cols].sort_values([prov_name_col if prov_name_col else date_col, date_col])
-            else:
-                d_zip_list = d_zip[[date_col]].sort_values(date_col)
-        else:
-            d_zip = pd.DataFrame()
-            d_zip_list = pd.DataFrame()
-
-        # Trend counts by category in same ZIP
-        if not d_zip.empty and cat_col:
-            trends = d_zip.groupby(cat_col).size().reset_index(name='count').sort_values('count', ascending=False)
-            trends_list = [{'category': str(r[cat_col]), 'count': int(r['count'])} for _, r in trends.iterrows()]
-        else:
-            trends_list = []
-
-        # Simple text summary
-        top_categories = ', '.join([f"{t['category']} ({t['count']})" for t in trends_list[:5]]) if trends_list else 'No deficiencies found'
-        summary = f"In ZIP {zip5 if zip5 else 'selected ZIP'}, the most frequent deficiency categories are: {top_categories}." if zip5 else "ZIP code not available for peer analysis."
-
-        return jsonify({
-            'facility_deficiencies': d_sel.to_dict(orient='records'),
-            'zip_deficiencies': d_zip_list.to_dict(orient='records'),
-            'zip_trends': trends_list,
-            'trend_summary': summary,
-            'zip': zip5,
-            'ccn': ccn
-        })
+        body, status = deficiencies_section(state, selected)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/state-facility-surveys/<state>')
+@cached_response
 def get_state_facility_surveys(state):
     """Return real per-facility survey dates for a state using health_deficiencies.xlsx.
     Response format: { survey_dates: [ { ccn: str, date: 'YYYY-MM-DD', facility_name: str } ] }
@@ -2641,40 +4114,17 @@ def get_state_facility_surveys(state):
     if facilities_data is None or deficiencies_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     try:
-        # Identify CCN columns in facilities data
-        ccn_cols = [c for c in facilities_data.columns if c.lower() in (
-            'ccn', 'cms certification number', 'cms certification number (ccn)'
-        )]
-        state_cols = [c for c in facilities_data.columns if c.lower() in (
-            'state', 'provider state', 'provider_state'
-        )]
-        if not ccn_cols or not state_cols:
+        if not state_partitions:
             return jsonify({'error': 'Required columns not found in facilities data'}), 500
-        ccn_col = ccn_cols[0]
-        state_col = state_cols[0]
-
-        # Build set of CCNs for the requested state
-        state_mask = facilities_data[state_col].astype(str) == str(state)
-        state_ccns = set(facilities_data.loc[state_mask, ccn_col].astype(str).str.strip())
-        if not state_ccns:
+        if not state_ccn_set(state):
             return jsonify({'survey_dates': []})
 
-        # Prepare deficiencies with CCN string and parsed date
-        d = deficiencies_data.copy()
-        def_ccn_col = None
-        for col in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-            if col in d.columns:
-                def_ccn_col = col
-                break
-        if def_ccn_col is None or 'Survey Date' not in d.columns:
+        # The state's deficiency rows with parsed date
+        if 'Survey Date' not in deficiencies_data.columns:
             return jsonify({'error': 'Required columns not found in deficiencies data'}), 500
 
-        d['CCN_STR'] = d[def_ccn_col].astype(str).str.strip()
-        d['Survey Date Parsed'] = pd.to_datetime(d['Survey Date'], errors='coerce')
-        d = d[pd.notna(d['Survey Date Parsed'])]
-
-        # Filter to CCNs in this state
-        d_state = d[d['CCN_STR'].isin(state_ccns)]
+        d_state = state_rows('deficiencies', state)
+        d_state = d_state[d_state[SURVEY_DATE_KEY].notna()]
         if d_state.empty:
             return jsonify({'survey_dates': []})
 
@@ -2685,114 +4135,239 @@ def get_state_facility_surveys(state):
                 name_col = col
                 break
 
-        records = []
-        for _, row in d_state.iterrows():
-            date_iso = row['Survey Date Parsed'].date().isoformat()
-            records.append({
-                'ccn': row['CCN_STR'],
-                'date': date_iso,
-                'facility_name': str(row[name_col]) if name_col else ''
-            })
+        names = d_state[name_col].astype(str).tolist() if name_col else [''] * len(d_state)
+        records = [
+            {'ccn': ccn, 'date': date_iso, 'facility_name': name}
+            for ccn, date_iso, name in zip(d_state[CCN_KEY], d_state[SURVEY_DATE_KEY].dt.strftime('%Y-%m-%d'), names)
+        ]
 
         return jsonify({'survey_dates': records})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def state_deficiency_trends_section(state, start_year=None, end_year=None):
+    """/api/state-deficiency-trends body and status for surveys from start_year through end_year (all where None)."""
+    # Resolve state and CCN set
+    if not state_partitions:
+        return {'error': 'Required columns not found in facilities data'}, 500
+    if not state_ccn_set(state):
+        return {'state_trends': [], 'state_trend_summary': ''}, 200
+
+    # The state's deficiency rows
+    if 'Deficiency Category' not in deficiencies_data.columns:
+        return {'error': 'Required columns not found in deficiencies data'}, 500
+
+    counts = category_group_counts('state', state, start_year=start_year, end_year=end_year)
+    if counts is None or counts.sum() == 0:
+        return {'state_trends': [], 'state_trend_summary': ''}, 200
+
+    state_trends = ranked_category_trends(counts)
+    top_categories = ', '.join([f"{t['category']} ({t['count']})" for t in state_trends[:5]]) if state_trends else 'No deficiencies found'
+    summary = f"In state {state}, the most frequent deficiency categories are: {top_categories}."
+    return {'state_trends': state_trends, 'state_trend_summary': summary}, 200
+
 @app.route('/api/state-deficiency-trends/<state>')
+@cached_response
 def get_state_deficiency_trends(state):
     """Return trends in frequency for deficiencies for the selected state.
+    Optional start_year/end_year query params count only surveys in those years.
     Response: { state_trends: [{category, count}], state_trend_summary: str }
     """
     global facilities_data, deficiencies_data
     if facilities_data is None or deficiencies_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     try:
-        # Resolve state and CCN set
-        state_columns = [c for c in facilities_data.columns if c.lower() in ('state', 'provider state', 'provider_state')]
-        ccn_columns = [c for c in facilities_data.columns if c.lower() in ('ccn', 'cms certification number', 'cms certification number (ccn)')]
-        if not state_columns or not ccn_columns:
-            return jsonify({'error': 'Required columns not found in facilities data'}), 500
-        state_col = state_columns[0]
-        ccn_col = ccn_columns[0]
-        state_mask = facilities_data[state_col].astype(str) == str(state)
-        state_ccns = set(facilities_data.loc[state_mask, ccn_col].astype(str).str.strip())
-        if not state_ccns:
-            return jsonify({'state_trends': [], 'state_trend_summary': ''})
-
-        # Prepare deficiencies CCN and filter
-        d = deficiencies_data.copy()
-        def_ccn_col = None
-        for col in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-            if col in d.columns:
-                def_ccn_col = col
-                break
-        if def_ccn_col is None or 'Deficiency Category' not in d.columns:
-            return jsonify({'error': 'Required columns not found in deficiencies data'}), 500
-
-        d['CCN_STR'] = d[def_ccn_col].astype(str).str.strip()
-        d_state = d[d['CCN_STR'].isin(state_ccns)]
-        if d_state.empty:
-            return jsonify({'state_trends': [], 'state_trend_summary': ''})
-
-        trends = d_state.groupby('Deficiency Category').size().reset_index(name='count').sort_values('count', ascending=False)
-        state_trends = [{'category': r['Deficiency Category'], 'count': int(r['count'])} for _, r in trends.iterrows()]
-        top_categories = ', '.join([f"{t['category']} ({t['count']})" for t in state_trends[:5]]) if state_trends else 'No deficiencies found'
-        summary = f"In state {state}, the most frequent deficiency categories are: {top_categories}."
-        return jsonify({'state_trends': state_trends, 'state_trend_summary': summary})
+        try:
+            start_year, end_year = requested_year_range()
+        except ValueError:
+            return jsonify({'error': 'start_year and end_year must be integers'}), 400
+        body, status = state_deficiency_trends_section(state, start_year, end_year)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def county_deficiency_trends_section(state, county, start_year=None, end_year=None):
+    """/api/county-deficiency-trends body and status for surveys from start_year through end_year (all where None)."""
+    # Get all CCNs in the state
+    if not state_partitions:
+        return {'error': 'Required columns not found in facilities data'}, 500
+    if not state_ccn_set(state):
+        return {'county_trends': [], 'county_trend_summary': ''}, 200
+
+    # The county's facilities are the state's providers listed under this County/Parish
+    counts = category_group_counts('county', state, county, start_year, end_year)
+    if counts is None:
+        return {'county_trends': [], 'county_trend_summary': ''}, 200
+
+    if 'Deficiency Category' not in deficiencies_data.columns:
+        return {'error': 'Required columns not found in deficiencies data'}, 500
+    if counts.sum() == 0:
+        return {'county_trends': [], 'county_trend_summary': ''}, 200
+
+    county_trends = ranked_category_trends(counts)
+    top_categories = ', '.join([f"{t['category']} ({t['count']})" for t in county_trends[:5]]) if county_trends else 'No deficiencies found'
+    summary = f"In {county} county, {state}, the most frequent deficiency categories are: {top_categories}."
+    return {'county_trends': county_trends, 'county_trend_summary': summary}, 200
+
 @app.route('/api/county-deficiency-trends/<state>/<county>')
 def get_county_deficiency_trends(state, county):
     """Return trends in frequency for deficiencies for facilities in a specific county.
+    Optional start_year/end_year query params count only surveys in those years.
     Response: { county_trends: [{category, count}], county_trend_summary: str }
     """
     global facilities_data, deficiencies_data, provider_info_data
     if facilities_data is None or deficiencies_data is None or provider_info_data is None:
         return jsonify({'error': 'Data not loaded'}), 500
     try:
-        # Get all CCNs in the state
-        state_columns = [c for c in facilities_data.columns if c.lower() in ('state', 'provider state', 'provider_state')]
-        ccn_columns = [c for c in facilities_data.columns if c.lower() in ('ccn', 'cms certification number', 'cms certification number (ccn)')]
-        if not state_columns or not ccn_columns:
-            return jsonify({'error': 'Required columns not found in facilities data'}), 500
-        state_col = state_columns[0]
-        ccn_col = ccn_columns[0]
-        state_mask = facilities_data[state_col].astype(str) == str(state)
-        state_ccns = set(facilities_data.loc[state_mask, ccn_col].astype(str).str.strip().str.lstrip('0').str.zfill(6))
-        if not state_ccns:
-            return jsonify({'county_trends': [], 'county_trend_summary': ''})
-
-        # Find all facilities in the same county from provider_info_data
-        ccn_col_provider = 'CMS Certification Number (CCN)'
-        county_providers = provider_info_data[
-            (provider_info_data['County/Parish'] == county) & 
-            (provider_info_data[ccn_col_provider].astype(str).str.strip().isin(state_ccns))
-        ]
-        county_ccns = set(county_providers[ccn_col_provider].astype(str).str.strip())
-        if not county_ccns:
-            return jsonify({'county_trends': [], 'county_trend_summary': ''})
-
-        # Prepare deficiencies CCN and filter
-        d = deficiencies_data.copy()
-        def_ccn_col = None
-        for col in ['CMS Certification Number (CCN)', 'CMS Certification Number', 'CCN', 'ccn']:
-            if col in d.columns:
-                def_ccn_col = col
-                break
-        if def_ccn_col is None or 'Deficiency Category' not in d.columns:
-            return jsonify({'error': 'Required columns not found in deficiencies data'}), 500
+        try:
+            start_year, end_year = requested_year_range()
+        except ValueError:
+            return jsonify({'error': 'start_year and end_year must be integers'}), 400
+        body, status = county_deficiency_trends_section(state, county, start_year, end_year)
+        return jsonify(body), status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/deficiency-trends-by-year/<state>')
+def get_deficiency_trends_by_year(state):
+    """Deficiency counts per category per survey year for a state, or one of its counties/ZIPs.
+
+    Optional query params: county (provider_info County/Parish) or zip, start_year, end_year.
+    Response: { years: [int], series: [{category, counts: [int per year], total}] } ordered by total, descending.
+    """
+    global deficiencies_data
+    if deficiencies_data is None:
+        return jsonify({'error': 'Data not loaded'}), 500
+    try:
+        try:
+            start_year, end_year = requested_year_range()
+        except ValueError:
+            return jsonify({'error': 'start_year and end_year must be integers'}), 400
+        county, zip_code = request.args.get('county'), request.args.get('zip')
+        if county:
+            group = category_cube.get('county', {}).get((normalize_state_input(state), county))
+        elif zip_code:
+            zip5 = ''.join(ch for ch in str(zip_code) if ch.isdigit())[:5]
+            group = category_cube.get('zip', {}).get((normalize_state_input(state), zip5))
+        else:
+            group = category_cube.get('state', {}).get(normalize_state_input(state))
+        if group is None:
+            return jsonify({'years': [], 'series': []})
+
+        # Undo the cumulative sum (slot 0 holds undated rows) and keep the requested years
+        years = category_cube['years']
+        per_year = np.diff(group, axis=0)[:, :-1]
+        keep = np.ones(len(years), dtype=bool)
+        if start_year is not None:
+            keep &= years >= start_year
+        if end_year is not None:
+            keep &= years <= end_year
+        per_year = per_year[keep]
+        totals = per_year.sum(axis=0)
+        order = sorted((i for i in range(len(totals)) if totals[i] > 0), key=lambda i: -totals[i])
+        series = [{'category': category_cube['categories'][i], 'counts': per_year[:, i].tolist(), 'total': int(totals[i])} for i in order]
+        return jsonify({'years': years[keep].tolist(), 'series': series})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        d['CCN_STR'] = d[def_ccn_col].astype(str).str.strip()
-        d_county = d[d['CCN_STR'].isin(county_ccns)]
-        if d_county.empty:
-            return jsonify({'county_trends': [], 'county_trend_summary': ''})
+def _run_bundle_section(section, args):
+    """section(*args) as (body, status), reporting an exception the way the section's endpoint does."""
+    try:
+        return section(*args)
+    except Exception as e:
+        return {'error': str(e)}, 500
 
-        trends = d_county.groupby('Deficiency Category').size().reset_index(name='count').sort_values('count', ascending=False)
-        county_trends = [{'category': r['Deficiency Category'], 'count': int(r['count'])} for _, r in trends.iterrows()]
-        top_categories = ', '.join([f"{t['category']} ({t['count']})" for t in county_trends[:5]]) if county_trends else 'No deficiencies found'
-        summary = f"In {county} county, {state}, the most frequent deficiency categories are: {top_categories}."
-        return jsonify({'county_trends': county_trends, 'county_trend_summary': summary})
+@app.route('/api/facility-bundle/<state>/<ccn>')
+def get_facility_bundle(state, ccn):
+    """Everything the dashboard shows for a selected facility, in one response.
+
+    The facility's /api/facilities row and its facilities row are resolved once and handed to the section helpers the
+    individual endpoints share. Response: { facility: {...}, sections: { name: { method, url, status, body } } } where
+    url is the request the dashboard makes for that section and body is exactly what the endpoint returns for it.
+    County/ZIP sections are left out when the facility has none, as are sections whose source data is not loaded.
+    """
+    global facilities_data, provider_info_data, deficiencies_data
+    if facilities_data is None:
+        return jsonify({'error': 'Data not loaded'}), 500
+    try:
+        state_code = normalize_state_input(state)
+        ccn_norm = normalize_ccn_value(ccn)
+        unique_id = facility_directory_ccns.get(state_code, {}).get(ccn_norm) if ccn_norm else None
+        if unique_id is None:
+            return jsonify({'error': f'Facility {ccn} not found in state {state}'}), 404
+        directory = facility_directory[state_code]
+        facility = directory.iloc[[unique_id]].to_dict('records')[0]
+
+        # Same identifiers the dashboard derives from the facility row before calling each endpoint
+        ccn_col = next(c for c in CCN_COLUMN_CANDIDATES if c in directory.columns)
+        facility_state = facility.get('State') or state_code
+        facility_id = facility['unique_id']
+        facility_ccn = facility.get(ccn_col) or ccn
+        facility_name = facility.get('Provider Name') or facility.get('provider_name') or 'Unknown Facility'
+        county = facility.get('County/Parish') or ''
+        zip_code = facility.get('ZIP Code') or facility.get('Zip') or ''
+        selected = select_state_facility(facility_state, facility_id, facility_ccn)
+        by_facility = {'state': facility_state, 'facility_id': facility_id}
+
+        # name -> (method, url, section helper, helper args)
+        sections = {
+            'provider_names': ('GET', url_for('get_provider_names_for_ccn', ccn=facility_ccn),
+                               provider_names_section, (facility_ccn,)),
+            'survey_dates': ('GET', url_for('get_survey_dates', **by_facility, ccn=facility_ccn, name=facility_name),
+                             survey_dates_section, (facility_state, normalize_ccn_value(str(facility_ccn)), facility_name.strip())),
+            'facility_survey_dates': ('GET', url_for('get_facility_survey_dates', **by_facility, ccn=facility_ccn),
+                                      facility_survey_dates_section, (selected,)),
+            'state_average_interval': ('GET', url_for('get_state_average_interval', state=facility_state),
+                                       gap_interval_section, (survey_gap_table.get('state', {}).get(normalize_state_input(facility_state)), 1095)),
+            'state_average_2year_interval': ('GET', url_for('get_state_average_2year_interval', state=facility_state),
+                                             gap_interval_section, (survey_gap_table.get('state_recent', {}).get(normalize_state_input(facility_state)), 730)),
+            'similar_characteristics_interval': ('POST', url_for('get_similar_characteristics_interval', state=facility_state),
+                                                 similar_characteristics_section, (facility_state, facility, SIMILARITY_NEIGHBORS)),
+            'similar_deficiencies_interval': ('POST', url_for('get_similar_deficiencies_interval', state=facility_state),
+                                              similar_deficiencies_section, (facility_state, facility, SIMILARITY_NEIGHBORS)),
+            'combined_criteria_2year_interval': ('POST', url_for('get_combined_criteria_2year_interval', state=facility_state),
+                                                 combined_criteria_section, (facility_state, facility, SIMILARITY_NEIGHBORS, dict(COMBINED_CRITERIA_WEIGHTS))),
+            'ml_forecast': ('POST', url_for('ml_forecast'), ml_forecast_section, (str(facility_state).strip(), str(facility_ccn).strip())),
+        }
+        if provider_info_data is not None:
+            sections['zip_peer_survey_dates'] = ('GET', url_for('get_zip_peer_survey_dates', **by_facility, ccn=facility_ccn, county=county or None),
+                                                 zip_peer_survey_dates_section, (facility_state, selected, county))
+        if deficiencies_data is not None:
+            sections['deficiencies'] = ('GET', url_for('get_deficiencies_for_facility_and_zip', **by_facility, ccn=facility_ccn),
+                                        deficiencies_section, (facility_state, selected))
+            sections['state_deficiency_trends'] = ('GET', url_for('get_state_deficiency_trends', state=facility_state),
+                                                   state_deficiency_trends_section, (facility_state,))
+        if county:
+            if provider_info_data is not None:
+                sections['zip_average_interval'] = ('GET', url_for('get_zip_average_interval', state=facility_state, county=county),
+                                                    gap_interval_section, (survey_gap_table.get('county', {}).get((normalize_state_input(facility_state), county)), 1095))
+            if deficiencies_data is not None:
+                counts, _ = histogram_group('county', facility_state, normalize_county_name(county))
+                sections['county_monthly_surveys'] = ('GET', url_for('get_county_monthly_surveys', state=facility_state, county=county),
+                                                      histogram_section, (counts, histogram_year_slice()))
+            if deficiencies_data is not None and provider_info_data is not None:
+                sections['county_deficiency_trends'] = ('GET', url_for('get_county_deficiency_trends', state=facility_state, county=county),
+                                                        county_deficiency_trends_section, (facility_state, county))
+        if zip_code and deficiencies_data is not None:
+            sections['zip_monthly_surveys'] = ('GET', url_for('get_zip_monthly_surveys', state=facility_state, zip=zip_code),
+                                               zip_monthly_surveys_section, (facility_state, zip_code, None, histogram_year_slice()))
+        if selected is None:
+            # Nothing for the facilities-row sections to work from; their endpoints answer for themselves
+            for name in ('facility_survey_dates', 'zip_peer_survey_dates', 'deficiencies'):
+                sections.pop(name, None)
+
+        if BUNDLE_WORKERS > 1:
+            with ThreadPoolExecutor(max_workers=BUNDLE_WORKERS) as pool:
+                futures = {name: pool.submit(_run_bundle_section, spec[2], spec[3]) for name, spec in sections.items()}
+                results = {name: future.result() for name, future in futures.items()}
+        else:
+            results = {name: _run_bundle_section(spec[2], spec[3]) for name, spec in sections.items()}
+
+        return jsonify({
+            'facility': facility,
+            'sections': {name: {'method': sections[name][0], 'url': sections[name][1], 'status': status, 'body': body}
+                         for name, (body, status) in results.items()}
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,421 @@
+import argparse
+import bisect
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# The Section 6 forecasts, each replayed as it would have answered at every past survey
+MODELS = ('ml_forecast', 'state_average', 'county_average', 'state_2year', 'similar_characteristics', 'similar_deficiencies', 'combined_2year')
+# Peers ranked per facility, so SIMILARITY_NEIGHBORS of them can still be found among those with a survey gap by the cutoff
+PEER_CANDIDATES_FACTOR = 4
+# History lengths (surveys known at the cutoff) from this many up are reported together
+HISTORY_BUCKET_MAX = 8
+# Day numbers are below this, so ccn_code * KEY_SPAN + day sorts gaps by CCN, then end date
+KEY_SPAN = 1_000_000
+# Deficiency profiles are rebuilt as of each quarter start from the citations before it, so peers ranked on them at a
+# cutoff never see a later citation
+PROFILE_SNAPSHOT_FREQ = 'QS'
+
+dashboard = None
+gap_index = {}
+profile_snapshots = {}
+county_ccns = {}
+
+
+def _quiet_import_dashboard():
+    # Dashboard loads its data at import time and is chatty about it; the forecast table is not needed here
+    os.environ['ATHENA_FORECASTS'] = 'off'
+    with contextlib.redirect_stdout(io.StringIO()):
+        import Dashboard
+    return Dashboard
+
+
+def build_gap_index() -> None:
+    """Every survey_gap_table gap as flat arrays sorted by (CCN, end date), so a CCN's gaps up to a date are one searchsorted."""
+    global gap_index
+    gaps = dashboard.survey_gap_table['gaps']
+    codes, ccns = pd.factorize(gaps[dashboard.CCN_KEY])
+    end_days = gaps['end'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    keys = codes.astype(np.int64) * KEY_SPAN + end_days
+    order = np.argsort(keys, kind='stable')
+    gap_index = {
+        'ccns': pd.Index(ccns),
+        'keys': keys[order],
+        'days': gaps['days'].to_numpy(dtype=float)[order],
+        'offsets': np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(ccns)))]),
+    }
+
+
+def build_profile_snapshots() -> None:
+    """deficiency_profile_matrix as of every PROFILE_SNAPSHOT_FREQ start in the data, each from the citations before it,
+    plus each snapshot's profile row for every similarity_index row (as combined_peer_scores takes them)."""
+    global profile_snapshots
+    D = dashboard
+    cited = D.deficiency_citations()
+    if cited is None:
+        profile_snapshots = {'starts': np.empty(0, dtype=np.int64), 'indexes': []}
+        return
+    cited = cited.dropna(subset=[D.SURVEY_DATE_KEY]).sort_values(D.SURVEY_DATE_KEY, kind='stable')
+    dates = cited[D.SURVEY_DATE_KEY]
+    starts = pd.date_range(dates.min().to_period('Q').start_time, dates.max(), freq=PROFILE_SNAPSHOT_FREQ) if len(dates) else []
+    similarity_ccns = D.similarity_index['ccns'] if D.similarity_index else np.empty(0, dtype=object)
+    indexes = []
+    for start in starts:
+        before = int(np.searchsorted(dates.to_numpy(), start.to_datetime64(), side='left'))
+        profiles = D.deficiency_profile_matrix(cited.iloc[:before], start) if before else {}
+        if profiles:
+            profiles['similarity_rows'] = np.array([profiles['positions'].get(c, -1) for c in similarity_ccns], dtype=np.intp)
+        indexes.append(profiles)
+    profile_snapshots = {'starts': np.asarray(starts, dtype='datetime64[D]').astype(np.int64), 'indexes': indexes}
+
+
+def _pooled_date_medians(dates: np.ndarray, cutoffs: np.ndarray) -> np.ndarray:
+    """area_fallback_interval_days' median gap between consecutive pooled survey dates, using the dates up to each cutoff."""
+    days = np.unique(np.asarray(dates, dtype='datetime64[D]').astype(np.int64))
+    return _rolling_medians(days[1:], np.diff(days).astype(float), cutoffs)
+
+
+def _row_medians(block: np.ndarray) -> np.ndarray:
+    """Median of the non-NaN values in each row (NaN for an all-NaN row)."""
+    if block.shape[1] == 0:
+        return np.full(len(block), np.nan)
+    ordered = np.sort(block, axis=1)
+    n = (~np.isnan(block)).sum(axis=1)
+    rows = np.arange(len(block))
+    medians = (ordered[rows, np.maximum(n - 1, 0) // 2] + ordered[rows, n // 2]) / 2
+    return np.where(n > 0, medians, np.nan)
+
+
+def _range_medians(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """Median of gap_index['days'][start:stop] per range (NaN if empty), each distinct range computed once."""
+    pairs, inverse = np.unique(starts * KEY_SPAN + stops, return_inverse=True)
+    starts, stops = pairs // KEY_SPAN, pairs % KEY_SPAN
+    width = int((stops - starts).max()) if len(pairs) else 0
+    index = starts[:, None] + np.arange(width)
+    block = np.where(index < stops[:, None], gap_index['days'][np.minimum(index, len(gap_index['days']) - 1)], np.nan)
+    return _row_medians(block)[inverse.ravel()]
+
+
+def _rolling_medians(end_days: np.ndarray, gap_days: np.ndarray, query_days: np.ndarray, window_days: Optional[int] = None) -> np.ndarray:
+    """Median of the gaps ending on or before each query day (and no more than window_days before it), NaN if none.
+
+    Walks the queries in date order, keeping the gaps in range in a sorted list.
+    """
+    order = np.argsort(end_days, kind='stable')
+    ends, values = end_days[order].tolist(), gap_days[order].tolist()
+    medians = np.full(len(query_days), np.nan)
+    in_range, added, removed = [], 0, 0
+    for q in np.argsort(query_days, kind='stable'):
+        day = query_days[q]
+        while added < len(ends) and ends[added] <= day:
+            bisect.insort(in_range, values[added])
+            added += 1
+        while window_days is not None and removed < added and ends[removed] < day - window_days:
+            del in_range[bisect.bisect_left(in_range, values[removed])]
+            removed += 1
+        if in_range:
+            n = len(in_range)
+            medians[q] = (in_range[(n - 1) // 2] + in_range[n // 2]) / 2
+    return medians
+
+
+def _area_default(days: np.ndarray, max_days: int) -> np.ndarray:
+    # gap_interval_response: the median clamped to 30..max_days, 365 without data
+    return np.where(np.isnan(days), 365, np.clip(np.round(days), 30, max_days))
+
+
+def _first_k_valid(values: np.ndarray, k: int) -> np.ndarray:
+    """values with everything past the first k non-NaN entries of each row set to NaN."""
+    valid = ~np.isnan(values)
+    return np.where(valid & (np.cumsum(valid, axis=1) <= k), values, np.nan)
+
+
+def _smallest_columns(values: np.ndarray, width: int) -> np.ndarray:
+    """Column indices of each row's width smallest values, smallest first (ties by column)."""
+    if width < values.shape[1]:
+        columns = np.sort(np.argpartition(values, width - 1, axis=1)[:, :width], axis=1)
+    else:
+        columns = np.tile(np.arange(values.shape[1]), (len(values), 1))
+    order = np.argsort(np.take_along_axis(values, columns, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1)
+
+
+def _peer_gap_ranges(peer_ccns: np.ndarray, cutoffs: np.ndarray, window_days: Optional[int] = None):
+    """(starts, stops) into gap_index of each peer's gaps ending by the query's cutoff (within window_days of it)."""
+    codes = gap_index['ccns'].get_indexer(peer_ccns.ravel()).reshape(peer_ccns.shape)
+    known = codes >= 0
+    base = np.where(known, codes, 0).astype(np.int64) * KEY_SPAN
+    stops = np.searchsorted(gap_index['keys'], base + cutoffs[:, None], side='right')
+    if window_days is None:
+        starts = gap_index['offsets'][np.where(known, codes, 0)]
+    else:
+        starts = np.searchsorted(gap_index['keys'], base + cutoffs[:, None] - window_days, side='left')
+    return np.where(known, starts, 0), np.where(known, stops, 0)
+
+
+def _characteristic_peers(code: str, ccns: list, k: int) -> np.ndarray:
+    """(len(ccns), k * PEER_CANDIDATES_FACTOR) object array of in-state peer CCNs by scaled features, best first ('' pads)."""
+    D = dashboard
+    width = k * PEER_CANDIDATES_FACTOR
+    peers = np.full((len(ccns), width), '', dtype=object)
+    index = D.similarity_index
+    if index:
+        candidates = index['providers_by_state'].get(code, D._NO_ROWS)
+        rows = np.array([index['positions'].get(c, -1) for c in ccns])
+        queries = np.flatnonzero(rows >= 0)
+        if len(candidates) and len(queries):
+            a, b = index['features'][rows[queries]], index['features'][candidates]
+            distances = np.sqrt(np.maximum((a ** 2).sum(axis=1)[:, None] + (b ** 2).sum(axis=1)[None, :] - 2 * a @ b.T, 0.0))
+            distances[rows[queries][:, None] == candidates[None, :]] = np.inf
+            nearest = _smallest_columns(distances, width)
+            found = np.where(np.isfinite(np.take_along_axis(distances, nearest, axis=1)), index['ccns'][candidates][nearest], '')
+            peers[queries, :found.shape[1]] = found
+    return peers
+
+
+def _profile_peers(code: str, ccns: list, k: int, profiles: dict) -> dict:
+    """'similar_deficiencies' and 'combined_2year' peer arrays as in _characteristic_peers, plus the combined-criteria
+    scores, ranked on one profile_snapshots index ({} before the first citation: no deficiency similarity at all)."""
+    D = dashboard
+    width = k * PEER_CANDIDATES_FACTOR
+    peers = {name: np.full((len(ccns), width), '', dtype=object) for name in ('similar_deficiencies', 'combined_2year')}
+    peers['combined_scores'] = np.zeros((len(ccns), width))
+    index = D.similarity_index
+    if index and D.combined_peer_index:
+        candidates = index['providers_by_state'].get(code, D._NO_ROWS)
+        rows = np.array([index['positions'].get(c, -1) for c in ccns])
+        queries = np.flatnonzero(rows >= 0)
+        similarity_rows = profiles['similarity_rows'] if profiles else np.full(len(index['ccns']), -1, dtype=np.intp)
+        if len(candidates) and len(queries):
+            for i, (found, scores) in zip(queries, D.top_combined_peers(rows[queries], candidates, D.COMBINED_CRITERIA_WEIGHTS, width,
+                                                                        (profiles, similarity_rows))):
+                peers['combined_2year'][i, :len(found)] = index['ccns'][found]
+                peers['combined_scores'][i, :len(found)] = scores
+    if profiles:
+        members = np.array(sorted(profiles['positions'][c] for c in D.state_partitions.get(code, {}).get('ccns', ()) if c in profiles['positions']), dtype=np.intp)
+        rows = np.array([profiles['positions'].get(c, -1) for c in ccns])
+        queries = np.flatnonzero(rows >= 0)
+        if len(members) and len(queries):
+            dense = D._dense_deficiency_profiles(members, profiles)
+            scores = D._dense_deficiency_profiles(rows[queries], profiles) @ dense.T
+            scores[rows[queries][:, None] == members[None, :]] = -np.inf
+            scores[scores <= 0] = -np.inf
+            best = _smallest_columns(-scores, width)
+            found = np.where(np.isfinite(np.take_along_axis(scores, best, axis=1)), profiles['ccns'][members][best], '')
+            peers['similar_deficiencies'][queries, :found.shape[1]] = found
+    return peers
+
+
+def backtest_state(task) -> pd.DataFrame:
+    """Every (survey, next survey) pair of one state's facilities with each model's predicted gap, using only the
+    survey gaps that had ended, survey dates up to and deficiencies cited before the earlier survey."""
+    code, ccns, ccn_counties = task
+    D = dashboard
+    history = D.survey_history
+    k = D.SIMILARITY_NEIGHBORS
+    window = D.RECENT_SURVEY_WINDOW_DAYS
+
+    positions = np.array([history['positions'][c] for c in ccns], dtype=np.int64)
+    starts = history['offsets'][positions]
+    lengths = history['offsets'][positions + 1] - starts
+    segment = np.repeat(np.arange(len(ccns)), lengths)
+    days = history['dates'][D.concatenated_ranges(starts, lengths)].astype('datetime64[D]').astype(np.int64)
+    first = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    rank = np.arange(len(days)) - first[segment]
+    # A query is every survey that has a next one: predict that gap from what was known on the survey date
+    queries = np.flatnonzero(np.append(segment[1:] == segment[:-1], False))
+    q_segment, q_rank, cutoffs = segment[queries], rank[queries], days[queries]
+    actual = days[queries + 1] - cutoffs
+    result = {'ccn': np.asarray(ccns, dtype=object)[q_segment], 'state': code, 'cutoff': cutoffs.astype('datetime64[D]'),
+              'surveys_known': q_rank + 1, 'actual': actual}
+
+    # Area models, from the state's and each county's gaps ending by the cutoff
+    members = D.survey_gap_table['members']
+    gaps = D.survey_gap_table['gaps']
+    gaps = gaps[gaps[D.CCN_KEY].isin(members['state'].loc[members['state']['state'] == code, D.CCN_KEY])]
+    end_days = gaps['end'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    gap_days = gaps['days'].to_numpy(dtype=float)
+    result['state_average'] = _area_default(_rolling_medians(end_days, gap_days, cutoffs), 1095)
+    result['state_2year'] = _area_default(_rolling_medians(end_days, gap_days, cutoffs, window), 730)
+    # County membership is the state's provider_info rows, so its gaps are a subset of the state's
+    county_days = np.full(len(queries), np.nan)
+    counties = np.asarray(ccn_counties, dtype=object)[q_segment]
+    county_members = members['county'][members['county']['state'] == code]
+    for county, member_ccns in county_members.groupby('county')[D.CCN_KEY]:
+        asked = np.flatnonzero(counties == county)
+        if len(asked):
+            pooled = gaps[D.CCN_KEY].isin(member_ccns).to_numpy()
+            county_days[asked] = _rolling_medians(end_days[pooled], gap_days[pooled], cutoffs[asked])
+    result['county_average'] = _area_default(county_days, 1095)
+
+    # ml_forecast: AR(1) over the intervals known so far, the last interval with only one, else the area fallback
+    intervals = np.where(rank > 0, np.diff(days, prepend=0), 0).astype(float)
+    previous = np.where(rank > 1, np.roll(intervals, 1), 0.0)
+    paired = (rank > 1).astype(float)
+
+    def through_query(values):
+        # Sum of values over each query's segment up to and including the query's own survey
+        totals = np.concatenate([[0.0], np.cumsum(values)])
+        return totals[queries + 1] - totals[first[q_segment]]
+
+    n, last = np.maximum(q_rank - 1, 0).astype(float), intervals[queries]
+    predicted = D.ar1_next_interval(n, through_query(paired * previous), through_query(paired * intervals),
+                                    through_query(paired * previous ** 2), through_query(paired * previous * intervals), last)
+    predicted = np.where(q_rank >= 2, predicted, last)
+    # The fallback is area_fallback_interval_days over the dates up to the cutoff: the median gap between the pooled
+    # survey dates of the county's facilities (every provider_info row in that county), else of the state's, else 365
+    alone = np.flatnonzero(q_rank == 0)
+    fallback = np.full(len(queries), np.nan)
+    for county in np.unique(counties[alone]):
+        asked = alone[counties[alone] == county]
+        if county:
+            fallback[asked] = _pooled_date_medians(D.survey_history_dates(county_ccns.get(county, ())), cutoffs[asked])
+    pending = alone[np.isnan(fallback[alone])]
+    if len(pending):
+        fallback[pending] = _pooled_date_medians(D.survey_history_dates(D.state_ccn_set(code)), cutoffs[pending])
+    fallback = np.where(np.isnan(fallback), 365, np.clip(np.round(fallback), 30, 730))
+    predicted_days = np.where(q_rank >= 1, D.seasonal_interval_days(np.nan_to_num(predicted)), fallback)
+    forecast = D.nearest_mondays((cutoffs + predicted_days).astype('datetime64[D]'))
+    result['ml_forecast'] = forecast.astype(np.int64) - cutoffs
+
+    # Peer models, each peer contributing its gaps that had ended by the cutoff. Characteristics peers come from the
+    # current load's features; deficiency and combined peers from the latest profile snapshot on or before the cutoff
+    width = k * PEER_CANDIDATES_FACTOR
+    peers = {'similar_characteristics': _characteristic_peers(code, ccns, k)[q_segment],
+             'similar_deficiencies': np.full((len(queries), width), '', dtype=object),
+             'combined_2year': np.full((len(queries), width), '', dtype=object),
+             'combined_scores': np.zeros((len(queries), width))}
+    snapshot_of = np.searchsorted(profile_snapshots['starts'], cutoffs, side='right') - 1
+    for snapshot in np.unique(snapshot_of):
+        asked = np.flatnonzero(snapshot_of == snapshot)
+        segments, inverse = np.unique(q_segment[asked], return_inverse=True)
+        ranked = _profile_peers(code, [ccns[s] for s in segments], k, profile_snapshots['indexes'][snapshot] if snapshot >= 0 else {})
+        for name, values in ranked.items():
+            peers[name][asked] = values[inverse.ravel()]
+    for name in ('similar_characteristics', 'similar_deficiencies'):
+        ranges = _peer_gap_ranges(peers[name], cutoffs)
+        values = _range_medians(*(r.ravel() for r in ranges)).reshape(ranges[0].shape)
+        result[name] = _area_default(_row_medians(_first_k_valid(values, k)), 1095)
+    ranges = _peer_gap_ranges(peers['combined_2year'], cutoffs, window)
+    values = _first_k_valid(_range_medians(*(r.ravel() for r in ranges)).reshape(ranges[0].shape), k)
+    weights = np.where(np.isnan(values), 0.0, np.clip(peers['combined_scores'], 1e-9, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        combined = (np.nan_to_num(values) * weights).sum(axis=1) / weights.sum(axis=1)
+    result['combined_2year'] = _area_default(combined, 730)
+    return pd.DataFrame(result)
+
+
+def _error_summary(frame: pd.DataFrame, by: Optional[str] = None) -> pd.DataFrame:
+    """n, MAE and bias (mean predicted minus actual days) per model, optionally per value of column by."""
+    errors = pd.DataFrame({model: frame[model] - frame['actual'] for model in MODELS})
+    if by is not None:
+        errors[by] = frame[by]
+    melted = errors.melt(id_vars=[by] if by else None, var_name='model', value_name='error')
+    grouped = melted.assign(abs_error=melted['error'].abs()).groupby(([by] if by else []) + ['model'], sort=False)
+    return pd.DataFrame({'n': grouped.size(), 'mae': grouped['abs_error'].mean(), 'bias': grouped['error'].mean()})
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    global dashboard, county_ccns
+    parser = argparse.ArgumentParser(description="Backtest the Section 6 survey forecasts: replay every facility's history, predicting each next "
+                                                 "survey from the data available at the survey before it. Run from the directory holding the data files.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes to run the states on")
+    parser.add_argument("--states", nargs="+", help="Only these states (default: all)")
+    parser.add_argument("--since", help="Only score predictions made on or after this date (YYYY-MM-DD); earlier data still feeds the models")
+    parser.add_argument("--json", help="Also write the full report to this file")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    dashboard = _quiet_import_dashboard()
+    if not dashboard.survey_history or not dashboard.survey_gap_table:
+        print("No survey data loaded; nothing to backtest", file=sys.stderr)
+        return 1
+    build_gap_index()
+    build_profile_snapshots()
+    loaded = time.perf_counter() - started
+
+    # Each CCN is replayed in its own state, taken as ml_forecast's batch does (provider_info 'State' if it has no survey row)
+    home = pd.Series(dashboard.survey_history['home_states'], index=list(dashboard.survey_history['positions']))
+    providers = dashboard.provider_info_data
+    if providers is not None and 'State' in providers.columns:
+        provider_states = providers.dropna(subset=[dashboard.CCN_KEY]).drop_duplicates(subset=[dashboard.CCN_KEY]).set_index(dashboard.CCN_KEY)['State']
+        home = home.where(home != '', home.index.map(provider_states).fillna(''))
+    home = home.astype(str).str.strip().str.upper()
+    wanted = {dashboard.normalize_state_input(s) for s in args.states} if args.states else None
+    # The county ccn_county_name gives, for every CCN at once
+    county_col = next((c for c in ['County/Parish', 'County', 'County Name', 'county_name'] if providers is not None and c in providers.columns), None)
+    counties = pd.Series('', index=home.index, dtype=object)
+    if county_col:
+        first_rows = providers.dropna(subset=[dashboard.CCN_KEY]).drop_duplicates(subset=[dashboard.CCN_KEY]).set_index(dashboard.CCN_KEY)[county_col]
+        counties = home.index.to_series().map(first_rows.dropna().astype(str)).fillna('')
+        # area_fallback_interval_days pools every provider_info row in the county, whatever its state
+        in_county = providers.dropna(subset=[dashboard.CCN_KEY, county_col])
+        county_ccns = {county: set(members) for county, members in in_county.groupby(in_county[county_col].astype(str))[dashboard.CCN_KEY]}
+    tasks = [(code, sorted(ccns), counties[sorted(ccns)].tolist()) for code, ccns in home.index.groupby(home.to_numpy()).items()
+             if code and (wanted is None or code in wanted)]
+    tasks.sort(key=lambda task: -len(task[1]))
+
+    if args.workers > 1 and len(tasks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            frames = list(pool.map(backtest_state, tasks))
+    else:
+        frames = [backtest_state(task) for task in tasks]
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        print("No facility has two surveys to compare", file=sys.stderr)
+        return 1
+    results = pd.concat(frames, ignore_index=True)
+    if args.since:
+        results = results[results['cutoff'] >= np.datetime64(pd.Timestamp(args.since).date(), 'D')]
+    results['history'] = np.minimum(results['surveys_known'], HISTORY_BUCKET_MAX).astype(str).str.replace(str(HISTORY_BUCKET_MAX), f'{HISTORY_BUCKET_MAX}+', regex=False)
+    elapsed = time.perf_counter() - started
+
+    overall = _error_summary(results)
+    by_history = _error_summary(results, 'history')
+    by_state = _error_summary(results, 'state')
+    print(f"Backtest: {len(results)} predictions over {results['ccn'].nunique()} facilities in {len(tasks)} states, "
+          f"{elapsed:.1f}s ({loaded:.1f}s loading, {max(1, args.workers)} worker(s))")
+    print()
+    print(f"{'model':<26}{'n':>10}{'MAE days':>12}{'bias days':>12}")
+    for model, row in overall.iterrows():
+        print(f"{model:<26}{int(row['n']):>10}{row['mae']:>12.1f}{row['bias']:>12.1f}")
+    for title, table, label in (("MAE by surveys known at the cutoff", by_history, 'history'), ("MAE by state", by_state, 'state')):
+        print()
+        print(title)
+        mae = table['mae'].unstack('model')[list(MODELS)]
+        if label == 'history':
+            mae = mae.loc[sorted(mae.index, key=lambda h: int(h.rstrip('+')))]
+        print(mae.round(1).to_string())
+
+    if args.json:
+        def records(table):
+            out = {}
+            for (key, model), row in table.iterrows():
+                out.setdefault(key, {})[model] = {'n': int(row['n']), 'mae': round(float(row['mae']), 2), 'bias': round(float(row['bias']), 2)}
+            return out
+        report = {
+            'dataset_version': dashboard.data_load_stats.get('dataset_version'),
+            'predictions': len(results),
+            'facilities': int(results['ccn'].nunique()),
+            'since': args.since,
+            'models': {model: {'n': int(row['n']), 'mae': round(float(row['mae']), 2), 'bias': round(float(row['bias']), 2)} for model, row in overall.iterrows()},
+            'by_history': records(by_history),
+            'by_state': records(by_state),
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,402 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from typing import Callable, Optional
+
+import pandas as pd
+
+
+def _quiet_import_dashboard():
+    # Dashboard loads its data at import time and is chatty about it
+    with contextlib.redirect_stdout(io.StringIO()):
+        import Dashboard
+    return Dashboard
+
+
+def _time_call(fn: Callable, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _report(label: str, timings: list[float]) -> float:
+    median = statistics.median(timings)
+    print(f"{label:<40} median {median * 1000:10.2f} ms   min {min(timings) * 1000:10.2f} ms   (n={len(timings)})")
+    return median
+
+
+def bench_startup(repeat: int) -> None:
+    """Compare a cold CSV parse of the three datasets against loading the binary snapshot."""
+    dashboard = _quiet_import_dashboard()
+    csv_median = _report("load_facilities_data (CSV)", _time_call(lambda: dashboard.load_facilities_data(use_snapshot=False), repeat))
+    # Make sure a fresh snapshot exists before timing the snapshot path
+    with contextlib.redirect_stdout(io.StringIO()):
+        dashboard.write_data_snapshot(csv_median)
+    snap_median = _report("load_facilities_data (snapshot)", _time_call(dashboard.load_facilities_data, repeat))
+    if dashboard.data_load_stats.get('source') != 'snapshot':
+        print("Warning: snapshot was not used (is pyarrow installed and ATHENA_DATA_SNAPSHOT enabled?)")
+    print(f"Snapshot speedup: {csv_median / max(snap_median, 1e-9):.1f}x")
+
+
+def bench_lookups(repeat: int, sample: int) -> None:
+    """Per-facility row lookups over all three frames: CCN_KEY boolean-mask scans versus ccn_index hits."""
+    dashboard = _quiet_import_dashboard()
+    if dashboard.deficiencies_data is None:
+        print("Deficiency data is not loaded; nothing to benchmark")
+        return
+    _report("build_ccn_index", _time_call(dashboard.build_ccn_index, repeat))
+
+    frames = dashboard._loaded_frames()
+    ccns = dashboard.deficiencies_data[dashboard.CCN_KEY].dropna().drop_duplicates()
+    ccns = ccns.sample(min(sample, len(ccns)), random_state=0).tolist()
+    print(f"Looking up {len(ccns)} CCNs ({len(dashboard.deficiencies_data)} deficiency rows)")
+
+    def mask_scans():
+        for ccn in ccns:
+            for df in frames.values():
+                if df is not None:
+                    df[df[dashboard.CCN_KEY] == ccn]
+
+    def index_hits():
+        for ccn in ccns:
+            for name, df in frames.items():
+                if df is not None:
+                    dashboard.rows_for_ccn(name, ccn)
+
+    scan_median = _report("mask scan (3 frames)", _time_call(mask_scans, repeat))
+    index_median = _report("ccn_index hit (3 frames)", _time_call(index_hits, repeat))
+    print(f"Per lookup: scan {scan_median / len(ccns) * 1e6:.0f} us, index {index_median / len(ccns) * 1e6:.0f} us "
+          f"({scan_median / max(index_median, 1e-9):.1f}x faster)")
+
+
+def _parse_rows_one_at_a_time(values) -> list:
+    # What the timeline endpoints did per request before dates were parsed at load
+    out = []
+    for value in values:
+        date_str = str(value)
+        if not date_str or date_str in ('nan', 'None'):
+            continue
+        parsed = pd.to_datetime(date_str, errors='coerce')
+        if not pd.isna(parsed) and pd.Timestamp('2016-01-01') <= parsed <= pd.Timestamp('2027-12-31'):
+            out.append(parsed.strftime('%Y-%m-%d'))
+    return out
+
+
+def bench_timelines(repeat: int, sample: int) -> None:
+    """Survey-date timelines: per-row parsing (old) versus the load-time datetime64 column (new), plus endpoint timings."""
+    dashboard = _quiet_import_dashboard()
+    facilities = dashboard.facilities_data
+    if facilities is None:
+        print("Facility data is not loaded; nothing to benchmark")
+        return
+    date_col = next((c for c in dashboard.SURVEY_DATE_COLUMNS if c in facilities.columns), None)
+    if date_col is None:
+        print("No survey date column in facility data")
+        return
+    _report("parse_survey_date_series (load time)", _time_call(lambda: dashboard.parse_survey_date_series(facilities[date_col]), repeat))
+
+    states = sorted(dashboard.state_partitions)[:sample]
+    per_row = _report("per-row parse, all states", _time_call(
+        lambda: [_parse_rows_one_at_a_time(dashboard.state_rows('facilities', st)[date_col]) for st in states], repeat))
+
+    def precomputed():
+        for st in states:
+            rows = dashboard.state_rows('facilities', st)
+            rows.loc[rows[dashboard.IN_TIMELINE_KEY], dashboard.SURVEY_DATE_KEY].dt.strftime('%Y-%m-%d').tolist()
+
+    vectorized = _report("precomputed mask, all states", _time_call(precomputed, repeat))
+    print(f"Timeline filtering speedup: {per_row / max(vectorized, 1e-9):.1f}x")
+
+    client = dashboard.app.test_client()
+    ccns = facilities[dashboard.CCN_KEY].dropna().drop_duplicates()
+    ccns = ccns.sample(min(sample, len(ccns)), random_state=0)
+    state_col = next(c for c in dashboard.FACILITY_STATE_COLUMNS if c in facilities.columns)
+    targets = [(str(facilities.loc[facilities[dashboard.CCN_KEY] == ccn, state_col].iloc[0]), ccn) for ccn in ccns]
+    for label, url in [
+        ("/api/survey-dates", "/api/survey-dates/{state}/0?ccn={ccn}"),
+        ("/api/zip-peer-survey-dates", "/api/zip-peer-survey-dates/{state}/0?ccn={ccn}"),
+        ("/api/nearby-peer-survey-dates", "/api/nearby-peer-survey-dates/{state}/0?ccn={ccn}"),
+        ("/api/state-facility-surveys", "/api/state-facility-surveys/{state}"),
+    ]:
+        timings = _time_call(lambda: [client.get(url.format(state=st, ccn=ccn)) for st, ccn in targets], repeat)
+        _report(f"{label} x{len(targets)}", timings)
+
+
+def bench_facilities(repeat: int) -> None:
+    """/api/facilities/<state> response time for the largest states (target: under 50 ms)."""
+    dashboard = _quiet_import_dashboard()
+    if not dashboard.facility_directory:
+        print("Facility directory is empty; nothing to benchmark")
+        return
+    _report("build_facility_directory", _time_call(dashboard.build_facility_directory, repeat))
+    client = dashboard.app.test_client()
+    largest = sorted(dashboard.facility_directory, key=lambda code: len(dashboard.facility_directory[code]), reverse=True)[:3]
+    for code in largest:
+        _report(f"/api/facilities/{code} ({len(dashboard.facility_directory[code])} facilities)",
+                _time_call(lambda: client.get(f"/api/facilities/{code}"), repeat))
+
+
+def bench_nearby(repeat: int, sample: int) -> None:
+    """Radius queries: haversine over every facility (old) versus the lat/lon grid index (new)."""
+    dashboard = _quiet_import_dashboard()
+    geo = dashboard.geo_index
+    if not geo or not len(geo['ccns']):
+        print("Geo index is empty; nothing to benchmark")
+        return
+    _report("build_geo_index", _time_call(dashboard.build_geo_index, repeat))
+    picks = pd.Series(range(len(geo['ccns']))).sample(min(sample, len(geo['ccns'])), random_state=0).tolist()
+    print(f"Querying {len(picks)} facilities ({len(geo['ccns'])} with coordinates)")
+    for radius in (10.0, 60.0):
+        def full_scan():
+            for i in picks:
+                miles = dashboard.haversine_miles_array(geo['lat'][i], geo['lon'][i], geo['lat'], geo['lon'])
+                geo['ccns'][miles <= radius]
+
+        def grid():
+            for i in picks:
+                dashboard.query_geo_index(geo['lat'][i], geo['lon'][i], radius)
+
+        scan_median = _report(f"full haversine scan ({radius:.0f} mi)", _time_call(full_scan, repeat))
+        grid_median = _report(f"grid index query ({radius:.0f} mi)", _time_call(grid, repeat))
+        print(f"Per query at {radius:.0f} mi: scan {scan_median / len(picks) * 1e6:.0f} us, grid {grid_median / len(picks) * 1e6:.0f} us")
+    # National space-time clustering behind /api/survey-waves (built once per dataset version)
+    _report("build_survey_wave_table", _time_call(dashboard.build_survey_wave_table, repeat))
+
+
+def bench_similar(repeat: int, sample: int) -> None:
+    """POST the similar-characteristics / similar-deficiencies / combined-criteria endpoints per facility in the largest states (target: under 20 ms)."""
+    dashboard = _quiet_import_dashboard()
+    if not dashboard.similarity_index and not dashboard.deficiency_profile_index:
+        print("Similarity indexes are empty; nothing to benchmark")
+        return
+    _report("build_similarity_index", _time_call(dashboard.build_similarity_index, repeat))
+    _report("build_deficiency_profile_index", _time_call(dashboard.build_deficiency_profile_index, repeat))
+    _report("build_combined_peer_table", _time_call(dashboard.build_combined_peer_table, repeat))
+    client = dashboard.app.test_client()
+    largest = sorted(dashboard.facility_directory, key=lambda code: len(dashboard.facility_directory[code]), reverse=True)[:3]
+    for code in largest:
+        facilities = dashboard.facility_directory[code]
+        facilities = facilities.sample(min(sample, len(facilities)), random_state=0).to_dict(orient="records")
+        for label, url in (("similar-characteristics", f"/api/similar-characteristics-interval/{code}"),
+                           ("similar-deficiencies", f"/api/similar-deficiencies-interval/{code}"),
+                           ("similar-deficiencies national", f"/api/similar-deficiencies-interval/{code}?scope=national"),
+                           ("combined-criteria (peer table)", f"/api/combined-criteria-2year-interval/{code}"),
+                           ("combined-criteria (custom weights)", f"/api/combined-criteria-2year-interval/{code}?distance=0.5")):
+            def similar():
+                for facility in facilities:
+                    client.post(url, json=facility)
+
+            median = _report(f"{label} {code}", _time_call(similar, repeat))
+            print(f"Per request: {median / len(facilities) * 1000:.2f} ms")
+
+
+def bench_forecast(repeat: int, sample: int) -> None:
+    """Per-facility cost of POST /api/ml-forecast (one CCN per call, with and without mode=quantiles) versus /api/ml-forecast/batch."""
+    dashboard = _quiet_import_dashboard()
+    history = dashboard.survey_history
+    if not history or not history['positions']:
+        print("Survey history is empty; nothing to benchmark")
+        return
+    _report("build_survey_history", _time_call(dashboard.build_survey_history, repeat))
+    _report("build_gap_ecdf_table", _time_call(dashboard.build_gap_ecdf_table, repeat))
+    client = dashboard.app.test_client()
+    ccns = sorted(history['positions'])
+    picks = pd.Series(ccns).sample(min(sample, len(ccns)), random_state=0).tolist()
+
+    def one_at_a_time():
+        for ccn in picks:
+            client.post("/api/ml-forecast", json={"ccn": ccn})
+
+    def batch():
+        client.post("/api/ml-forecast/batch", json={"ccns": ccns}).get_json()
+
+    def quantiles():
+        for ccn in picks:
+            client.post("/api/ml-forecast", json={"ccn": ccn, "mode": "quantiles"})
+
+    single_median = _report(f"ml-forecast x {len(picks)}", _time_call(one_at_a_time, repeat)) / len(picks)
+    _report(f"ml-forecast (quantiles) x {len(picks)}", _time_call(quantiles, repeat))
+    batch_median = _report(f"ml-forecast/batch ({len(ccns)} CCNs)", _time_call(batch, repeat)) / len(ccns)
+    print(f"Per facility: single {single_median * 1e6:.0f} us, batch {batch_median * 1e6:.1f} us ({single_median / max(batch_median, 1e-12):.0f}x)")
+
+
+def _peak_alloc_kb(fn: Callable) -> float:
+    # Peak bytes allocated (Python objects and NumPy buffers) while fn runs
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(sample: int) -> None:
+    """tracemalloc peak per request for the deficiency endpoints, next to the cost of one full deficiencies_data.copy()."""
+    dashboard = _quiet_import_dashboard()
+    if dashboard.deficiencies_data is None:
+        print("Deficiency data is not loaded; nothing to benchmark")
+        return
+    full_copy_kb = _peak_alloc_kb(lambda: dashboard.deficiencies_data.copy())
+    print(f"{'deficiencies_data.copy() (old per-request baseline)':<60} peak {full_copy_kb / 1024:8.1f} MB")
+
+    client = dashboard.app.test_client()
+    states = sorted(dashboard.facility_directory, key=lambda code: len(dashboard.facility_directory[code]), reverse=True)[:max(1, sample // 50)]
+    for state in states:
+        facility = dashboard.facility_directory[state].iloc[0]
+        ccn = facility.get("CMS Certification Number (CCN)") or ""
+        county = facility.get("County/Parish") or ""
+        zip_code = facility.get("ZIP Code") or ""
+        urls = [
+            f"/api/deficiencies/{state}/0?ccn={ccn}",
+            f"/api/zip-monthly-surveys/{state}/{zip_code}",
+            f"/api/county-monthly-surveys/{state}/{county}",
+            f"/api/state-facility-surveys/{state}",
+            f"/api/state-deficiency-trends/{state}",
+            f"/api/county-deficiency-trends/{state}/{county}",
+        ]
+        for url in urls:
+            with contextlib.redirect_stdout(io.StringIO()):
+                client.get(url)  # warm up imports and lazily built pandas internals
+            # Measure the computation, not a response-cache hit
+            with dashboard.response_cache_lock:
+                dashboard.response_cache.clear()
+            peak_kb = _peak_alloc_kb(lambda: client.get(url))
+            print(f"{url[:60]:<60} peak {peak_kb / 1024:8.1f} MB  ({peak_kb / max(full_copy_kb, 1e-9):.1%} of a full copy)")
+
+
+def _proc_memory_kb(pid: int) -> tuple[int, int]:
+    # (RSS, PSS) in kB; PSS splits shared pages between the processes mapping them
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0]] = int(parts[1])
+    return values["Rss:"], values["Pss:"]
+
+
+def _child_pids(pid: int) -> list[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # Field 4 is the parent pid; the command name (field 2) may contain spaces
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return sorted(children)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _measure_gunicorn(workers: int, shared: bool, warm_requests: int, boot_timeout: float) -> Optional[tuple[int, int, int, int]]:
+    """Start gunicorn from the current (data) directory; returns (master RSS, mean worker RSS, mean worker PSS, total PSS) in kB."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    port = _free_port()
+    env = dict(os.environ, ATHENA_SHARED_DATA="1" if shared else "0")
+    cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(repo_dir, "gunicorn.conf.py"), "--pythonpath", repo_dir,
+           "-w", str(workers), "-b", f"127.0.0.1:{port}", "--timeout", str(int(boot_timeout)), "Dashboard:app"]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + boot_timeout
+        booted = False
+        while time.monotonic() < deadline and proc.poll() is None:
+            try:
+                if len(_child_pids(proc.pid)) == workers:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/test", timeout=boot_timeout).read()
+                    booted = True
+                    break
+            except OSError:
+                pass
+            time.sleep(0.5)
+        if not booted:
+            print(f"gunicorn with {workers} workers did not come up within {boot_timeout:.0f}s")
+            return None
+        # Touch the data from every worker so copy-on-write pages that requests dirty are counted
+        states = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/api/states").read()).get("states", [])[:3]
+        for _ in range(warm_requests):
+            for state in states:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/api/facilities/{state}").read()
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/api/state-facility-surveys/{state}").read()
+        worker_pids = _child_pids(proc.pid)
+        memory = [_proc_memory_kb(pid) for pid in worker_pids]
+        master_rss, master_pss = _proc_memory_kb(proc.pid)
+        return (master_rss, int(statistics.mean(m[0] for m in memory)), int(statistics.mean(m[1] for m in memory)),
+                master_pss + sum(m[1] for m in memory))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def bench_workers(worker_counts: list[int], warm_requests: int, boot_timeout: float) -> None:
+    """Memory per gunicorn worker with one load per worker versus the data loaded once in the master and shared."""
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("RSS/PSS measurement needs Linux /proc/<pid>/smaps_rollup")
+        return
+    print(f"{'workers':>7}  {'mode':<11} {'master RSS':>11} {'worker RSS':>11} {'worker PSS':>11} {'total PSS':>11}")
+    for workers in worker_counts:
+        for shared in (False, True):
+            result = _measure_gunicorn(workers, shared, warm_requests, boot_timeout)
+            if result is None:
+                continue
+            master_rss, worker_rss, worker_pss, total_pss = result
+            print(f"{workers:>7}  {'shared' if shared else 'per-worker':<11} {master_rss / 1024:>8.0f} MB {worker_rss / 1024:>8.0f} MB "
+                  f"{worker_pss / 1024:>8.0f} MB {total_pss / 1024:>8.0f} MB")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks for the Athena dashboard data layer. Run from the directory holding the data files.")
+    parser.add_argument("benchmark", choices=["startup", "lookups", "timelines", "facilities", "nearby", "similar", "forecast", "workers", "memory"], help="Which benchmark to run")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed repetitions")
+    parser.add_argument("--sample", type=int, default=200, help="Number of CCNs (or states) to sample")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="gunicorn worker counts for the workers benchmark")
+    parser.add_argument("--boot-timeout", type=float, default=300, help="Seconds to wait for gunicorn to load the data (workers benchmark)")
+    args = parser.parse_args(argv)
+
+    if args.benchmark == "startup":
+        bench_startup(args.repeat)
+    elif args.benchmark == "lookups":
+        bench_lookups(args.repeat, args.sample)
+    elif args.benchmark == "timelines":
+        bench_timelines(args.repeat, args.sample)
+    elif args.benchmark == "facilities":
+        bench_facilities(args.repeat)
+    elif args.benchmark == "nearby":
+        bench_nearby(args.repeat, args.sample)
+    elif args.benchmark == "similar":
+        bench_similar(args.repeat, args.sample)
+    elif args.benchmark == "forecast":
+        bench_forecast(args.repeat, args.sample)
+    elif args.benchmark == "workers":
+        bench_workers(args.workers, args.repeat, args.boot_timeout)
+    elif args.benchmark == "memory":
+        bench_memory(args.sample)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,20 @@
+"""gunicorn settings for the Athena dashboard (read automatically when gunicorn starts in this directory).
+
+Dashboard.py loads all three datasets and builds its lookup indexes at import time. With ATHENA_SHARED_DATA
+on (the default) that import happens once in the gunicorn master, before the workers are forked, so every
+worker shares the same copy of the data copy-on-write instead of parsing and holding its own.
+Set ATHENA_SHARED_DATA=0 to go back to one independent load per worker.
+Worker count comes from WEB_CONCURRENCY or -w as usual.
+"""
+import gc
+import os
+
+preload_app = os.getenv('ATHENA_SHARED_DATA', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def when_ready(server):
+    if preload_app:
+        # Move everything allocated while loading into the permanent generation, so the cyclic GC in the
+        # workers never walks (and thereby un-shares) the pages holding the frames and indexes
+        gc.freeze()
+        server.log.info("Data loaded in the master (pid %s); workers will share it copy-on-write", os.getpid())
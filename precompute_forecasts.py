@@ -0,0 +1,32 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import Optional
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute the ml_forecast of every CCN for the loaded data and save it next to the data snapshot. "
+                                                 "Run from the directory holding the data files (e.g. nightly, after the CMS files are refreshed).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes to fit the forecast chunks on")
+    args = parser.parse_args(argv)
+
+    # Load the data without building (or loading) the table at import; this job builds it
+    os.environ['ATHENA_FORECASTS'] = 'off'
+    with contextlib.redirect_stdout(io.StringIO()):
+        import Dashboard
+    if not Dashboard.survey_history:
+        print("No survey data loaded; nothing to forecast", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    Dashboard.build_forecast_table(args.workers)
+    Dashboard.write_forecast_table()
+    print(f"Dataset version {Dashboard.forecast_table['dataset_version']}, {len(Dashboard.forecast_table['positions'])} facilities "
+          f"in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())